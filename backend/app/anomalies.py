@@ -0,0 +1,159 @@
+# app/anomalies.py
+import math
+import os
+from datetime import date, timedelta
+from dotenv import load_dotenv
+from app.model import Alert, Severity
+
+load_dotenv()
+
+# EWMA weight of each new day; ~1/alpha days of memory
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.1"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4"))
+# Days folded into a series before it may be flagged
+ANOMALY_WARMUP_DAYS = int(os.getenv("ANOMALY_WARMUP_DAYS", "7"))
+# Ignore spikes smaller than this in absolute terms ($ or credits per day)
+ANOMALY_MIN_DELTA = float(os.getenv("ANOMALY_MIN_DELTA", "5"))
+# A spike this many times the usual level is critical
+ANOMALY_CRITICAL_RATIO = float(os.getenv("ANOMALY_CRITICAL_RATIO", "5"))
+# Anomalies on days older than this no longer raise alerts
+ANOMALY_ALERT_DAYS = int(os.getenv("ANOMALY_ALERT_DAYS", "2"))
+# Std floor as a fraction of the mean, so near-constant series are not hair-triggered
+MIN_STD_FRACTION = 0.1
+
+# Series are "<kind>:<name>", e.g. "aws:EC2", "tool:Tavily"
+SERIES_LABELS = {
+    "aws": "AWS {} spend",
+    "tool": "{} credit burn",
+    "usage": "{} usage",
+    "spend": "{} spend",
+}
+
+
+def _std(state: dict) -> float:
+    return max(math.sqrt(state["var"]), MIN_STD_FRACTION * abs(state["mean"]), 1e-9)
+
+
+def _fold(state: dict, value: float):
+    """EWMA mean/variance update; spikes are clipped so one outlier cannot mask the next."""
+    if state["n"] == 0:
+        state["mean"], state["var"] = value, 0.0
+    else:
+        if state["n"] >= ANOMALY_WARMUP_DAYS:
+            value = min(value, state["mean"] + ANOMALY_Z_THRESHOLD * _std(state))
+        diff = value - state["mean"]
+        incr = ANOMALY_ALPHA * diff
+        state["mean"] += incr
+        state["var"] = (1 - ANOMALY_ALPHA) * (state["var"] + diff * incr)
+    state["n"] += 1
+
+
+def _score(state: dict):
+    """z-score of the pending day against the folded history (upward spikes only)."""
+    value = state["pending_value"]
+    if state["n"] < ANOMALY_WARMUP_DAYS:
+        state["score"], state["is_anomaly"] = None, False
+        return
+    z = (value - state["mean"]) / _std(state)
+    state["score"] = z
+    state["is_anomaly"] = z >= ANOMALY_Z_THRESHOLD and value - state["mean"] >= ANOMALY_MIN_DELTA
+
+
+def _step(state: dict, day: date, value: float):
+    """
+    The latest day stays pending (it may be partial or revised) and is only folded
+    into the mean/variance once a later day arrives. Older days are ignored.
+    """
+    if state["pending_day"] is not None:
+        if day < state["pending_day"]:
+            return
+        if day > state["pending_day"]:
+            _fold(state, state["pending_value"])
+            state["last_day"] = state["pending_day"]
+    state["pending_day"], state["pending_value"] = day, value
+    _score(state)
+
+
+def observe_many(cur, points: list[tuple[str, date, float]]) -> list[str]:
+    """
+    Feed daily points (series, day, value) from an ingestion job. O(1) state per
+    series: one read and one write per batch, no history scan.
+    Returns the series whose latest day is anomalous. The caller commits.
+    """
+    if not points:
+        return []
+    series = sorted({s for s, _, _ in points})
+    cur.execute("""
+        SELECT series, mean, var, n, last_day, pending_day, pending_value
+        FROM anomaly_state
+        WHERE series = ANY(%s)
+        FOR UPDATE
+    """, (series,))
+    states = {
+        row[0]: {
+            "mean": row[1], "var": row[2], "n": row[3], "last_day": row[4],
+            "pending_day": row[5], "pending_value": row[6],
+        }
+        for row in cur.fetchall()
+    }
+
+    for s, day, value in sorted(points):
+        state = states.setdefault(s, {
+            "mean": 0.0, "var": 0.0, "n": 0, "last_day": None,
+            "pending_day": None, "pending_value": None,
+        })
+        _step(state, day, float(value))
+
+    cur.executemany("""
+        INSERT INTO anomaly_state
+            (series, mean, var, n, last_day, pending_day, pending_value, score, is_anomaly, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, now())
+        ON CONFLICT (series) DO UPDATE SET
+            mean = EXCLUDED.mean,
+            var = EXCLUDED.var,
+            n = EXCLUDED.n,
+            last_day = EXCLUDED.last_day,
+            pending_day = EXCLUDED.pending_day,
+            pending_value = EXCLUDED.pending_value,
+            score = EXCLUDED.score,
+            is_anomaly = EXCLUDED.is_anomaly,
+            updated_at = EXCLUDED.updated_at
+    """, [
+        (s, st["mean"], st["var"], st["n"], st["last_day"], st["pending_day"],
+         st["pending_value"], st.get("score"), st.get("is_anomaly", False))
+        for s, st in states.items() if "score" in st
+    ])
+
+    flagged = [s for s, st in states.items() if st.get("is_anomaly")]
+    if flagged:
+        print(f"[Anomalies] {len(flagged)} anomalous series: {', '.join(flagged[:10])}")
+    return flagged
+
+
+def observe(cur, series: str, day: date, value: float) -> bool:
+    """Single-point form of observe_many. Returns True if the day is anomalous."""
+    return bool(observe_many(cur, [(series, day, value)]))
+
+
+def anomaly_alerts(cur, today: date | None = None) -> list[Alert]:
+    """Alerts for series whose latest day (within ANOMALY_ALERT_DAYS) is a spike."""
+    today = today or date.today()
+    cur.execute("""
+        SELECT series, pending_day, pending_value, mean, score
+        FROM anomaly_state
+        WHERE is_anomaly AND pending_day >= %s
+        ORDER BY score DESC
+    """, (today - timedelta(days=ANOMALY_ALERT_DAYS),))
+
+    alerts = []
+    for series, day, value, mean, score in cur.fetchall():
+        kind, _, name = series.partition(":")
+        label = SERIES_LABELS.get(kind, "{}").format(name)
+        ratio = value / mean if mean > 0 else math.inf
+        ratio_str = f"{ratio:.1f}×" if ratio != math.inf else "from zero"
+        alerts.append(Alert(
+            severity=Severity.CRITICAL if ratio >= ANOMALY_CRITICAL_RATIO else Severity.ALERT,
+            message=f"{label} spike on {day.isoformat()}: {value:,.2f} vs ~{mean:,.2f}/day ({ratio_str}, z={score:.1f})",
+            affected=name,
+        ))
+    return alerts
@@ -1,47 +1,65 @@
 # app/anthropic.py
-import requests
 import os
 from dotenv import load_dotenv
+from app.mocks import ANTHROPIC_MOCK_CREDITS
+from app.replay import http_get, stand_in
 
 load_dotenv()
 
 ANTHROPIC_ADMIN_KEY = os.getenv("ANTHROPIC_ADMIN_KEY")
 ANTHROPIC_ORG_ID = os.getenv("ANTHROPIC_ORG_ID")
+ANTHROPIC_API_BASE = os.getenv("ANTHROPIC_API_BASE", "https://api.anthropic.com")
+ANTHROPIC_VERSION = "2023-06-01"
 
-def get_anthropic_remaining_credits() -> float:
+def fetch_anthropic_balance(admin_key: str | None = None, org_id: str | None = None) -> float | None:
     """
     Fetch real remaining credits/balance from Anthropic Organization Billing API.
-    Requires admin key (sk-ant-admin-...) and organization ID.
-    Falls back to mock on error or missing config.
+    Anthropic credits are prepaid USD, so the balance is in dollars.
+    Requires admin key (sk-ant-admin-...) and organization ID; defaults to the .env pair.
+    Returns None on error or missing config.
     """
-    if not ANTHROPIC_ADMIN_KEY or not ANTHROPIC_ORG_ID:
-        print("[Anthropic] Missing admin key or org ID → mock 42350")
-        return 42350.0
+    admin_key = admin_key or stand_in(ANTHROPIC_ADMIN_KEY)
+    org_id = org_id or stand_in(ANTHROPIC_ORG_ID)
+    if not admin_key or not org_id:
+        print("[Anthropic] Missing admin key or org ID")
+        return None
 
     # Anthropic billing endpoint
-    url = f"https://api.anthropic.com/v1/organizations/{ANTHROPIC_ORG_ID}/billing/credits"
+    url = f"{ANTHROPIC_API_BASE}/v1/organizations/{org_id}/billing/credits"
     headers = {
-        "x-api-key": ANTHROPIC_ADMIN_KEY,
-        "anthropic-version": "2023-06-01",
+        "x-api-key": admin_key,
+        "anthropic-version": ANTHROPIC_VERSION,
         "Content-Type": "application/json"
     }
 
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = http_get("anthropic", url, secrets=(admin_key, org_id), headers=headers, timeout=10)
         print(f"[Anthropic] Status: {resp.status_code}")
         print(f"[Anthropic] Response preview: {resp.text[:300]}...")
 
         if resp.status_code == 401:
             print("[Anthropic] 401 Unauthorized - Check if you are using an Admin key (sk-ant-admin-...)")
-            return 42350.0
+            return None
 
         resp.raise_for_status()
         data = resp.json()
 
-        remaining = data.get("credits_remaining", data.get("balance", data.get("remaining", 42350.0)))
+        remaining = data.get("credits_remaining", data.get("balance", data.get("remaining")))
+        if remaining is None:
+            print("[Anthropic] No balance field in response")
+            return None
         print(f"[Anthropic] Real remaining: {remaining}")
         return float(remaining)
 
     except Exception as e:
-        print(f"[Anthropic] Error: {str(e)} → mock 42350")
-        return 42350.0
+        print(f"[Anthropic] Error: {str(e)}")
+        return None
+
+
+def get_anthropic_remaining_credits() -> float:
+    """Same as fetch_anthropic_balance, falling back to mock on error or missing config."""
+    remaining = fetch_anthropic_balance()
+    if remaining is None:
+        print(f"[Anthropic] → mock {ANTHROPIC_MOCK_CREDITS:.0f}")
+        return ANTHROPIC_MOCK_CREDITS
+    return remaining
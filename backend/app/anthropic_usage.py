@@ -0,0 +1,213 @@
+# app/anthropic_usage.py
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from dotenv import load_dotenv
+from app.anomalies import observe_many
+from app.anthropic import ANTHROPIC_API_BASE, ANTHROPIC_VERSION
+from app.key_inventory import load_key_inventory
+from app.model import ModelUsage
+from app.replay import http_get
+
+load_dotenv()
+
+# First run backfills this many days; later runs re-read the last few days,
+# since the current (and sometimes previous) day is still filling in.
+ANTHROPIC_REPORT_BACKFILL_DAYS = int(os.getenv("ANTHROPIC_REPORT_BACKFILL_DAYS", "30"))
+ANTHROPIC_REPORT_REFETCH_DAYS = int(os.getenv("ANTHROPIC_REPORT_REFETCH_DAYS", "2"))
+REPORT_PAGE_LIMIT = 31  # max daily buckets per page for bucket_width=1d
+
+
+def _iso(day: date) -> str:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _get_report_pages(admin_key: str, path: str, params: list[tuple[str, str]]) -> list[dict]:
+    """Follow next_page until has_more is false; returns all daily buckets."""
+    url = f"{ANTHROPIC_API_BASE}{path}"
+    headers = {"x-api-key": admin_key, "anthropic-version": ANTHROPIC_VERSION}
+    buckets = []
+    page = None
+    while True:
+        page_params = params + ([("page", page)] if page else [])
+        resp = http_get("anthropic", url, secrets=(admin_key,), headers=headers, params=page_params, timeout=15)
+        resp.raise_for_status()
+        body = resp.json()
+        buckets.extend(body.get("data", []))
+        if not body.get("has_more") or not body.get("next_page"):
+            return buckets
+        page = body["next_page"]
+
+
+def fetch_usage_report(admin_key: str, start: date, end: date) -> list[dict]:
+    """
+    Daily token counts per model and workspace for [start, end) from
+    /v1/organizations/usage_report/messages.
+    """
+    buckets = _get_report_pages(admin_key, "/v1/organizations/usage_report/messages", [
+        ("starting_at", _iso(start)),
+        ("ending_at", _iso(end)),
+        ("bucket_width", "1d"),
+        ("group_by[]", "model"),
+        ("group_by[]", "workspace_id"),
+        ("limit", str(REPORT_PAGE_LIMIT)),
+    ])
+
+    rows: dict[tuple, dict] = {}
+    for bucket in buckets:
+        day = date.fromisoformat(bucket["starting_at"][:10])
+        for r in bucket.get("results", []):
+            key = (day, r.get("model") or "", r.get("workspace_id") or "")
+            row = rows.setdefault(key, {
+                "date": day, "model": key[1], "workspace_id": key[2],
+                "uncached_input_tokens": 0, "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 0, "output_tokens": 0,
+            })
+            cache_creation = r.get("cache_creation") or {}
+            row["uncached_input_tokens"] += int(r.get("uncached_input_tokens") or 0)
+            row["cache_creation_input_tokens"] += sum(int(v or 0) for v in cache_creation.values())
+            row["cache_read_input_tokens"] += int(r.get("cache_read_input_tokens") or 0)
+            row["output_tokens"] += int(r.get("output_tokens") or 0)
+    return list(rows.values())
+
+
+def fetch_cost_report(admin_key: str, start: date, end: date) -> list[dict]:
+    """
+    Daily USD cost per workspace and line item for [start, end) from
+    /v1/organizations/cost_report. Amounts come back in cents.
+    """
+    buckets = _get_report_pages(admin_key, "/v1/organizations/cost_report", [
+        ("starting_at", _iso(start)),
+        ("ending_at", _iso(end)),
+        ("group_by[]", "workspace_id"),
+        ("group_by[]", "description"),
+        ("limit", str(REPORT_PAGE_LIMIT)),
+    ])
+
+    rows: dict[tuple, dict] = {}
+    for bucket in buckets:
+        day = date.fromisoformat(bucket["starting_at"][:10])
+        for r in bucket.get("results", []):
+            key = (day, r.get("workspace_id") or "", r.get("description") or "")
+            row = rows.setdefault(key, {
+                "date": day, "workspace_id": key[1], "description": key[2],
+                "model": r.get("model") or "", "cost_usd": 0.0,
+            })
+            row["cost_usd"] += float(r.get("amount") or 0) / 100
+    return list(rows.values())
+
+
+def _ingest_start(cur, key_id: str, today: date) -> date:
+    cur.execute("SELECT MAX(date) FROM anthropic_cost_daily WHERE key_id = %s", (key_id,))
+    last = cur.fetchone()[0]
+    if last is None:
+        return today - timedelta(days=ANTHROPIC_REPORT_BACKFILL_DAYS)
+    return min(last, today) - timedelta(days=ANTHROPIC_REPORT_REFETCH_DAYS - 1)
+
+
+def store_reports(cur, key_id: str, start: date, end: date, usage: list[dict], costs: list[dict]):
+    """Replace [start, end) for this key so revised days never double count."""
+    cur.execute(
+        "DELETE FROM anthropic_usage_daily WHERE key_id = %s AND date >= %s AND date < %s",
+        (key_id, start, end),
+    )
+    cur.execute(
+        "DELETE FROM anthropic_cost_daily WHERE key_id = %s AND date >= %s AND date < %s",
+        (key_id, start, end),
+    )
+    for r in usage:
+        cur.execute("""
+            INSERT INTO anthropic_usage_daily (
+                key_id, date, model, workspace_id, uncached_input_tokens,
+                cache_creation_input_tokens, cache_read_input_tokens, output_tokens
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (
+            key_id, r["date"], r["model"], r["workspace_id"], r["uncached_input_tokens"],
+            r["cache_creation_input_tokens"], r["cache_read_input_tokens"], r["output_tokens"]
+        ))
+    for r in costs:
+        cur.execute("""
+            INSERT INTO anthropic_cost_daily (key_id, date, workspace_id, description, model, cost_usd)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (key_id, r["date"], r["workspace_id"], r["description"], r["model"], r["cost_usd"]))
+
+
+def ingest_anthropic_reports(cur) -> dict[str, int]:
+    """
+    Incrementally pull usage and cost reports for every Anthropic admin key
+    in the inventory. Returns {key_id: rows_written}. The caller commits.
+    """
+    today = datetime.now(timezone.utc).date()
+    end = today + timedelta(days=1)
+    written = {}
+    earliest = today
+    for key in load_key_inventory()["anthropic"]:
+        start = _ingest_start(cur, key.id, today)
+        usage = fetch_usage_report(key.api_key, start, end)
+        costs = fetch_cost_report(key.api_key, start, end)
+        store_reports(cur, key.id, start, end, usage, costs)
+        written[key.id] = len(usage) + len(costs)
+        earliest = min(earliest, start)
+        print(f"[Anthropic Usage] {key.id}: {start} → {today}, {len(usage)} usage / {len(costs)} cost rows")
+
+    # Org-wide daily spend feeds the anomaly detector (only the refreshed days)
+    cur.execute("""
+        SELECT date, SUM(cost_usd)
+        FROM anthropic_cost_daily
+        WHERE date >= %s
+        GROUP BY date
+    """, (earliest,))
+    observe_many(cur, [("spend:Anthropic", day, float(total)) for day, total in cur.fetchall()])
+    return written
+
+
+def anthropic_daily_spend(cur, days: int = 7) -> float | None:
+    """
+    Average USD per day over the last `days` complete days, or None without data.
+    Averages over the days that have reports, so a new org is not diluted by
+    days before ingestion started. Anthropic's credit balance is prepaid USD,
+    so this is also the balance's burn per day.
+    """
+    today = datetime.now(timezone.utc).date()
+    cur.execute("""
+        SELECT SUM(cost_usd), COUNT(DISTINCT date)
+        FROM anthropic_cost_daily
+        WHERE date >= %s AND date < %s
+    """, (today - timedelta(days=days), today))
+    total, reported_days = cur.fetchone()
+    if not reported_days:
+        return None
+    return float(total or 0) / min(reported_days, days)
+
+
+def anthropic_usage_summary(cur, days: int = 30) -> list[ModelUsage]:
+    """Tokens and cost per model over the last `days` days, most expensive first."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    cur.execute("""
+        WITH tokens AS (
+            SELECT model,
+                   SUM(uncached_input_tokens + cache_creation_input_tokens + cache_read_input_tokens) AS input_tokens,
+                   SUM(output_tokens) AS output_tokens
+            FROM anthropic_usage_daily
+            WHERE date >= %s
+            GROUP BY model
+        ), costs AS (
+            SELECT model, SUM(cost_usd) AS cost_usd
+            FROM anthropic_cost_daily
+            WHERE date >= %s
+            GROUP BY model
+        )
+        SELECT COALESCE(t.model, c.model), COALESCE(t.input_tokens, 0),
+               COALESCE(t.output_tokens, 0), COALESCE(c.cost_usd, 0)
+        FROM tokens t
+        FULL OUTER JOIN costs c ON c.model = t.model
+        ORDER BY 4 DESC
+    """, (since, since))
+    return [
+        ModelUsage(
+            model=model or "(other)",
+            input_tokens=int(inp),
+            output_tokens=int(out),
+            cost_usd=round(float(cost), 4),
+        )
+        for model, inp, out, cost in cur.fetchall()
+    ]
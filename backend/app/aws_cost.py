@@ -1,59 +1,43 @@
 # app/aws_cost.py
-import boto3
 from datetime import datetime, timedelta
-import os
-from dotenv import load_dotenv
+from app.cost_query import query_costs
+from app.mocks import mock_aws_spend
+from app.model import AwsSpend, ServiceSpend
 
-load_dotenv()
 
-AWS_REGION = os.getenv("AWS_REGION", "ap-south-1")  # your region, change if needed
-
-def fetch_real_aws_spend(days: int = 30) -> dict:
+def fetch_real_aws_spend(days: int = 30) -> AwsSpend:
     """
     Fetch real AWS cost and usage (last 'days' period, grouped by service).
-    Returns {
-        "monthly_spend": float,
-        "services": [{"service": str, "amount": float}]
-    }
-    Falls back to mock on error.
+    Returns AwsSpend with one ServiceSpend per service (daily results summed).
+    Served through the cost query planner, so only days missing from the local
+    cache hit Cost Explorer. Falls back to mock on error.
     """
     try:
-        client = boto3.client('ce', region_name=AWS_REGION)
-
         end = datetime.utcnow().date()
         start = end - timedelta(days=days)
 
-        response = client.get_cost_and_usage(
-            TimePeriod={'Start': start.isoformat(), 'End': end.isoformat()},
-            Granularity='DAILY',  # or 'MONTHLY' if preferred
-            Metrics=['AmortizedCost'],
-            GroupBy=[{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
+        result = query_costs(
+            [{'Type': 'DIMENSION', 'Key': 'SERVICE'}],
+            granularity='MONTHLY',
+            start=start,
+            end=end
         )
 
-        services = []
+        per_service: dict[str, float] = {}
         total_spend = 0.0
 
-        for result in response['ResultsByTime']:
-            for group in result['Groups']:
-                service = group['Keys'][0].replace('AWS::', '')  # clean name
-                amount = float(group['Metrics']['AmortizedCost']['Amount'])
-                services.append({"service": service, "amount": amount})
-                total_spend += amount
+        for period in result.periods:
+            for group in period.groups:
+                service = group.keys[0].replace('AWS::', '')  # clean name
+                per_service[service] = per_service.get(service, 0.0) + group.amount
+                total_spend += group.amount
 
         print(f"[AWS Cost Explorer] Fetched real spend: ${total_spend:.2f} over {days} days")
-        return {
-            "monthly_spend": total_spend,
-            "services": services
-        }
+        return AwsSpend(
+            monthly_spend=total_spend,
+            services=[ServiceSpend(service=s, amount=a) for s, a in per_service.items()]
+        )
 
     except Exception as e:
         print(f"[AWS Cost Explorer] Error: {str(e)} - falling back to mock")
-        # Fallback mock (your original values)
-        return {
-            "monthly_spend": 14100.0,
-            "services": [
-                {"service": "EC2", "amount": 8200.0},
-                {"service": "RDS", "amount": 4500.0},
-                {"service": "Other", "amount": 1400.0}
-            ]
-        }
\ No newline at end of file
+        return mock_aws_spend()
\ No newline at end of file
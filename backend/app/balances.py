@@ -0,0 +1,198 @@
+# app/balances.py
+import os
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from app.anomalies import observe
+from app.anthropic import ANTHROPIC_MOCK_CREDITS
+from app.collector import PROVIDER_TOOLS, collect_balances, collect_provider_total, provider_totals, store_key_balances
+from app.fullenrich import FULLENRICH_MOCK_CREDITS
+from app.tavily import TAVILY_MOCK_CREDITS
+
+load_dotenv()
+
+# Adaptive polling: the next poll is due after a fraction of the time the tool
+# has left, clamped between the min and max interval.
+BALANCE_MIN_POLL_MINUTES = int(os.getenv("BALANCE_MIN_POLL_MINUTES", "5"))
+BALANCE_MAX_POLL_MINUTES = int(os.getenv("BALANCE_MAX_POLL_MINUTES", "360"))
+BALANCE_POLL_FRACTION = float(os.getenv("BALANCE_POLL_FRACTION", "0.02"))
+# Until a burn rate is known, poll at this interval to collect observations
+BALANCE_WARMUP_POLL_MINUTES = int(os.getenv("BALANCE_WARMUP_POLL_MINUTES", "30"))
+# Unchanged balances are only re-stored this often, so idle tools cost ~1 row/day
+BALANCE_HEARTBEAT_HOURS = int(os.getenv("BALANCE_HEARTBEAT_HOURS", "24"))
+BURN_WINDOW_HOURS = int(os.getenv("BURN_WINDOW_HOURS", "72"))
+BURN_MIN_SPAN_HOURS = 1.0
+
+# tool name → (provider in the key inventory, mock used when nothing was ever observed)
+TOOL_FETCHERS = {
+    "Tavily": ("tavily", TAVILY_MOCK_CREDITS),
+    "FullEnrich": ("fullenrich", FULLENRICH_MOCK_CREDITS),
+    "Anthropic": ("anthropic", ANTHROPIC_MOCK_CREDITS),
+}
+
+
+def record_observation(cur, tool_name: str, credits: float, now: datetime) -> bool:
+    """
+    Store a balance observation unless it equals the previous one and the
+    heartbeat has not elapsed. Returns True when a row was written.
+    """
+    cur.execute("""
+        SELECT credits_remaining, observed_at
+        FROM balance_observations
+        WHERE tool_name = %s
+        ORDER BY observed_at DESC
+        LIMIT 1
+    """, (tool_name,))
+    last = cur.fetchone()
+    if last is not None:
+        last_credits, last_at = last
+        if float(last_credits) == credits and now - last_at < timedelta(hours=BALANCE_HEARTBEAT_HOURS):
+            return False
+
+    cur.execute("""
+        INSERT INTO balance_observations (tool_name, observed_at, credits_remaining)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (tool_name, observed_at) DO NOTHING
+    """, (tool_name, now, credits))
+    return True
+
+
+def observed_burn_rate(cur, tool_name: str, now: datetime) -> float | None:
+    """
+    Credits consumed per day over the last BURN_WINDOW_HOURS, from consecutive
+    observations. Increases (top-ups) and steps at a key set change are ignored.
+    None until enough history exists.
+    """
+    cur.execute("""
+        SELECT
+            SUM(CASE WHEN rebaseline THEN 0 ELSE GREATEST(prev_credits - credits_remaining, 0) END),
+            MIN(observed_at)
+        FROM (
+            SELECT
+                credits_remaining,
+                observed_at,
+                LAG(credits_remaining) OVER (ORDER BY observed_at) AS prev_credits,
+                rebaseline
+            FROM balance_observations
+            WHERE tool_name = %s AND observed_at >= %s
+        ) deltas
+    """, (tool_name, now - timedelta(hours=BURN_WINDOW_HOURS)))
+    consumed, first_at = cur.fetchone()
+    if first_at is None:
+        return None
+
+    # Unchanged polls are not stored, so the span runs up to this poll
+    span_hours = (now - first_at).total_seconds() / 3600
+    if span_hours < BURN_MIN_SPAN_HOURS:
+        return None
+    return float(consumed or 0) / (span_hours / 24)
+
+
+def daily_consumption(cur, tool_name: str, now: datetime) -> float:
+    """Credits consumed so far on `now`'s UTC day, counting from the last observation before it."""
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    cur.execute("""
+        SELECT COALESCE(SUM(CASE WHEN rebaseline THEN 0 ELSE GREATEST(prev_credits - credits_remaining, 0) END), 0)
+        FROM (
+            SELECT
+                credits_remaining,
+                observed_at,
+                LAG(credits_remaining) OVER (ORDER BY observed_at) AS prev_credits,
+                rebaseline
+            FROM balance_observations
+            WHERE tool_name = %s AND observed_at >= COALESCE(
+                (SELECT MAX(observed_at) FROM balance_observations
+                 WHERE tool_name = %s AND observed_at < %s),
+                %s
+            )
+        ) deltas
+        WHERE observed_at >= %s
+    """, (tool_name, tool_name, day_start, day_start, day_start))
+    return float(cur.fetchone()[0])
+
+
+def next_poll_interval(credits: float, burn_per_day: float | None) -> timedelta:
+    """Poll often when close to exhaustion or burning fast, rarely when idle."""
+    if burn_per_day is None:
+        minutes = BALANCE_WARMUP_POLL_MINUTES
+    elif burn_per_day <= 0:
+        minutes = BALANCE_MAX_POLL_MINUTES
+    else:
+        minutes_left = max(credits, 0) / burn_per_day * 24 * 60
+        minutes = minutes_left * BALANCE_POLL_FRACTION
+    minutes = min(max(minutes, BALANCE_MIN_POLL_MINUTES), BALANCE_MAX_POLL_MINUTES)
+    return timedelta(minutes=minutes)
+
+
+def store_poll(cur, tool_name: str, credits: float, now: datetime | None = None) -> float | None:
+    """Record a fresh balance, reschedule the next poll and return the burn rate."""
+    now = now or datetime.now(timezone.utc)
+    if record_observation(cur, tool_name, credits, now):
+        observe(cur, f"tool:{tool_name}", now.date(), daily_consumption(cur, tool_name, now))
+    burn = observed_burn_rate(cur, tool_name, now)
+    next_poll_at = now + next_poll_interval(credits, burn)
+
+    cur.execute("""
+        INSERT INTO balance_poll_state (tool_name, last_credits, burn_rate_per_day, last_polled_at, next_poll_at)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (tool_name) DO UPDATE SET
+            last_credits = EXCLUDED.last_credits,
+            burn_rate_per_day = EXCLUDED.burn_rate_per_day,
+            last_polled_at = EXCLUDED.last_polled_at,
+            next_poll_at = EXCLUDED.next_poll_at
+    """, (tool_name, credits, burn, now, next_poll_at))
+
+    burn_str = f"{burn:.1f}/day" if burn is not None else "unknown"
+    print(f"[Balances] {tool_name}: {credits:.0f} left, burn {burn_str}, next poll {next_poll_at:%H:%M} UTC")
+    return burn
+
+
+def get_tracked_balance(cur, tool_name: str, force: bool = False) -> tuple[float, float | None]:
+    """
+    Current balance (summed over all of the tool's keys) and observed burn rate
+    (credits/day) for a tool.
+
+    Only calls the vendor API when the adaptive schedule says a poll is due;
+    otherwise the last observation is returned. The caller commits.
+    """
+    provider, mock_credits = TOOL_FETCHERS[tool_name]
+    now = datetime.now(timezone.utc)
+
+    cur.execute("""
+        SELECT last_credits, burn_rate_per_day, next_poll_at
+        FROM balance_poll_state
+        WHERE tool_name = %s
+    """, (tool_name,))
+    state = cur.fetchone()
+    if state is not None and not force and now < state[2]:
+        last_credits, burn, _ = state
+        return float(last_credits), (float(burn) if burn is not None else None)
+
+    credits = collect_provider_total(cur, provider)
+    if credits is None:
+        # Upstream unavailable: keep serving the last known value, retry soon
+        retry_at = now + timedelta(minutes=BALANCE_MIN_POLL_MINUTES)
+        if state is None:
+            return mock_credits, None
+        cur.execute(
+            "UPDATE balance_poll_state SET next_poll_at = %s WHERE tool_name = %s",
+            (retry_at, tool_name),
+        )
+        last_credits, burn, _ = state
+        return float(last_credits), (float(burn) if burn is not None else None)
+
+    return credits, store_poll(cur, tool_name, credits, now)
+
+
+def refresh_all_balances(cur) -> dict[str, float]:
+    """
+    Poll every key of every provider in one concurrent sweep (hourly job),
+    store per-key rows and record the per-tool totals. The caller commits.
+    """
+    results = collect_balances()
+    store_key_balances(cur, results)
+
+    answered = {r.provider for r in results if r.error is None}
+    totals = provider_totals(cur, sorted(answered))
+    for provider, total in totals.items():
+        store_poll(cur, PROVIDER_TOOLS[provider], total)
+    return {PROVIDER_TOOLS[p]: total for p, total in totals.items()}
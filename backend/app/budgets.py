@@ -0,0 +1,181 @@
+# app/budgets.py
+import calendar
+import os
+from datetime import date, timedelta
+from typing import Literal
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field, model_validator
+from app.cost_query import CE_SETTLE_DAYS, query_costs
+from app.model import BudgetStatus
+
+load_dotenv()
+
+# Implicit account-wide budget, used until an "account" budget row exists
+AWS_MONTHLY_BUDGET = float(os.getenv("AWS_MONTHLY_BUDGET", "12000"))
+DEFAULT_WARN_PERCENT = 90.0
+# Before this day of the month a partial month says too little to project from
+BUDGET_PACE_MIN_DAYS = int(os.getenv("BUDGET_PACE_MIN_DAYS", "5"))
+
+
+class BudgetIn(BaseModel):
+    """
+    scope/target: account (no target), service ("Amazon Elastic Compute Cloud - Compute"),
+    tag ("team=growth") or tool ("Tavily", budget in credits).
+    """
+    name: str = Field(..., min_length=1, max_length=100)
+    scope: Literal["account", "service", "tag", "tool"]
+    target: str = Field("", max_length=255)
+    monthly_amount: float = Field(..., gt=0)
+    warn_percent: float = Field(DEFAULT_WARN_PERCENT, gt=0, le=100)
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if self.scope == "account":
+            self.target = ""
+        elif not self.target:
+            raise ValueError(f"{self.scope} budgets need a target")
+        elif self.scope == "tag" and "=" not in self.target:
+            raise ValueError("tag budget targets look like key=value")
+        return self
+
+
+def upsert_budget(cur, budget: BudgetIn) -> int:
+    """One budget per (scope, target); returns its id. The caller commits."""
+    cur.execute("""
+        INSERT INTO budgets (name, scope, target, monthly_amount, warn_percent, active)
+        VALUES (%s, %s, %s, %s, %s, TRUE)
+        ON CONFLICT (scope, target) DO UPDATE SET
+            name = EXCLUDED.name,
+            monthly_amount = EXCLUDED.monthly_amount,
+            warn_percent = EXCLUDED.warn_percent,
+            active = TRUE
+        RETURNING id
+    """, (budget.name, budget.scope, budget.target, budget.monthly_amount, budget.warn_percent))
+    return cur.fetchone()[0]
+
+
+def evaluate_budgets(cur, today: date | None = None) -> list[BudgetStatus]:
+    """
+    Month-to-date actuals, pacing and projection for every active budget, in one
+    aggregate query over the month rollups and daily tag spend.
+    """
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    next_month = month_start + timedelta(days=days_in_month)
+
+    cur.execute("""
+        WITH b AS (
+            SELECT id, name, scope, target, monthly_amount::float8 AS amount, warn_percent
+            FROM budgets
+            WHERE active
+            UNION ALL
+            SELECT NULL, 'AWS account', 'account', '', %(default_amount)s, %(default_warn)s
+            WHERE NOT EXISTS (SELECT 1 FROM budgets WHERE active AND scope = 'account')
+        ), svc AS (
+            SELECT service, SUM(amount) AS amount
+            FROM aws_spend_rollup
+            WHERE period = 'month' AND period_start = %(month)s
+            GROUP BY service
+        ), tag AS (
+            SELECT tag_key, tag_value, SUM(amount) AS amount
+            FROM aws_tag_spend
+            WHERE date >= %(month)s AND date < %(next)s
+            GROUP BY tag_key, tag_value
+        ), tool AS (
+            SELECT tool_name, credits_consumed
+            FROM usage_rollup
+            WHERE period = 'month' AND period_start = %(month)s
+        )
+        SELECT b.id, b.name, b.scope, b.target, b.amount, b.warn_percent,
+               COALESCE(CASE b.scope
+                   WHEN 'account' THEN (SELECT SUM(amount) FROM svc)
+                   WHEN 'service' THEN svc.amount
+                   WHEN 'tag' THEN tag.amount
+                   WHEN 'tool' THEN tool.credits_consumed
+               END, 0)::float8
+        FROM b
+        LEFT JOIN svc ON b.scope = 'service' AND svc.service = b.target
+        LEFT JOIN tag ON b.scope = 'tag'
+            AND tag.tag_key = split_part(b.target, '=', 1)
+            AND tag.tag_value = substr(b.target, strpos(b.target, '=') + 1)
+        LEFT JOIN tool ON b.scope = 'tool' AND tool.tool_name = b.target
+        ORDER BY b.scope, b.name
+    """, {
+        "default_amount": AWS_MONTHLY_BUDGET,
+        "default_warn": DEFAULT_WARN_PERCENT,
+        "month": month_start,
+        "next": next_month,
+    })
+
+    # Spend rows include today's partial day, so today counts as elapsed
+    elapsed = today.day / days_in_month
+    statuses = []
+    for budget_id, name, scope, target, amount, warn_percent, spent in cur.fetchall():
+        projected = spent / elapsed
+        # amount 0 means no budget is configured (e.g. AWS_MONTHLY_BUDGET=0): report spend only
+        percent_used = spent / amount * 100 if amount > 0 else 0.0
+        expected = amount * elapsed
+        if amount <= 0:
+            status = "ok"
+        elif spent >= amount:
+            status = "exceeded"
+        elif today.day >= BUDGET_PACE_MIN_DAYS and projected > amount:
+            status = "over_pace"
+        elif percent_used >= warn_percent:
+            status = "warning"
+        else:
+            status = "ok"
+        statuses.append(BudgetStatus(
+            id=budget_id,
+            name=name,
+            scope=scope,
+            target=target,
+            unit="credits" if scope == "tool" else "USD",
+            monthly_amount=round(amount, 2),
+            spent=round(spent, 2),
+            percent_used=round(percent_used, 1),
+            expected_to_date=round(expected, 2),
+            pace=round(spent / expected, 2) if expected else 0.0,
+            projected_month_end=round(projected, 2),
+            status=status
+        ))
+    return statuses
+
+
+def account_budget(statuses: list[BudgetStatus]) -> BudgetStatus:
+    """The account-wide budget (always present, see evaluate_budgets)."""
+    return next(s for s in statuses if s.scope == "account")
+
+
+def refresh_tag_spend(cur, today: date | None = None) -> int:
+    """
+    Daily spend per tag value for the tag keys that have budgets, via the cached
+    Cost Explorer planner. Re-reads the settling days of the previous month too.
+    Returns the number of rows written. The caller commits.
+    """
+    today = today or date.today()
+    start = min(today.replace(day=1), today - timedelta(days=CE_SETTLE_DAYS))
+    end = today + timedelta(days=1)
+
+    cur.execute("SELECT DISTINCT split_part(target, '=', 1) FROM budgets WHERE active AND scope = 'tag'")
+    tag_keys = [row[0] for row in cur.fetchall()]
+
+    written = 0
+    for key in tag_keys:
+        result = query_costs([{"Type": "TAG", "Key": key}], "DAILY", start, end, cur=cur)
+        cur.execute(
+            "DELETE FROM aws_tag_spend WHERE tag_key = %s AND date >= %s AND date < %s",
+            (key, start, end),
+        )
+        for period in result.periods:
+            for group in period.groups:
+                # Cost Explorer tag group keys look like "team$growth" ("team$" = untagged)
+                value = group.keys[0].partition("$")[2]
+                cur.execute("""
+                    INSERT INTO aws_tag_spend (date, tag_key, tag_value, amount)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (date, tag_key, tag_value) DO UPDATE SET amount = aws_tag_spend.amount + EXCLUDED.amount
+                """, (date.fromisoformat(period.period), key, value, group.amount))
+                written += 1
+    return written
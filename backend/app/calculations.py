@@ -1,6 +1,7 @@
 # app/calculations.py
 
 from datetime import date, timedelta
+from app.model import Alert, BudgetStatus, Severity, Status, ToolBalance, sort_alerts
 
 def calculate_exhaustion_date(credits_left: float, daily_usage: float) -> str | None:
     """
@@ -16,7 +17,7 @@ def calculate_exhaustion_date(credits_left: float, daily_usage: float) -> str |
     return exhaustion_date.isoformat()  # returns string like '2026-02-21'
 
 
-def calculate_risk_status(percent_remaining: float) -> str:
+def calculate_risk_status(percent_remaining: float) -> Status:
     """
     PRD risk logic:
     >30% → safe
@@ -24,71 +25,89 @@ def calculate_risk_status(percent_remaining: float) -> str:
     <10% → critical
     """
     if percent_remaining > 30:
-        return "safe"
+        return Status.SAFE
     elif percent_remaining > 10:
-        return "warning"
+        return Status.WARNING
     else:
-        return "critical"
+        return Status.CRITICAL
 
 
 # app/calculations.py
 # ... keep your existing calculate_exhaustion_date and calculate_risk_status ...
 
-def generate_alerts(tools: list[dict], aws: dict) -> list[dict]:
+def generate_alerts(
+    tools: list[ToolBalance],
+    anomalies: list[Alert] | None = None,
+    budgets: list[BudgetStatus] | None = None
+) -> list[Alert]:
     """
-    Generate list of active alerts based on PRD rules.
-    Returns list of alert dicts: {"type": "warning/critical", "message": "...", "affected": "..."}
+    Generate list of active alerts based on PRD rules, plus any spend/usage
+    anomalies (see anomalies.anomaly_alerts) and budget pacing (see budgets.evaluate_budgets).
+    Returns list of Alert structs, most severe first.
     """
     alerts = []
+    today = date.today()
 
     # Tool credit alerts
     for tool in tools:
-        percent = tool["percent_remaining"]
-        exhaustion_str = tool.get("predicted_exhaustion")
+        percent = tool.percent_remaining
+        exhaustion_str = tool.predicted_exhaustion
 
         # <20% warning, <10% critical (already in status, but explicit alert)
         if percent < 10:
-            alerts.append({
-                "type": "critical",
-                "message": f"{tool['name']} credits critically low (<10% remaining)",
-                "affected": tool["name"],
-                "severity": "critical"
-            })
+            alerts.append(Alert(
+                severity=Severity.CRITICAL,
+                message=f"{tool.name} credits critically low (<10% remaining)",
+                affected=tool.name,
+            ))
         elif percent < 20:
-            alerts.append({
-                "type": "warning",
-                "message": f"{tool['name']} credits low (<20% remaining)",
-                "affected": tool["name"],
-                "severity": "warning"
-            })
+            alerts.append(Alert(
+                severity=Severity.WARNING,
+                message=f"{tool.name} credits low (<20% remaining)",
+                affected=tool.name,
+            ))
 
         # Exhaustion <5 days
         if exhaustion_str:
             try:
                 exhaustion_date = date.fromisoformat(exhaustion_str)
-                days_left = (exhaustion_date - date.today()).days
+                days_left = (exhaustion_date - today).days
                 if days_left <= 5 and days_left >= 0:
-                    alerts.append({
-                        "type": "alert",
-                        "message": f"{tool['name']} predicted to exhaust in {days_left} days",
-                        "affected": tool["name"],
-                        "severity": "alert"
-                    })
-            except:
+                    alerts.append(Alert(
+                        severity=Severity.ALERT,
+                        message=f"{tool.name} predicted to exhaust in {days_left} days",
+                        affected=tool.name,
+                    ))
+            except ValueError:
                 pass  # skip invalid dates
 
-    # AWS budget alert
-    aws_percent = aws["percent_used"]
-    if aws_percent > 90:
-        alerts.append({
-            "type": "alert",
-            "message": f"AWS budget exceeded 90% ({aws_percent:.1f}%)",
-            "affected": "AWS",
-            "severity": "alert"
-        })
+    # Budgets: exceeded → critical, projected past the budget → alert, past warn % → warning
+    for budget in budgets or []:
+        def fmt(value: float) -> str:
+            return f"${value:,.2f}" if budget.unit == "USD" else f"{value:,.0f} credits"
 
-    # Sort by severity (critical first)
-    severity_order = {"critical": 0, "alert": 1, "warning": 2}
-    alerts.sort(key=lambda a: severity_order.get(a["severity"], 99))
+        if budget.status == "exceeded":
+            alerts.append(Alert(
+                severity=Severity.CRITICAL,
+                message=f"Budget '{budget.name}' exceeded: {fmt(budget.spent)} ({budget.percent_used:.1f}%)",
+                affected=budget.target or "AWS",
+            ))
+        elif budget.status == "over_pace":
+            alerts.append(Alert(
+                severity=Severity.ALERT,
+                message=f"Budget '{budget.name}' on pace for {fmt(budget.projected_month_end)} "
+                        f"of {fmt(budget.monthly_amount)} this month ({budget.pace:.2f}× expected)",
+                affected=budget.target or "AWS",
+            ))
+        elif budget.status == "warning":
+            alerts.append(Alert(
+                severity=Severity.WARNING,
+                message=f"Budget '{budget.name}' at {budget.percent_used:.1f}% ({fmt(budget.spent)})",
+                affected=budget.target or "AWS",
+            ))
+
+    if anomalies:
+        alerts.extend(anomalies)
 
-    return alerts
\ No newline at end of file
+    # Sort by severity (critical first)
+    return sort_alerts(alerts)
@@ -0,0 +1,150 @@
+# app/collector.py
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from app.anthropic import fetch_anthropic_balance
+from app.fullenrich import fetch_fullenrich_balance
+from app.key_inventory import PROVIDERS, ProviderKey, load_key_inventory
+from app.model import KeyBalance
+from app.ratelimit import TokenBucket
+from app.tavily import fetch_tavily_balance
+
+load_dotenv()
+
+# Requests per second allowed per vendor (bursts up to one second's worth)
+VENDOR_RATE_LIMITS = {
+    "tavily": float(os.getenv("TAVILY_RATE_LIMIT", "10")),
+    "fullenrich": float(os.getenv("FULLENRICH_RATE_LIMIT", "5")),
+    "anthropic": float(os.getenv("ANTHROPIC_RATE_LIMIT", "5")),
+}
+COLLECTOR_MAX_WORKERS = int(os.getenv("COLLECTOR_MAX_WORKERS", "32"))
+
+PROVIDER_TOOLS = {
+    "tavily": "Tavily",
+    "fullenrich": "FullEnrich",
+    "anthropic": "Anthropic",
+}
+
+# Shared across calls so back-to-back refreshes still respect vendor limits
+_buckets = {provider: TokenBucket(rate) for provider, rate in VENDOR_RATE_LIMITS.items()}
+
+
+def _fetch(provider: str, key: ProviderKey) -> float | None:
+    if provider == "tavily":
+        return fetch_tavily_balance(key.api_key)
+    if provider == "fullenrich":
+        return fetch_fullenrich_balance(key.api_key)
+    return fetch_anthropic_balance(key.api_key, key.org_id)
+
+
+def _collect_one(provider: str, key: ProviderKey) -> KeyBalance:
+    _buckets[provider].acquire()
+    started = time.perf_counter()
+    error = None
+    try:
+        credits = _fetch(provider, key)
+        if credits is None:
+            error = "fetch failed"
+    except Exception as e:
+        credits, error = None, str(e)
+    return KeyBalance(
+        provider=provider,
+        key_id=key.id,
+        team=key.team,
+        credits_remaining=credits,
+        error=error,
+        duration_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+
+
+def collect_balances(providers: list[str] | None = None) -> list[KeyBalance]:
+    """
+    Fetch every configured key of the given providers concurrently.
+    Wall time is roughly the slowest few calls, bounded by the vendor rate limits.
+    """
+    inventory = load_key_inventory()
+    jobs = [
+        (provider, key)
+        for provider in (providers or PROVIDERS)
+        for key in inventory.get(provider, [])
+    ]
+    if not jobs:
+        return []
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(COLLECTOR_MAX_WORKERS, len(jobs))) as pool:
+        results = list(pool.map(lambda job: _collect_one(*job), jobs))
+
+    failed = sum(1 for r in results if r.error)
+    print(f"[Collector] {len(results)} keys in {time.perf_counter() - started:.2f}s ({failed} failed)")
+    return results
+
+
+def store_key_balances(cur, results: list[KeyBalance], providers: list[str] | None = None):
+    """
+    Persist per-key results; a failing key keeps its last good balance. Rows of
+    keys no longer in the inventory of `providers` are dropped, so a removed key
+    stops counting towards its provider's total.
+
+    When a provider's key set changes, its new total is recorded as a rebaseline
+    observation, so the step is not counted as consumption by the burn rate.
+    """
+    inventory = load_key_inventory()
+    changed = set()
+    for provider in providers or PROVIDERS:
+        cur.execute(
+            "DELETE FROM provider_key_balances WHERE provider = %s AND NOT key_id = ANY(%s) RETURNING key_id",
+            (provider, [key.id for key in inventory.get(provider, [])]),
+        )
+        if cur.fetchall():
+            changed.add(provider)
+    for r in results:
+        # xmax = 0 only for freshly inserted rows, i.e. a key seen for the first time
+        cur.execute("""
+            INSERT INTO provider_key_balances
+                (provider, key_id, team, credits_remaining, error, fetched_at, duration_ms)
+            VALUES (%s, %s, %s, %s, %s, now(), %s)
+            ON CONFLICT (provider, key_id) DO UPDATE SET
+                team = EXCLUDED.team,
+                credits_remaining = COALESCE(EXCLUDED.credits_remaining, provider_key_balances.credits_remaining),
+                error = EXCLUDED.error,
+                fetched_at = CASE WHEN EXCLUDED.error IS NULL THEN EXCLUDED.fetched_at
+                                  ELSE provider_key_balances.fetched_at END,
+                duration_ms = EXCLUDED.duration_ms
+            RETURNING xmax = 0
+        """, (r.provider, r.key_id, r.team, r.credits_remaining, r.error, r.duration_ms))
+        if cur.fetchone()[0] and r.credits_remaining is not None:
+            changed.add(r.provider)
+
+    for provider, total in provider_totals(cur, sorted(changed)).items():
+        cur.execute("""
+            INSERT INTO balance_observations (tool_name, observed_at, credits_remaining, rebaseline)
+            VALUES (%s, now(), %s, TRUE)
+            ON CONFLICT (tool_name, observed_at) DO UPDATE SET
+                credits_remaining = EXCLUDED.credits_remaining,
+                rebaseline = TRUE
+        """, (PROVIDER_TOOLS[provider], total))
+
+
+def provider_totals(cur, providers: list[str]) -> dict[str, float]:
+    """Sum of the latest known balance of every key, per provider."""
+    cur.execute("""
+        SELECT provider, SUM(credits_remaining)
+        FROM provider_key_balances
+        WHERE provider = ANY(%s) AND credits_remaining IS NOT NULL
+        GROUP BY provider
+    """, (providers,))
+    return {provider: float(total) for provider, total in cur.fetchall()}
+
+
+def collect_provider_total(cur, provider: str) -> float | None:
+    """
+    Refresh all keys of one provider and return the summed balance,
+    or None when no key answered.
+    """
+    results = collect_balances([provider])
+    store_key_balances(cur, results, [provider])
+    if not any(r.error is None for r in results):
+        return None
+    return provider_totals(cur, [provider]).get(provider)
@@ -0,0 +1,399 @@
+# app/cost_query.py
+import hashlib
+import json
+import msgspec
+import os
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+from app.database import get_db_connection
+from app.model import CostForecast, CostForecastPeriod, CostGroup, CostPeriod, CostQueryResult, encode_json
+from app.replay import ce_client
+
+load_dotenv()
+
+AWS_REGION = os.getenv("AWS_REGION", "ap-south-1")
+
+CE_METRIC = "AmortizedCost"
+CE_FORECAST_METRIC = "AMORTIZED_COST"
+# Cost Explorer keeps revising the most recent days, so those are re-fetched
+# once they are older than CE_REFRESH_HOURS. Older days are final.
+CE_SETTLE_DAYS = int(os.getenv("CE_SETTLE_DAYS", "3"))
+CE_REFRESH_HOURS = int(os.getenv("CE_REFRESH_HOURS", "6"))
+CE_FORECAST_TTL_HOURS = int(os.getenv("CE_FORECAST_TTL_HOURS", "12"))
+CE_MAX_HISTORY_DAYS = 400  # DAILY data is only available for ~14 months
+
+CE_DIMENSIONS = {
+    "SERVICE", "USAGE_TYPE", "USAGE_TYPE_GROUP", "REGION", "AZ", "LINKED_ACCOUNT",
+    "OPERATION", "INSTANCE_TYPE", "INSTANCE_TYPE_FAMILY", "PURCHASE_TYPE", "RECORD_TYPE",
+}
+
+
+def parse_group_by(items: list[str]) -> list[dict]:
+    """
+    Turn ["SERVICE", "tag:team"] into Cost Explorer GroupBy entries.
+    Cost Explorer allows at most two groupings per request.
+    """
+    group_by = []
+    for item in items:
+        if item.lower().startswith("tag:"):
+            key = item[4:]
+            if not key:
+                raise ValueError(f"Empty tag key in group_by '{item}'")
+            group_by.append({"Type": "TAG", "Key": key})
+        elif item.upper() in CE_DIMENSIONS:
+            group_by.append({"Type": "DIMENSION", "Key": item.upper()})
+        else:
+            raise ValueError(f"Unsupported group_by '{item}'")
+
+    if len(group_by) > 2:
+        raise ValueError("Cost Explorer supports at most 2 group_by values")
+    if len({(g["Type"], g["Key"]) for g in group_by}) != len(group_by):
+        raise ValueError("Duplicate group_by values")
+    return group_by
+
+
+def parse_filters(items: list[str]) -> dict | None:
+    """
+    Turn ["SERVICE:Amazon Relational Database Service", "tag:team:growth"] into a
+    Cost Explorer Filter expression. Values for the same key are OR-ed, keys are AND-ed.
+    """
+    values: dict[tuple[str, str], list[str]] = {}
+    for item in items:
+        if item.lower().startswith("tag:"):
+            key, sep, value = item[4:].partition(":")
+            kind = "TAG"
+        else:
+            key, sep, value = item.partition(":")
+            key = key.upper()
+            kind = "DIMENSION"
+            if key not in CE_DIMENSIONS:
+                raise ValueError(f"Unsupported filter dimension '{key}'")
+        if not sep or not key:
+            raise ValueError(f"Filter '{item}' must look like KEY:value or tag:key:value")
+        values.setdefault((kind, key), []).append(value)
+
+    expressions = []
+    for (kind, key), vals in sorted(values.items()):
+        field = "Dimensions" if kind == "DIMENSION" else "Tags"
+        expressions.append({field: {"Key": key, "Values": sorted(set(vals))}})
+
+    if not expressions:
+        return None
+    if len(expressions) == 1:
+        return expressions[0]
+    return {"And": expressions}
+
+
+def _hash(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def _canonical(group_by: list[dict]) -> list[dict]:
+    return sorted(group_by, key=lambda g: (g["Type"], g["Key"]))
+
+
+def _day_ranges(days: list[date]) -> list[tuple[date, date]]:
+    """Collapse sorted days into [start, end) ranges of consecutive days."""
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] == day:
+            ranges[-1] = (ranges[-1][0], day + timedelta(days=1))
+        else:
+            ranges.append((day, day + timedelta(days=1)))
+    return ranges
+
+
+def _fetch_daily_costs(client, start: date, end: date, group_by: list[dict], ce_filter: dict | None) -> tuple[dict, int]:
+    """
+    Fetch DAILY costs from Cost Explorer for [start, end).
+    Returns ({day: {group_keys: amount}}, number_of_paid_requests).
+    """
+    params = {
+        "TimePeriod": {"Start": start.isoformat(), "End": end.isoformat()},
+        "Granularity": "DAILY",
+        "Metrics": [CE_METRIC],
+    }
+    if group_by:
+        params["GroupBy"] = group_by
+    if ce_filter:
+        params["Filter"] = ce_filter
+
+    daily: dict[date, dict[tuple, float]] = {}
+    calls = 0
+    while True:
+        response = client.get_cost_and_usage(**params)
+        calls += 1
+        for result in response["ResultsByTime"]:
+            day = date.fromisoformat(result["TimePeriod"]["Start"])
+            groups = daily.setdefault(day, {})
+            if group_by:
+                for group in result["Groups"]:
+                    keys = tuple(group["Keys"])
+                    groups[keys] = groups.get(keys, 0.0) + float(group["Metrics"][CE_METRIC]["Amount"])
+            else:
+                groups[()] = float(result["Total"][CE_METRIC]["Amount"])
+        token = response.get("NextPageToken")
+        if not token:
+            break
+        params["NextPageToken"] = token
+
+    return daily, calls
+
+
+def query_costs(
+    group_by: list[dict],
+    granularity: str = "DAILY",
+    start: date | None = None,
+    end: date | None = None,
+    ce_filter: dict | None = None,
+    cur=None,
+) -> CostQueryResult:
+    """
+    Answer a cost query (end exclusive) from the local daily cache. Runs on its own
+    connection, or on `cur` when given (the caller commits).
+
+    Days already cached for this grouping - or for a finer grouping with the same
+    filter, which is summed down - are served locally. Only the remaining days are
+    requested from Cost Explorer, one call per contiguous range.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=30)
+    if start >= end:
+        raise ValueError("start must be before end")
+    if (date.today() - start).days > CE_MAX_HISTORY_DAYS:
+        raise ValueError(f"Daily cost data only goes back {CE_MAX_HISTORY_DAYS} days")
+
+    canonical = _canonical(group_by)
+    filter_key = _hash(ce_filter)
+    query_key = _hash({"group_by": canonical, "filter": ce_filter, "metric": CE_METRIC})
+    wanted = [(g["Type"], g["Key"]) for g in group_by]
+
+    now = datetime.now(timezone.utc)
+    settled_before = date.today() - timedelta(days=CE_SETTLE_DAYS)
+    refreshed_after = now - timedelta(hours=CE_REFRESH_HOURS)
+
+    own_conn = None
+    if cur is None:
+        own_conn = get_db_connection()
+        cur = own_conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO aws_cost_queries (query_key, filter_key, group_by, filter)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (query_key) DO NOTHING
+        """, (query_key, filter_key, json.dumps(canonical), json.dumps(ce_filter)))
+        # Concurrent requests for the same query wait here and then find the days
+        # the first one fetched, instead of fetching (and inserting) them again
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('aws_cost_cache'), hashtext(%s))", (query_key,))
+
+        # Every cached grouping with the same filter that includes all requested dimensions
+        cur.execute("SELECT query_key, group_by FROM aws_cost_queries WHERE filter_key = %s", (filter_key,))
+        sources = {}
+        for key, cached_group_by in cur.fetchall():
+            dims = [(g["Type"], g["Key"]) for g in cached_group_by]
+            if set(wanted) <= set(dims):
+                sources[key] = [dims.index(w) for w in wanted]
+
+        cur.execute("""
+            SELECT query_key, day
+            FROM aws_cost_coverage
+            WHERE query_key = ANY(%s) AND day >= %s AND day < %s
+              AND (day < %s OR fetched_at > %s)
+        """, (list(sources), start, end, settled_before, refreshed_after))
+        covered: dict[date, set[str]] = {}
+        for key, day in cur.fetchall():
+            covered.setdefault(day, set()).add(key)
+
+        # Pick a source per day, preferring the exact grouping (no re-aggregation)
+        plan: dict[str, list[date]] = {}
+        missing = []
+        day = start
+        while day < end:
+            keys = covered.get(day)
+            if not keys:
+                missing.append(day)
+            else:
+                source = query_key if query_key in keys else min(keys)
+                plan.setdefault(source, []).append(day)
+            day += timedelta(days=1)
+
+        ce_calls = 0
+        if missing:
+            client = ce_client(AWS_REGION)
+            for range_start, range_end in _day_ranges(missing):
+                daily, calls = _fetch_daily_costs(client, range_start, range_end, canonical, ce_filter)
+                ce_calls += calls
+                fetched_days = []
+                d = range_start
+                while d < range_end:
+                    fetched_days.append(d)
+                    d += timedelta(days=1)
+                # Replace the range wholesale so groups that dropped to zero disappear
+                cur.execute("""
+                    DELETE FROM aws_cost_cache
+                    WHERE query_key = %s AND day >= %s AND day < %s
+                """, (query_key, range_start, range_end))
+                for d, groups in daily.items():
+                    for keys, amount in groups.items():
+                        cur.execute("""
+                            INSERT INTO aws_cost_cache (query_key, day, group_keys, amount)
+                            VALUES (%s, %s, %s, %s)
+                            ON CONFLICT (query_key, day, group_keys) DO UPDATE SET amount = EXCLUDED.amount
+                        """, (query_key, d, list(keys), amount))
+                for d in fetched_days:
+                    cur.execute("""
+                        INSERT INTO aws_cost_coverage (query_key, day, fetched_at)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (query_key, day) DO UPDATE SET fetched_at = EXCLUDED.fetched_at
+                    """, (query_key, d, now))
+                plan.setdefault(query_key, []).extend(fetched_days)
+            print(f"[CostQuery] {len(missing)} uncovered days → {ce_calls} Cost Explorer calls")
+        if own_conn is not None:
+            own_conn.commit()
+
+        # Read everything back and project each source's keys onto the requested grouping
+        totals: dict[date, dict[tuple, float]] = {}
+        for source, days in plan.items():
+            positions = sources.get(source, list(range(len(wanted))))
+            cur.execute("""
+                SELECT day, group_keys, amount
+                FROM aws_cost_cache
+                WHERE query_key = %s AND day = ANY(%s)
+            """, (source, days))
+            for d, keys, amount in cur.fetchall():
+                period = d if granularity == "DAILY" else d.replace(day=1)
+                projected = tuple(keys[i] for i in positions)
+                groups = totals.setdefault(period, {})
+                groups[projected] = groups.get(projected, 0.0) + float(amount)
+    except Exception:
+        if own_conn is not None:
+            own_conn.rollback()
+        raise
+    finally:
+        if own_conn is not None:
+            cur.close()
+            own_conn.close()
+
+    periods = []
+    grand_total = 0.0
+    for period in sorted(totals):
+        groups = [
+            CostGroup(keys=list(keys), amount=round(amount, 4))
+            for keys, amount in sorted(totals[period].items(), key=lambda kv: -kv[1])
+        ]
+        period_total = sum(g.amount for g in groups)
+        grand_total += period_total
+        periods.append(CostPeriod(period=period.isoformat(), total=round(period_total, 4), groups=groups))
+
+    return CostQueryResult(
+        start=start.isoformat(),
+        end=end.isoformat(),
+        granularity=granularity,
+        group_by=[f"tag:{g['Key']}" if g["Type"] == "TAG" else g["Key"] for g in group_by],
+        total=round(grand_total, 4),
+        periods=periods,
+        ce_calls=ce_calls,
+        cached_days=(end - start).days - len(missing),
+    )
+
+
+def get_forecast(
+    start: date | None = None,
+    end: date | None = None,
+    granularity: str = "DAILY",
+    ce_filter: dict | None = None,
+) -> CostForecast:
+    """
+    Cost Explorer get_cost_forecast for [start, end), cached for CE_FORECAST_TTL_HOURS.
+    Defaults to the rest of the current month.
+    """
+    today = date.today()
+    start = max(start or today, today)
+    if end is None:
+        end = (today.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if start >= end:
+        raise ValueError("Forecast end must be after start (and after today)")
+
+    forecast_key = _hash({
+        "start": start.isoformat(), "end": end.isoformat(),
+        "granularity": granularity, "filter": ce_filter,
+    })
+    fresh_after = datetime.now(timezone.utc) - timedelta(hours=CE_FORECAST_TTL_HOURS)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT payload FROM aws_cost_forecast_cache
+            WHERE forecast_key = %s AND fetched_at > %s
+        """, (forecast_key, fresh_after))
+        row = cur.fetchone()
+        if row:
+            return msgspec.convert(row[0], CostForecast)
+
+        client = ce_client(AWS_REGION)
+        params = {
+            "TimePeriod": {"Start": start.isoformat(), "End": end.isoformat()},
+            "Metric": CE_FORECAST_METRIC,
+            "Granularity": granularity,
+            "PredictionIntervalLevel": 80,
+        }
+        if ce_filter:
+            params["Filter"] = ce_filter
+        response = client.get_cost_forecast(**params)
+
+        periods = [
+            CostForecastPeriod(
+                period=r["TimePeriod"]["Start"],
+                mean=float(r["MeanValue"]),
+                lower=float(r.get("PredictionIntervalLowerBound", r["MeanValue"])),
+                upper=float(r.get("PredictionIntervalUpperBound", r["MeanValue"])),
+            )
+            for r in response["ForecastResultsByTime"]
+        ]
+        forecast = CostForecast(
+            start=start.isoformat(),
+            end=end.isoformat(),
+            granularity=granularity,
+            total=float(response["Total"]["Amount"]),
+            lower=sum(p.lower for p in periods),
+            upper=sum(p.upper for p in periods),
+            periods=periods,
+        )
+
+        cur.execute("""
+            INSERT INTO aws_cost_forecast_cache (forecast_key, fetched_at, payload)
+            VALUES (%s, now(), %s)
+            ON CONFLICT (forecast_key) DO UPDATE SET
+                fetched_at = EXCLUDED.fetched_at,
+                payload = EXCLUDED.payload
+        """, (forecast_key, encode_json(forecast).decode()))
+        conn.commit()
+        print(f"[CostQuery] Forecast {start} → {end}: ${forecast.total:.2f}")
+        return forecast
+    finally:
+        cur.close()
+        conn.close()
+
+
+def predict_budget_breach(monthly_budget: float) -> tuple[float, str | None]:
+    """
+    Combine month-to-date actuals with AWS's daily forecast for the rest of the month.
+    Returns (forecasted month-end spend, first day the budget is exceeded or None).
+    """
+    today = date.today()
+    month_start = today.replace(day=1)
+    spent = 0.0
+    if today > month_start:
+        spent = query_costs([], "MONTHLY", month_start, today).total
+    if spent > monthly_budget:
+        return spent, today.isoformat()
+
+    breach = None
+    running = spent
+    forecast = get_forecast(today, granularity="DAILY")
+    for period in forecast.periods:
+        running += period.mean
+        if breach is None and running > monthly_budget:
+            breach = period.period
+    return round(running, 2), breach
@@ -0,0 +1,245 @@
+# app/dashboard.py
+import os
+import msgspec
+from datetime import date, timedelta
+from dotenv import load_dotenv
+from app.anomalies import anomaly_alerts
+from app.anthropic_usage import anthropic_daily_spend
+from app.aws_cost import fetch_real_aws_spend
+from app.balances import TOOL_FETCHERS, get_tracked_balance
+from app.budgets import account_budget, evaluate_budgets
+from app.calculations import calculate_exhaustion_date, calculate_risk_status, generate_alerts
+from app.cost_query import predict_budget_breach
+from app.database import get_db_connection, read_cursor, write_cursor
+from app.model import Alert, AwsSummary, DashboardSnapshot, DateRange, Severity, ToolBalance, encode_json
+from app.posthog import get_real_daily_credit_usage
+from app.profiling import stage
+from app.shared_cache import cache_get, cache_put, wait_for
+from app.snapshots import SNAPSHOT_DAYS, record_snapshot
+from app.work_queue import DISTRIBUTED_MODE, enqueue
+
+load_dotenv()
+
+# Distributed mode: how long a worker-computed dashboard counts as fresh, and how
+# long a request waits for the first one before giving up
+DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "60"))
+DASHBOARD_WAIT_SECONDS = float(os.getenv("DASHBOARD_WAIT_SECONDS", "10"))
+
+
+class DashboardUnavailable(Exception):
+    """No worker produced the dashboard in time (distributed mode)."""
+
+
+def send_alert_email_simulation(alerts: list[Alert]):
+    critical_alerts = [a for a in alerts if a.severity is Severity.CRITICAL]
+    if not critical_alerts:
+        return
+
+    subject = f"CRITICAL Billing Alert - {len(critical_alerts)} Issues ({date.today().isoformat()})"
+    body_lines = [
+        "URGENT: Critical billing risks detected",
+        "----------------------------------------",
+        f"Date: {date.today().isoformat()}",
+        f"Total critical alerts: {len(critical_alerts)}",
+        "",
+    ]
+
+    for alert in critical_alerts:
+        body_lines.append(f"[{alert.severity.value.upper()}] {alert.message}")
+        body_lines.append(f" → Affected: {alert.affected}")
+        body_lines.append("")
+
+    body_lines.append("Action required immediately to avoid service disruption.")
+    body_lines.append("Dashboard: http://your-frontend-url/dashboard")
+    body_lines.append("----------------------------------------")
+
+    print("\n" + "="*60)
+    print("SIMULATED CRITICAL EMAIL / SLACK")
+    print("Subject:", subject)
+    print("\n".join(body_lines))
+    print("="*60 + "\n")
+
+
+def _tool_balance(name: str, credits: float, percent, daily: float) -> ToolBalance:
+    return ToolBalance(
+        name=name,
+        credits_remaining=credits,  # ← this line saves the real value
+        percent_remaining=float(percent or 0),
+        daily_avg_usage=round(daily, 2),
+        predicted_exhaustion=calculate_exhaustion_date(credits, daily),
+        status=calculate_risk_status(float(percent or 0))
+    )
+
+
+def stored_alerts(cur) -> list[Alert]:
+    """
+    The dashboard's alerts from what the ingestion jobs stored (balance polls,
+    usage_history, budgets over the aws_spend rollups, anomaly state). No vendor,
+    PostHog or Cost Explorer calls, so the hourly job can run it on its own cursor.
+    """
+    cur.execute("""
+        SELECT t.name, COALESCE(p.last_credits, t.credits_remaining), t.percent_remaining,
+               p.burn_rate_per_day, u.daily, t.daily_avg_usage
+        FROM tools t
+        LEFT JOIN balance_poll_state p ON p.tool_name = t.name
+        LEFT JOIN (
+            SELECT tool_name, SUM(credits_consumed) / 7 AS daily
+            FROM usage_history
+            WHERE date >= CURRENT_DATE - 7 AND date < CURRENT_DATE
+            GROUP BY tool_name
+        ) u ON u.tool_name = t.name
+        ORDER BY t.name
+    """)
+    tools_rows = cur.fetchall()
+    anthropic_spend = anthropic_daily_spend(cur)
+    anomalies = anomaly_alerts(cur)
+    budgets = evaluate_budgets(cur)
+
+    tools = []
+    for name, credits, percent, burn, usage, daily_db in tools_rows:
+        # USD/day; Anthropic's balance is prepaid USD, so it divides into credits as is
+        if name == "Anthropic" and anthropic_spend is not None:
+            burn = anthropic_spend
+        daily = next((float(v) for v in (burn, usage, daily_db) if v is not None), 0.0)
+        tools.append(_tool_balance(name, float(credits or 0), percent, daily))
+    return generate_alerts(tools, anomalies, budgets)
+
+
+def build_dashboard(days: int) -> DashboardSnapshot:
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    start_date = date.today() - timedelta(days=days - 1)
+
+    # Every tracked tool; the `days` window only applies to spend/usage aggregates
+    with stage("db"), read_cursor() as read:
+        read.execute("""
+            SELECT name, credits_remaining, percent_remaining, daily_avg_usage
+            FROM tools
+            ORDER BY name
+        """)
+        tools_rows = read.fetchall()
+        anthropic_spend = anthropic_daily_spend(read)
+        anomalies = anomaly_alerts(read)
+        budgets = evaluate_budgets(read)
+
+    with stage("posthog"):
+        real_daily_usage = get_real_daily_credit_usage(days=7)
+
+    tools = []
+    for row in tools_rows:
+        name, credits_db, percent, daily_db = row
+
+        # Real API for Tavily, FullEnrich, Anthropic (polled on an adaptive schedule)
+        burn = None
+        if name in TOOL_FETCHERS:
+            with stage(f"balance.{name.lower()}"):
+                credits, burn = get_tracked_balance(cur, name)
+        else:
+            credits = float(credits_db or 0)
+
+        # Real spend (Anthropic usage reports) or observed balance deltas beat
+        # the PostHog event-weight estimate. Anthropic spend is USD/day, the unit
+        # of its prepaid credit balance
+        if name == "Anthropic" and anthropic_spend is not None:
+            burn = anthropic_spend
+        daily = burn if burn is not None else real_daily_usage.get(name, float(daily_db or 0))
+        tools.append(_tool_balance(name, credits, percent, daily))
+
+    with stage("cost_explorer"):
+        aws_data = fetch_real_aws_spend(days=days)
+    account = account_budget(budgets)
+
+    with stage("forecast"):
+        try:
+            forecast_spend, breach = predict_budget_breach(account.monthly_amount)
+        except Exception as e:
+            print(f"[AWS Forecast] Error: {str(e)} → no forecast")
+            forecast_spend, breach = None, None
+
+    aws = AwsSummary(
+        monthly_spend=aws_data.monthly_spend,
+        monthly_budget=account.monthly_amount,
+        # The budget is per calendar month, so compare it with month-to-date spend, not the window
+        percent_used=account.percent_used,
+        services=aws_data.services,
+        filtered_days=days,
+        forecast_month_spend=forecast_spend,
+        predicted_budget_breach=breach,
+        month_to_date=account.spent
+    )
+
+    with stage("alerts"):
+        alerts = generate_alerts(tools, anomalies, budgets)
+
+    snapshot = DashboardSnapshot(
+        tools=tools,
+        aws=aws,
+        alerts=alerts,
+        alert_count=len(alerts),
+        last_updated=date.today().isoformat(),
+        filtered_days=days,
+        date_range=DateRange(
+            from_=start_date.isoformat(),
+            to=date.today().isoformat()
+        )
+    )
+
+    with stage("snapshot"):
+        if days == SNAPSHOT_DAYS:
+            # History is best effort: never lose the balance polls above over it
+            cur.execute("SAVEPOINT snapshot")
+            try:
+                record_snapshot(cur, snapshot)
+                cur.execute("RELEASE SAVEPOINT snapshot")
+            except Exception as e:
+                print(f"[Snapshots] Error: {str(e)} → not recorded")
+                cur.execute("ROLLBACK TO SAVEPOINT snapshot")
+
+        conn.commit()
+    cur.close()
+    conn.close()
+
+    return snapshot
+
+
+def dashboard_key(days: int) -> str:
+    return f"dashboard:{days}"
+
+
+def refresh_dashboard_cache(days: int) -> bool:
+    """Worker side: recompute the dashboard into the shared cache unless it is already fresh."""
+    found = cache_get(dashboard_key(days))
+    if found is not None and found[1]:
+        return False
+    snapshot = build_dashboard(days)
+    with write_cursor() as cur:
+        cache_put(cur, dashboard_key(days), encode_json(snapshot), DASHBOARD_CACHE_TTL_SECONDS)
+    return True
+
+
+def cached_dashboard(days: int) -> DashboardSnapshot:
+    """
+    The dashboard for API requests. In distributed mode replicas never call vendors:
+    they serve the shared copy (stale while a worker refreshes it) and queue one
+    refresh per key however many replicas ask.
+    """
+    if not DISTRIBUTED_MODE:
+        return build_dashboard(days)
+
+    key = dashboard_key(days)
+    with stage("shared_cache"):
+        found = cache_get(key)
+    if found is not None and found[1]:
+        return msgspec.json.decode(found[0], type=DashboardSnapshot)
+
+    with write_cursor() as cur:
+        enqueue(cur, "dashboard", {"days": days}, dedupe_key=key, priority=10)
+    if found is not None:
+        return msgspec.json.decode(found[0], type=DashboardSnapshot)
+
+    with stage("worker_wait"):
+        value = wait_for(key, DASHBOARD_WAIT_SECONDS)
+    if value is None:
+        raise DashboardUnavailable(f"dashboard for {days} days not computed yet")
+    return msgspec.json.decode(value, type=DashboardSnapshot)
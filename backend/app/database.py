@@ -1,21 +1,168 @@
 # app/database.py
-import psycopg2
+import time
+import threading
+from contextlib import contextmanager
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool, PoolTimeout
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
+# Default statement_timeout for writer connections; reads get a tighter one
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_READ_TIMEOUT_MS = int(os.getenv("DB_READ_TIMEOUT_MS", "5000"))
+
+# Optional read replica for dashboard/export reads. Unset → reads use the primary.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.getenv("DB_REPLICA_PORT", os.getenv("DB_PORT", "5432"))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "30"))
+DB_REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "15"))
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "60"))
+
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Statements run more than this many times on a pooled connection are server-side prepared
+# and reused, so the hot dashboard queries are parsed/planned once per connection.
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "1"))
+
+
 def get_db_connection():
+    # Imported here so modules that only use the psycopg3 pools (and the hourly
+    # Lambda, which ships without psycopg2) can import this one
+    import psycopg2
+
     try:
         conn = psycopg2.connect(
             host=os.getenv("DB_HOST"),
             port=os.getenv("DB_PORT", "5432"),
             dbname=os.getenv("DB_NAME", "postgres"),
             user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASSWORD")
+            password=os.getenv("DB_PASSWORD"),
+            options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
         )
         conn.autocommit = False  # we'll commit manually
         return conn
     except Exception as e:
         print(f"Database connection failed: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def conninfo(host: str | None = None, port: str | None = None, **options) -> str:
+    """psycopg3 connection string for the primary (or `host`/`port`), e.g. for pools and LISTEN."""
+    return make_conninfo(
+        host=host or os.getenv("DB_HOST"),
+        port=port or os.getenv("DB_PORT", "5432"),
+        dbname=os.getenv("DB_NAME", "postgres"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD") or "",
+        connect_timeout="5",
+        **options,
+    )
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+# Replica health is checked at most every DB_REPLICA_CHECK_SECONDS
+_replica_state = {"checked_at": 0.0, "healthy": False, "down_until": 0.0}
+
+
+def _configure(conn):
+    conn.prepare_threshold = DB_PREPARE_THRESHOLD
+
+
+def _pool(role: str) -> ConnectionPool:
+    """Lazily created pools: "replica"/"primary" are read-only, "writer" is the primary."""
+    with _pools_lock:
+        if role not in _pools:
+            if role == "replica":
+                host, port = DB_REPLICA_HOST, DB_REPLICA_PORT
+            else:
+                host, port = None, None
+            if role == "writer":
+                options = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+            else:
+                options = f"-c statement_timeout={DB_READ_TIMEOUT_MS} -c default_transaction_read_only=on"
+            _pools[role] = ConnectionPool(
+                conninfo(host, port, options=options),
+                min_size=1,
+                max_size=DB_POOL_MAX_SIZE,
+                configure=_configure,
+                name=f"billing-{role}",
+                open=True,
+            )
+        return _pools[role]
+
+
+def _replica_usable() -> bool:
+    """True if the replica is reachable and no more than DB_REPLICA_MAX_LAG_SECONDS behind."""
+    if not DB_REPLICA_HOST:
+        return False
+    now = time.monotonic()
+    if now < _replica_state["down_until"]:
+        return False
+    if now - _replica_state["checked_at"] < DB_REPLICA_CHECK_SECONDS:
+        return _replica_state["healthy"]
+
+    try:
+        with _pool("replica").connection(timeout=2) as conn:
+            # Idle primaries don't advance replay timestamps, so only count lag
+            # while WAL is actually waiting to be replayed.
+            in_recovery, lag = conn.execute("""
+                SELECT pg_is_in_recovery(),
+                       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                       END
+            """).fetchone()
+        healthy = not in_recovery or lag is None or float(lag) <= DB_REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            print(f"[DB] Replica lagging {float(lag):.0f}s → reading from primary")
+    except Exception as e:
+        print(f"[DB] Replica unavailable: {e} → reading from primary")
+        _replica_state["down_until"] = now + DB_REPLICA_RETRY_SECONDS
+        healthy = False
+
+    _replica_state["checked_at"] = now
+    _replica_state["healthy"] = healthy
+    return healthy
+
+
+@contextmanager
+def read_cursor(timeout_ms: int | None = None):
+    """
+    Read-only cursor for dashboard/export queries: the replica when it is healthy,
+    otherwise the primary. Connections are pooled, so prepared statements survive
+    across requests. `timeout_ms` overrides DB_READ_TIMEOUT_MS for this transaction.
+    """
+    role = "replica" if _replica_usable() else "primary"
+    try:
+        conn = _pool(role).getconn(timeout=5)
+    except PoolTimeout:
+        if role != "replica":
+            raise
+        print("[DB] Replica pool exhausted/unreachable → reading from primary")
+        _replica_state["down_until"] = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+        role = "primary"
+        conn = _pool(role).getconn(timeout=5)
+
+    try:
+        with conn.cursor() as cur:
+            if timeout_ms is not None:
+                cur.execute("SELECT set_config('statement_timeout', %s, true)", (str(timeout_ms),))
+            yield cur
+    finally:
+        # End the read-only transaction with COMMIT: psycopg drops its prepared
+        # statement cache on ROLLBACK. Either way the local timeout is reset.
+        if not conn.closed:
+            conn.commit()
+        _pool(role).putconn(conn)
+
+
+@contextmanager
+def write_cursor():
+    """
+    Pooled cursor on the primary for small, frequent writes (rate limits, queues).
+    Commits on success, rolls back on error.
+    """
+    with _pool("writer").connection(timeout=5) as conn:
+        with conn.cursor() as cur:
+            yield cur
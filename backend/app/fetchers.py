@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 import requests
 import os
 from dotenv import load_dotenv
+from app.mocks import TAVILY_MOCK_CREDITS
 
 load_dotenv()
 
@@ -43,7 +44,7 @@ def fetch_tavily_credits():
     api_key = os.getenv('TAVILY_API_KEY')
     if not api_key:
         print("Warning: TAVILY_API_KEY missing → using mock")
-        return 2800.0  # fallback mock
+        return TAVILY_MOCK_CREDITS
 
     url = "https://api.tavily.com/usage"
     headers = {"Authorization": f"Bearer {api_key}"}
@@ -62,7 +63,7 @@ def fetch_tavily_credits():
         return float(remaining)
     except Exception as e:
         print(f"Tavily fetch error: {e}")
-        return 2800.0  # fallback
+        return TAVILY_MOCK_CREDITS
 
 
 def get_posthog_daily_events(event_name, days=1):
@@ -1,22 +1,25 @@
 # app/fullenrich.py
-import requests
 import os
 from dotenv import load_dotenv
+from app.mocks import FULLENRICH_MOCK_CREDITS
+from app.replay import http_get, stand_in
 
 load_dotenv()
 
 FULLENRICH_API_KEY = os.getenv("FULLENRICH_API_KEY")
 FULLENRICH_USAGE_URL = os.getenv("FULLENRICH_USAGE_URL", "https://api.fullenrich.com/v1/usage")  # ← mentor must confirm this URL
 
-def get_fullenrich_remaining_credits() -> float:
-    if not FULLENRICH_API_KEY:
-        print("[FullEnrich] No API key in .env → using mock 500")
-        return 500.0
+def fetch_fullenrich_balance(api_key: str | None = None) -> float | None:
+    """Real remaining credits, or None when the key is missing or the call fails."""
+    api_key = api_key or stand_in(FULLENRICH_API_KEY)
+    if not api_key:
+        print("[FullEnrich] No API key in .env")
+        return None
 
-    headers = {"Authorization": f"Bearer {FULLENRICH_API_KEY}"}
+    headers = {"Authorization": f"Bearer {api_key}"}
 
     try:
-        resp = requests.get(FULLENRICH_USAGE_URL, headers=headers, timeout=8)
+        resp = http_get("fullenrich", FULLENRICH_USAGE_URL, secrets=(api_key,), headers=headers, timeout=8)
         print(f"[FullEnrich] Status code: {resp.status_code}")
         print(f"[FullEnrich] Response preview: {resp.text[:300]}...")
 
@@ -24,10 +27,21 @@ def get_fullenrich_remaining_credits() -> float:
         data = resp.json()
 
         # Adjust key based on actual response (mentor may need to tell you the correct field)
-        remaining = data.get("credits_remaining", data.get("balance", data.get("remaining", 500.0)))
+        remaining = data.get("credits_remaining", data.get("balance", data.get("remaining")))
+        if remaining is None:
+            print("[FullEnrich] No balance field in response")
+            return None
         print(f"[FullEnrich] Real remaining: {remaining}")
         return float(remaining)
 
     except Exception as e:
-        print(f"[FullEnrich] Error: {str(e)} → using mock 500")
-        return 500.0
\ No newline at end of file
+        print(f"[FullEnrich] Error: {str(e)}")
+        return None
+
+
+def get_fullenrich_remaining_credits() -> float:
+    remaining = fetch_fullenrich_balance()
+    if remaining is None:
+        print(f"[FullEnrich] → using mock {FULLENRICH_MOCK_CREDITS:.0f}")
+        return FULLENRICH_MOCK_CREDITS
+    return remaining
\ No newline at end of file
@@ -0,0 +1,291 @@
+# app/jobs.py
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+import msgspec
+from dotenv import load_dotenv
+from app.model import encode_json
+
+load_dotenv()
+
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "8"))
+# Stop starting stages this long before the Lambda deadline
+JOB_SAFETY_MARGIN_SECONDS = float(os.getenv("JOB_SAFETY_MARGIN_SECONDS", "20"))
+# Budget when there is no Lambda context (local runs)
+JOB_DEFAULT_BUDGET_SECONDS = float(os.getenv("JOB_DEFAULT_BUDGET_SECONDS", "600"))
+# An unfinished run older than this is abandoned instead of resumed
+JOB_RESUME_HOURS = float(os.getenv("JOB_RESUME_HOURS", "3"))
+
+RESUMABLE = ["running", "timed_out"]
+
+
+class Stage(msgspec.Struct, frozen=True):
+    """
+    One unit of a job: `run(ctx, cur)` executes in its own transaction once every
+    stage in `after` has finished (successfully or not) and returns a JSON-able dict.
+    """
+    name: str
+    run: Callable
+    after: tuple[str, ...] = ()
+
+
+class StageContext:
+    """What a running stage sees: upstream results, its saved checkpoint and the time left."""
+
+    def __init__(self, runner: "JobRunner", name: str, saved: dict | None):
+        self.runner = runner
+        self.name = name
+        # Last checkpoint of this stage in the run being resumed, if any
+        self.saved = saved
+
+    @property
+    def results(self) -> dict[str, dict]:
+        """Results of the stages that have succeeded in this run (resumed ones included)."""
+        return self.runner.results
+
+    def remaining(self) -> float:
+        """Seconds until the job stops starting new work."""
+        return self.runner.deadline - time.monotonic()
+
+    def checkpoint(self, state: dict):
+        """Persist progress right away, outside the stage's own transaction."""
+        self.runner._query(
+            "UPDATE job_stage_runs SET checkpoint = %s::jsonb WHERE run_id = %s AND stage = %s",
+            (encode_json(state).decode(), self.runner.run_id, self.name),
+        )
+
+    def leftovers(self) -> list[dict]:
+        """Checkpoints this stage left in earlier runs without succeeding afterwards."""
+        rows = self.runner._query("""
+            SELECT s.checkpoint
+            FROM job_stage_runs s
+            JOIN job_runs r ON r.id = s.run_id
+            WHERE r.job = %s AND s.stage = %s AND s.run_id <> %s
+              AND s.status <> 'succeeded' AND s.checkpoint IS NOT NULL
+              AND s.started_at > COALESCE((
+                  SELECT MAX(ok.started_at)
+                  FROM job_stage_runs ok
+                  JOIN job_runs okr ON okr.id = ok.run_id
+                  WHERE okr.job = %s AND ok.stage = %s AND ok.status = 'succeeded'
+              ), '-infinity')
+        """, (self.runner.job, self.name, self.runner.run_id, self.runner.job, self.name))
+        return [row[0] for row in rows]
+
+
+class JobRunner:
+    """
+    Runs a job's stages concurrently as their dependencies finish. Each stage
+    commits on its own connection, so one failure never rolls back the others.
+    Outcomes, timings and errors are recorded in job_runs / job_stage_runs.
+
+    A run that hit the deadline (or died) is resumed by the next invocation:
+    stages that already succeeded are skipped and their results reused.
+    """
+
+    def __init__(self, job: str, stages: list[Stage], connect: Callable, budget_seconds: float):
+        self.job = job
+        self.stages = {s.name: s for s in stages}
+        for s in stages:
+            unknown = set(s.after) - self.stages.keys()
+            if unknown:
+                raise ValueError(f"Stage {s.name} depends on unknown stages {sorted(unknown)}")
+        self.connect = connect
+        self.deadline = time.monotonic() + budget_seconds - JOB_SAFETY_MARGIN_SECONDS
+        self.run_id = None
+        self.results: dict[str, dict] = {}
+        self.statuses: dict[str, str] = {}
+        self.durations: dict[str, float] = {}
+        self._saved: dict[str, dict] = {}
+        self._control = None
+        self._lock = threading.Lock()
+
+    def _query(self, sql: str, params=()) -> list[tuple]:
+        """Autocommit statement on the shared control connection."""
+        with self._lock:
+            cur = self._control.cursor()
+            try:
+                cur.execute(sql, params)
+                return cur.fetchall() if cur.description else []
+            finally:
+                cur.close()
+
+    def _begin(self) -> bool:
+        self._control = self.connect()
+        self._control.autocommit = True
+
+        # One instance per job at a time; the lock dies with the connection
+        if not self._query("SELECT pg_try_advisory_lock(hashtext('job_runs'), hashtext(%s))", (self.job,))[0][0]:
+            return False
+
+        resumable = self._query("""
+            SELECT id FROM job_runs
+            WHERE job = %s AND status = ANY(%s) AND started_at > now() - make_interval(secs => %s)
+            ORDER BY id DESC
+            LIMIT 1
+        """, (self.job, RESUMABLE, JOB_RESUME_HOURS * 3600))
+        if resumable:
+            self.run_id = resumable[0][0]
+            self._query(
+                "UPDATE job_runs SET status = 'running', attempts = attempts + 1 WHERE id = %s",
+                (self.run_id,),
+            )
+        else:
+            self.run_id = self._query(
+                "INSERT INTO job_runs (job, status, started_at) VALUES (%s, 'running', now()) RETURNING id",
+                (self.job,),
+            )[0][0]
+        self._query(
+            "UPDATE job_runs SET status = 'abandoned', finished_at = now() WHERE job = %s AND status = ANY(%s) AND id <> %s",
+            (self.job, RESUMABLE, self.run_id),
+        )
+
+        for name in self.stages:
+            self._query("""
+                INSERT INTO job_stage_runs (run_id, stage, status)
+                VALUES (%s, %s, 'pending')
+                ON CONFLICT (run_id, stage) DO NOTHING
+            """, (self.run_id, name))
+        for name, status, result, checkpoint in self._query(
+            "SELECT stage, status, result, checkpoint FROM job_stage_runs WHERE run_id = %s", (self.run_id,)
+        ):
+            if status == "succeeded" and name in self.stages:
+                self.results[name] = result or {}
+                self.statuses[name] = status
+            elif checkpoint is not None:
+                self._saved[name] = checkpoint
+
+        if resumable:
+            print(f"[Job] {self.job}: resuming run #{self.run_id} ({len(self.results)} stages already done)")
+        return True
+
+    def _execute(self, name: str) -> str:
+        stage = self.stages[name]
+        self._query("""
+            UPDATE job_stage_runs
+            SET status = 'running', started_at = now(), attempts = attempts + 1, error = NULL
+            WHERE run_id = %s AND stage = %s
+        """, (self.run_id, name))
+
+        started = time.perf_counter()
+        status, error, result = "succeeded", None, None
+        conn = None
+        try:
+            conn = self.connect()
+            cur = conn.cursor()
+            try:
+                # Held for the stage's session, so even a stage orphaned by a killed
+                # invocation keeps a resumed run from executing it a second time
+                cur.execute(
+                    "SELECT pg_try_advisory_lock(hashtext('job_stage_runs'), hashtext(%s))",
+                    (f"{self.job}/{name}",),
+                )
+                if not cur.fetchone()[0]:
+                    raise RuntimeError("still running in an earlier invocation")
+                result = stage.run(StageContext(self, name, self._saved.get(name)), cur) or {}
+                conn.commit()
+            finally:
+                cur.close()
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+            if conn is not None and not conn.closed:
+                conn.rollback()
+        finally:
+            if conn is not None:
+                conn.close()
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.durations[name] = duration_ms
+        self.statuses[name] = status
+        if status == "succeeded":
+            self.results[name] = result
+        print(f"[Job] {self.job}/{name} {status} in {duration_ms:.0f}ms" + (f": {error}" if error else ""))
+
+        try:
+            self._query("""
+                UPDATE job_stage_runs
+                SET status = %s, finished_at = now(), duration_ms = %s, error = %s, result = %s::jsonb
+                WHERE run_id = %s AND stage = %s
+            """, (
+                status, duration_ms, error,
+                encode_json(result).decode() if result is not None else None,
+                self.run_id, name
+            ))
+        except Exception as e:
+            print(f"[Job] Could not record {name}: {e}")
+        return status
+
+    def run(self) -> dict:
+        """Run (or resume) the job. Returns a summary with per-stage status and timings."""
+        if not self._begin():
+            print(f"[Job] {self.job}: another run holds the lock → skipping")
+            self._control.close()
+            return {"job": self.job, "status": "locked"}
+
+        started = time.perf_counter()
+        finished = {n for n, s in self.statuses.items() if s == "succeeded"}
+        pending = [n for n in self.stages if n not in finished]
+        running = {}
+        timed_out = False
+
+        executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS)
+        try:
+            while pending or running:
+                for name in list(pending):
+                    if not set(self.stages[name].after) <= finished:
+                        continue
+                    if time.monotonic() >= self.deadline:
+                        timed_out = True
+                        break
+                    pending.remove(name)
+                    running[executor.submit(self._execute, name)] = name
+                if timed_out or not running:
+                    break
+                done, _ = wait(running, timeout=max(self.deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    timed_out = True
+                    break
+                for future in done:
+                    finished.add(running.pop(future))
+        finally:
+            # Stages not started yet are left to the resumed run. Those already running
+            # write on their own connections, so the lock is held until they stop:
+            # a resumed run must never execute the same stage concurrently.
+            if running:
+                print(f"[Job] {self.job}: waiting for {len(running)} running stages before releasing the lock")
+            executor.shutdown(wait=True, cancel_futures=True)
+        for future, name in running.items():
+            if future.cancelled():
+                pending.append(name)
+        running = {}
+
+        if timed_out or pending:
+            status = "timed_out"
+        elif any(s == "failed" for s in self.statuses.values()):
+            status = "partial"
+        else:
+            status = "succeeded"
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        self._query(
+            "UPDATE job_runs SET status = %s, finished_at = now(), duration_ms = %s WHERE id = %s",
+            (status, duration_ms, self.run_id),
+        )
+        self._query("SELECT pg_advisory_unlock(hashtext('job_runs'), hashtext(%s))", (self.job,))
+        self._control.close()
+
+        print(f"[Job] {self.job} run #{self.run_id} {status} in {duration_ms:.0f}ms")
+        return {
+            "job": self.job,
+            "run_id": self.run_id,
+            "status": status,
+            "duration_ms": duration_ms,
+            "stages": {
+                name: {
+                    "status": self.statuses.get(name, "pending"),
+                    "duration_ms": self.durations.get(name),
+                }
+                for name in self.stages
+            },
+        }
@@ -0,0 +1,65 @@
+# app/key_inventory.py
+import os
+import msgspec
+from dotenv import load_dotenv
+from app.replay import stand_in
+
+load_dotenv()
+
+# JSON file listing every key per vendor, e.g.
+# {
+#   "tavily":     [{"id": "growth-1", "team": "growth", "api_key": "tvly-..."}],
+#   "fullenrich": [{"id": "sales", "team": "sales", "api_key": "..."}],
+#   "anthropic":  [{"id": "main", "team": "platform", "api_key": "sk-ant-admin-...", "org_id": "..."}]
+# }
+# Without it, the single .env key of each vendor is used as team "default".
+PROVIDER_KEYS_FILE = os.getenv("PROVIDER_KEYS_FILE")
+
+PROVIDERS = ("tavily", "fullenrich", "anthropic")
+
+
+class ProviderKey(msgspec.Struct, frozen=True):
+    id: str
+    api_key: str
+    team: str = "default"
+    org_id: str | None = None  # Anthropic only
+
+
+def _env_inventory() -> dict[str, list[ProviderKey]]:
+    # In replay mode missing keys become placeholders, so every vendor is "configured"
+    tavily_key = stand_in(os.getenv("TAVILY_API_KEY"))
+    fullenrich_key = stand_in(os.getenv("FULLENRICH_API_KEY"))
+    anthropic_key = stand_in(os.getenv("ANTHROPIC_ADMIN_KEY"))
+    anthropic_org = stand_in(os.getenv("ANTHROPIC_ORG_ID"))
+
+    inventory: dict[str, list[ProviderKey]] = {p: [] for p in PROVIDERS}
+    if tavily_key:
+        inventory["tavily"].append(ProviderKey(id="default", api_key=tavily_key))
+    if fullenrich_key:
+        inventory["fullenrich"].append(ProviderKey(id="default", api_key=fullenrich_key))
+    if anthropic_key and anthropic_org:
+        inventory["anthropic"].append(ProviderKey(
+            id="default",
+            api_key=anthropic_key,
+            org_id=anthropic_org,
+        ))
+    return inventory
+
+
+def load_key_inventory() -> dict[str, list[ProviderKey]]:
+    """Keys per provider, from PROVIDER_KEYS_FILE or the single .env keys."""
+    if not PROVIDER_KEYS_FILE:
+        return _env_inventory()
+
+    with open(PROVIDER_KEYS_FILE, "rb") as f:
+        configured = msgspec.json.decode(f.read(), type=dict[str, list[ProviderKey]])
+
+    unknown = set(configured) - set(PROVIDERS)
+    if unknown:
+        raise ValueError(f"Unknown providers in {PROVIDER_KEYS_FILE}: {sorted(unknown)}")
+    for provider, keys in configured.items():
+        ids = [k.id for k in keys]
+        if len(ids) != len(set(ids)):
+            raise ValueError(f"Duplicate key ids for {provider} in {PROVIDER_KEYS_FILE}")
+
+    return {p: configured.get(p, []) for p in PROVIDERS}
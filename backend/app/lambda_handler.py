@@ -3,8 +3,27 @@
 import json
 import os
 import psycopg
-import boto3
 from datetime import date, timedelta
+from app.anomalies import observe_many
+from app.anthropic_usage import ingest_anthropic_reports
+from app.balances import store_poll
+from app.budgets import refresh_tag_spend
+from app.collector import PROVIDER_TOOLS, collect_provider_total
+from app.cost_query import AWS_REGION
+from app.dashboard import send_alert_email_simulation, stored_alerts
+from app.jobs import JOB_DEFAULT_BUDGET_SECONDS, JobRunner, Stage
+from app.key_inventory import PROVIDERS, load_key_inventory
+from app.model import Severity
+from app.posthog import ingest_posthog_usage
+from app.replay import ce_client
+from app.rollups import refresh_aws_rollups, refresh_usage_rollups
+from app.shared_cache import cache_invalidate
+from app.usage_breakdown import ingest_usage_breakdown
+
+# Cost Explorer revises recent days, so every run re-reads this many days
+AWS_SPEND_LOOKBACK_DAYS = int(os.getenv("AWS_SPEND_LOOKBACK_DAYS", "30"))
+# No single statement in a stage may run longer than this
+JOB_STATEMENT_TIMEOUT_MS = int(os.getenv("JOB_STATEMENT_TIMEOUT_MS", "60000"))
 
 
 def get_db_connection():
@@ -15,63 +34,149 @@ def get_db_connection():
         user=os.environ["DB_USER"],
         password=os.environ["DB_PASSWORD"],
         connect_timeout=5,
+        options=f"-c statement_timeout={JOB_STATEMENT_TIMEOUT_MS}",
     )
 
 
-def lambda_handler(event, context):
-    print("Hourly fetch started...")
+def stage_aws_costs(ctx, cur) -> dict:
+    """AWS Cost Explorer - one row per (day, service) so rollups can sum any window."""
+    today = date.today()
+    ce = ce_client(AWS_REGION)
+    end = today + timedelta(days=1)  # include today's partial spend
+    start = today - timedelta(days=AWS_SPEND_LOOKBACK_DAYS)
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+    params = {
+        "TimePeriod": {"Start": start.isoformat(), "End": end.isoformat()},
+        "Granularity": "DAILY",
+        "Metrics": ["AmortizedCost"],
+        "GroupBy": [{"Type": "DIMENSION", "Key": "SERVICE"}],
+    }
 
-    try:
-        today = date.today()
-
-        # AWS Cost Explorer
-        ce = boto3.client("ce")
-        end = today
-        start = end - timedelta(days=30)
-
-        resp = ce.get_cost_and_usage(
-            TimePeriod={"Start": start.isoformat(), "End": end.isoformat()},
-            Granularity="MONTHLY",
-            Metrics=["AmortizedCost"],
-            GroupBy=[{"Type": "DIMENSION", "Key": "SERVICE"}],
-        )
-
-        total = 0.0
-        services = []
+    total = 0.0
+    rows = []
 
+    while True:
+        resp = ce.get_cost_and_usage(**params)
         for r in resp["ResultsByTime"]:
+            day = date.fromisoformat(r["TimePeriod"]["Start"])
             for g in r["Groups"]:
                 svc = g["Keys"][0].replace("AWS::", "")
                 amt = float(g["Metrics"]["AmortizedCost"]["Amount"])
-                services.append({"service": svc, "amount": amt})
+                rows.append((day, svc, amt))
                 total += amt
+        if not resp.get("NextPageToken"):
+            break
+        params["NextPageToken"] = resp["NextPageToken"]
+
+    print(f"Fetched real AWS spend: ${total:.2f} over {AWS_SPEND_LOOKBACK_DAYS} days")
+
+    # Update RDS, remembering which rows actually changed
+    changed = []
+    for day, svc, amt in rows:
+        cur.execute(
+            """
+            INSERT INTO aws_spend (date, service, amount)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (date, service)
+            DO UPDATE SET amount = EXCLUDED.amount
+            WHERE aws_spend.amount IS DISTINCT FROM EXCLUDED.amount
+            RETURNING date
+            """,
+            (day, svc, amt),
+        )
+        if cur.fetchone() is not None:
+            changed.append((day, svc, amt))
+
+    observe_many(cur, [(f"aws:{svc}", day, amt) for day, svc, amt in changed])
+    changed_days = sorted({day.isoformat() for day, _, _ in changed})
+    print(f"RDS updated successfully ({len(changed_days)} changed days)")
+    return {"rows": len(rows), "total": round(total, 2), "changed_days": changed_days}
+
+
+def balance_stage(provider: str):
+    """Refresh every key of one vendor; a vendor that is down only fails its own stage."""
+    tool = PROVIDER_TOOLS[provider]
+
+    def run(ctx, cur) -> dict:
+        total = collect_provider_total(cur, provider)
+        if total is None:
+            # Keep the per-key errors, then report the stage as failed
+            cur.connection.commit()
+            raise RuntimeError(f"no {tool} key answered")
+        burn = store_poll(cur, tool, total)
+        return {"tool": tool, "credits_remaining": total, "burn_per_day": burn}
+
+    return run
+
+
+def stage_anthropic_reports(ctx, cur) -> dict:
+    return {"rows": ingest_anthropic_reports(cur)}
 
-        print(f"Fetched real AWS spend: ${total:.2f}")
 
-        # Update RDS
-        for s in services:
-            cur.execute(
-                """
-                INSERT INTO aws_spend (date, service, amount)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (date, service)
-                DO UPDATE SET amount = EXCLUDED.amount
-                """,
-                (today, s["service"], s["amount"]),
-            )
+def stage_posthog_usage(ctx, cur) -> dict:
+    return {"changed_days": [day.isoformat() for day in ingest_posthog_usage(cur)]}
 
-        conn.commit()
-        print("RDS updated successfully")
 
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        conn.rollback()
+def stage_usage_breakdown(ctx, cur) -> dict:
+    return {"rows": ingest_usage_breakdown(cur)}
+
+
+def stage_rollups(ctx, cur) -> dict:
+    """Refresh the buckets touched by this run, plus any left over by a failed earlier attempt."""
+    aws_days = set(ctx.results.get("aws_costs", {}).get("changed_days", []))
+    usage_days = set(ctx.results.get("posthog_usage", {}).get("changed_days", []))
+    for left in ctx.leftovers() + ([ctx.saved] if ctx.saved else []):
+        aws_days.update(left.get("aws_days", []))
+        usage_days.update(left.get("usage_days", []))
+    ctx.checkpoint({"aws_days": sorted(aws_days), "usage_days": sorted(usage_days)})
+
+    aws_buckets = refresh_aws_rollups(cur, [date.fromisoformat(d) for d in aws_days])
+    usage_buckets = refresh_usage_rollups(cur, [date.fromisoformat(d) for d in usage_days])
+    return {"aws_buckets": aws_buckets, "usage_buckets": usage_buckets}
+
+
+def stage_budget_tags(ctx, cur) -> dict:
+    """Daily spend for the tag keys that have budgets."""
+    return {"rows": refresh_tag_spend(cur)}
+
+
+def stage_alerts(ctx, cur) -> dict:
+    """Evaluate alerts on the rows the ingestion stages just wrote."""
+    alerts = stored_alerts(cur)
+    # API replicas in distributed mode recompute their shared dashboards on next read
+    cache_invalidate(cur, "dashboard:")
+    critical = [a for a in alerts if a.severity is Severity.CRITICAL]
+    if critical:
+        send_alert_email_simulation(alerts)
+    return {"alerts": len(alerts), "critical": len(critical)}
+
+
+def hourly_stages() -> list[Stage]:
+    inventory = load_key_inventory()
+    balance_stages = [
+        Stage(f"balance:{provider}", balance_stage(provider))
+        for provider in PROVIDERS
+        if inventory.get(provider)
+    ]
+    ingest = [
+        Stage("aws_costs", stage_aws_costs),
+        *balance_stages,
+        Stage("posthog_usage", stage_posthog_usage),
+        Stage("usage_breakdown", stage_usage_breakdown),
+        Stage("budget_tags", stage_budget_tags),
+    ]
+    if inventory.get("anthropic"):
+        ingest.append(Stage("anthropic_reports", stage_anthropic_reports))
+    return ingest + [
+        Stage("rollups", stage_rollups, after=("aws_costs", "posthog_usage")),
+        Stage("alerts", stage_alerts, after=tuple(s.name for s in ingest) + ("rollups",)),
+    ]
+
+
+def lambda_handler(event, context):
+    print("Hourly fetch started...")
 
-    finally:
-        cur.close()
-        conn.close()
+    budget = context.get_remaining_time_in_millis() / 1000 if context else JOB_DEFAULT_BUDGET_SECONDS
+    summary = JobRunner("hourly", hourly_stages(), get_db_connection, budget).run()
 
-    return {"statusCode": 200, "body": json.dumps("Hourly fetch done")}
+    return {"statusCode": 200, "body": json.dumps(summary)}
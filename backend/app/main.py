@@ -1,28 +1,40 @@
-from fastapi import FastAPI, Query, Response
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from mangum import Mangum
-from app.database import get_db_connection
+from app.database import get_db_connection, read_cursor, write_cursor
 from datetime import date, timedelta, datetime
-from app.calculations import (
-    calculate_exhaustion_date,
-    calculate_risk_status,
-    generate_alerts
+from app.dashboard import DashboardUnavailable, cached_dashboard, send_alert_email_simulation
+from app.balances import refresh_all_balances
+from app.budgets import BudgetIn, account_budget, evaluate_budgets, upsert_budget
+from app.collector import PROVIDER_TOOLS
+from app.anthropic_usage import anthropic_daily_spend, anthropic_usage_summary, ingest_anthropic_reports
+from app.posthog import refresh_posthog_usage
+from app.simulator import SimulationRequest, load_history, run_simulation
+from app.snapshots import SNAPSHOT_DAYS, diff_snapshots, snapshot_at
+from app.rollups import aws_spend_by_window, usage_by_window
+from app.profiling import ADMIN_TOKEN, ProfilingMiddleware, get_trace, profiled, recent_traces
+from app.throttle import ThrottleMiddleware, build_rate_limiter
+from app.usage_breakdown import USAGE_BREAKDOWN_DIMENSIONS, ingest_usage_breakdown, top_consumers
+from app.work_queue import DISTRIBUTED_MODE, enqueue
+from app.cost_query import get_forecast, parse_filters, parse_group_by, query_costs
+from app.model import (
+    DateRange,
+    Severity,
+    ServiceSpend,
+    ToolUsage,
+    WindowSummary,
+    BalanceTotal,
+    KeyBalance,
+    encode_json
 )
-from app.posthog import get_real_daily_credit_usage
-from app.tavily import get_tavily_remaining_credits
-from app.fullenrich import get_fullenrich_remaining_credits
-from app.anthropic import get_anthropic_remaining_credits
+import hmac
 import io
 import csv
-import boto3
 import os
-import requests
 from dotenv import load_dotenv
 
 load_dotenv()
 
-AWS_REGION = os.getenv("AWS_REGION", "ap-south-1")
-
 # Load API keys
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 FULLENRICH_API_KEY = os.getenv("FULLENRICH_API_KEY")
@@ -33,70 +45,12 @@ print("[DEBUG] TAVILY_API_KEY loaded:", TAVILY_API_KEY[:10] + "..." if TAVILY_AP
 print("[DEBUG] FULLENRICH_API_KEY loaded:", FULLENRICH_API_KEY[:10] + "..." if FULLENRICH_API_KEY else "None")
 print("[DEBUG] ANTHROPIC_ADMIN_KEY loaded:", (os.getenv("ANTHROPIC_ADMIN_KEY")[:10] if os.getenv("ANTHROPIC_ADMIN_KEY") else "None") + "...")
 
-def fetch_real_aws_spend(days: int = 30) -> dict:
-    try:
-        client = boto3.client('ce', region_name=AWS_REGION)
-        end = datetime.utcnow().date()
-        start = end - timedelta(days=days)
-        response = client.get_cost_and_usage(
-            TimePeriod={'Start': start.isoformat(), 'End': end.isoformat()},
-            Granularity='MONTHLY',
-            Metrics=['AmortizedCost'],
-            GroupBy=[{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
-        )
-        services = []
-        total_spend = 0.0
-        for result in response['ResultsByTime']:
-            for group in result['Groups']:
-                service = group['Keys'][0].replace('AWS::', '')
-                amount = float(group['Metrics']['AmortizedCost']['Amount'])
-                services.append({"service": service, "amount": amount})
-                total_spend += amount
-        print(f"[AWS] Real spend: ${total_spend:.2f}")
-        return {"monthly_spend": total_spend, "services": services}
-    except Exception as e:
-        print(f"[AWS] Error: {str(e)} → mock fallback")
-        return {
-            "monthly_spend": 14100.0,
-            "services": [
-                {"service": "EC2", "amount": 8200.0},
-                {"service": "RDS", "amount": 4500.0},
-                {"service": "Other", "amount": 1400.0}
-            ]
-        }
-
-def send_alert_email_simulation(alerts: list[dict]):
-    critical_alerts = [a for a in alerts if a["severity"] == "critical"]
-    if not critical_alerts:
-        return
-
-    subject = f"CRITICAL Billing Alert - {len(critical_alerts)} Issues ({date.today().isoformat()})"
-    body_lines = [
-        "URGENT: Critical billing risks detected",
-        "----------------------------------------",
-        f"Date: {date.today().isoformat()}",
-        f"Total critical alerts: {len(critical_alerts)}",
-        "",
-    ]
-
-    for alert in critical_alerts:
-        body_lines.append(f"[{alert['severity'].upper()}] {alert['message']}")
-        body_lines.append(f" → Affected: {alert['affected']}")
-        body_lines.append("")
-
-    body_lines.append("Action required immediately to avoid service disruption.")
-    body_lines.append("Dashboard: http://your-frontend-url/dashboard")
-    body_lines.append("----------------------------------------")
-
-    print("\n" + "="*60)
-    print("SIMULATED CRITICAL EMAIL / SLACK")
-    print("Subject:", subject)
-    print("\n".join(body_lines))
-    print("="*60 + "\n")
-
-
 app = FastAPI(title="Operator.ai Billing Backend")
 
+# Innermost: times only requests that actually run (coalesced followers never get here)
+app.add_middleware(ProfilingMiddleware)
+# Added before CORS so 429s still carry CORS headers
+app.add_middleware(ThrottleMiddleware, limiter=build_rate_limiter())
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -106,128 +60,360 @@ app.add_middleware(
 )
 
 
-@app.get("/dashboard")
-async def get_dashboard(days: int = Query(30, ge=1, le=90)):
+def json_response(content) -> Response:
+    """Encode structs straight to JSON bytes, skipping FastAPI's jsonable_encoder pass."""
+    return Response(content=encode_json(content), media_type="application/json")
+
+
+def _refresh(kind: str, inline_fn):
+    """
+    Handle ?refresh=1: queue the `kind` job for the workers in distributed mode,
+    otherwise run `inline_fn(cur)` before answering.
+    """
+    if DISTRIBUTED_MODE:
+        with write_cursor() as cur:
+            enqueue(cur, kind, dedupe_key=kind)
+        return
     conn = get_db_connection()
     cur = conn.cursor()
+    try:
+        inline_fn(cur)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
 
-    start_date = date.today() - timedelta(days=days - 1)
-
-    cur.execute("""
-        SELECT name, credits_remaining, percent_remaining, daily_avg_usage
-        FROM tools
-        WHERE last_updated >= %s
-        ORDER BY name
-    """, (start_date,))
-    tools_rows = cur.fetchall()
-
-    real_daily_usage = get_real_daily_credit_usage(days=7)
-
-    tools = []
-    for row in tools_rows:
-        name, credits_db, percent, daily_db = row
-
-        # Real API for Tavily, FullEnrich, Anthropic
-        if name == "Tavily":
-            credits = get_tavily_remaining_credits()
-        elif name == "FullEnrich":
-            credits = get_fullenrich_remaining_credits()
-        elif name == "Anthropic":
-            credits = get_anthropic_remaining_credits()
-        else:
-            credits = float(credits_db or 0)
-
-        daily = real_daily_usage.get(name, float(daily_db or 0))
-        exhaustion = calculate_exhaustion_date(credits, daily)
-        status = calculate_risk_status(float(percent or 0))
-
-        tools.append({
-            "name": name,
-            "credits_remaining": credits,  # ← this line saves the real value
-            "percent_remaining": float(percent or 0),
-            "daily_avg_usage": round(daily, 2),
-            "predicted_exhaustion": exhaustion,
-            "status": status
-        })
-
-    aws_data = fetch_real_aws_spend(days=days)
-
-    aws = {
-        "monthly_spend": aws_data["monthly_spend"],
-        "monthly_budget": 12000.0,
-        "percent_used": round((aws_data["monthly_spend"] / 12000.0) * 100, 1) if aws_data["monthly_spend"] > 0 else 0.0,
-        "services": aws_data["services"],
-        "filtered_days": days
-    }
-
-    alerts = generate_alerts(tools, aws)
-
-    cur.close()
-    conn.close()
-
-    return {
-        "tools": tools,
-        "aws": aws,
-        "alerts": alerts,
-        "alert_count": len(alerts),
-        "last_updated": date.today().isoformat(),
-        "filtered_days": days,
-        "date_range": {
-            "from": start_date.isoformat(),
-            "to": date.today().isoformat()
-        }
-    }
+
+@app.exception_handler(DashboardUnavailable)
+def dashboard_unavailable(request, exc: DashboardUnavailable):
+    return Response(
+        content=encode_json({"detail": str(exc)}),
+        status_code=503,
+        media_type="application/json",
+        headers={"Retry-After": "5"},
+    )
+
+
+@app.get("/dashboard")
+@profiled
+def get_dashboard(days: int = Query(30, ge=1, le=90)):
+    return json_response(cached_dashboard(days))
+
+
+@app.get("/dashboard/history")
+def get_dashboard_history(at: datetime | None = None, days: int = Query(SNAPSHOT_DAYS, ge=1, le=90)):
+    """The dashboard as it was last recorded at or before `at` (default: latest)."""
+    with read_cursor() as cur:
+        found = snapshot_at(cur, at, days)
+    if found is None:
+        raise HTTPException(status_code=404, detail="No snapshot recorded at or before that time")
+    captured_at, snapshot = found
+    return json_response({"captured_at": captured_at.isoformat(), "dashboard": snapshot})
+
+
+@app.get("/dashboard/diff")
+def get_dashboard_diff(
+    from_: datetime = Query(..., alias="from"),
+    to: datetime | None = None,
+    days: int = Query(SNAPSHOT_DAYS, ge=1, le=90)
+):
+    """Changed tool balances, added/removed alerts and service amount changes between two times."""
+    with read_cursor() as cur:
+        diff = diff_snapshots(cur, from_, to, days)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="No snapshot recorded at or before that time")
+    return json_response(diff)
+
+
+@app.get("/dashboard/windows")
+@profiled
+def get_dashboard_windows(windows: list[int] = Query([7, 30, 90]), refresh: bool = False):
+    """AWS spend and tool usage for several trailing windows, served from the rollup tables."""
+    windows = sorted(set(windows))
+    if not windows or any(w < 1 or w > 366 for w in windows):
+        raise HTTPException(status_code=400, detail="windows must be between 1 and 366 days")
+
+    # Re-ingest PostHog usage first (the hourly job does this too)
+    if refresh:
+        _refresh("posthog_usage", refresh_posthog_usage)
+
+    with read_cursor() as cur:
+        spend = aws_spend_by_window(cur, windows)
+        usage = usage_by_window(cur, windows)
+
+    today = date.today()
+    result = []
+    for days in windows:
+        services = sorted(
+            (ServiceSpend(service=name, amount=round(amount, 2)) for name, amount in spend[days].items()),
+            key=lambda s: -s.amount
+        )
+        tools = [
+            ToolUsage(
+                name=name,
+                credits_consumed=credits,
+                events_count=events,
+                daily_avg_usage=round(credits / days, 2)
+            )
+            for name, (credits, events) in sorted(usage[days].items())
+        ]
+        result.append(WindowSummary(
+            days=days,
+            date_range=DateRange(
+                from_=(today - timedelta(days=days - 1)).isoformat(),
+                to=today.isoformat()
+            ),
+            aws_spend=round(sum(s.amount for s in services), 2),
+            services=services,
+            tools=tools
+        ))
+
+    return json_response({"windows": result})
+
+
+@app.get("/balances")
+def get_balances(refresh: bool = False):
+    """Vendor balances per tool, per team and per configured key (secrets never leave the DB layer)."""
+    if refresh:
+        _refresh("balances", refresh_all_balances)
+
+    with read_cursor() as cur:
+        cur.execute("""
+            SELECT provider, key_id, team, credits_remaining, error, fetched_at, duration_ms
+            FROM provider_key_balances
+            ORDER BY provider, team, key_id
+        """)
+        rows = cur.fetchall()
+
+    keys = [
+        KeyBalance(
+            provider=provider,
+            key_id=key_id,
+            team=team,
+            credits_remaining=float(credits) if credits is not None else None,
+            error=error,
+            duration_ms=duration_ms,
+            fetched_at=fetched_at.isoformat() if fetched_at else None
+        )
+        for provider, key_id, team, credits, error, fetched_at, duration_ms in rows
+    ]
+
+    def totals(group_of) -> list[BalanceTotal]:
+        grouped: dict[str, BalanceTotal] = {}
+        for k in keys:
+            name = group_of(k)
+            total = grouped.setdefault(name, BalanceTotal(name=name, credits_remaining=0.0, keys=0, failing_keys=0))
+            total.credits_remaining += k.credits_remaining or 0.0
+            total.keys += 1
+            total.failing_keys += 1 if k.error else 0
+        return sorted(grouped.values(), key=lambda t: t.name)
+
+    return json_response({
+        "tools": totals(lambda k: PROVIDER_TOOLS[k.provider]),
+        "teams": totals(lambda k: f"{k.team}/{PROVIDER_TOOLS[k.provider]}"),
+        "keys": keys
+    })
+
+
+@app.get("/anthropic/usage")
+def get_anthropic_usage(days: int = Query(30, ge=1, le=90), refresh: bool = False):
+    """Token counts and cost per model from the ingested Admin API reports."""
+    if refresh:
+        _refresh("anthropic_reports", ingest_anthropic_reports)
+
+    with read_cursor() as cur:
+        models = anthropic_usage_summary(cur, days)
+        daily_spend = anthropic_daily_spend(cur)
+
+    return json_response({
+        "days": days,
+        "models": models,
+        "total_cost_usd": round(sum(m.cost_usd for m in models), 4),
+        "daily_avg_cost_usd_7d": round(daily_spend, 4) if daily_spend is not None else None
+    })
+
+
+@app.get("/usage/breakdown")
+def get_usage_breakdown(
+    dimension: str = Query(USAGE_BREAKDOWN_DIMENSIONS[0] if USAGE_BREAKDOWN_DIMENSIONS else "distinct_id"),
+    tool: str | None = None,
+    days: int = Query(30, ge=1, le=90),
+    limit: int = Query(10, ge=1, le=100),
+    refresh: bool = False
+):
+    """Top credit consumers per PostHog property, from the locally ingested daily breakdown."""
+    if dimension not in USAGE_BREAKDOWN_DIMENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown dimension; configured: {', '.join(USAGE_BREAKDOWN_DIMENSIONS)}"
+        )
+    if refresh:
+        _refresh("usage_breakdown", ingest_usage_breakdown)
+    with read_cursor() as cur:
+        total, consumers = top_consumers(cur, dimension, days, limit, tool)
+
+    return json_response({
+        "dimension": dimension,
+        "tool": tool,
+        "days": days,
+        "total_credits": round(total, 2),
+        "consumers": consumers
+    })
 
 
 @app.get("/alerts")
-async def get_alerts(critical_only: bool = False):
-    data = get_dashboard(30)
-    alerts = data["alerts"]
+@profiled
+def get_alerts(critical_only: bool = False):
+    alerts = cached_dashboard(30).alerts
 
     if critical_only:
-        alerts = [a for a in alerts if a["severity"] == "critical"]
+        alerts = [a for a in alerts if a.severity is Severity.CRITICAL]
 
-    if any(a["severity"] == "critical" for a in alerts):
+    if any(a.severity is Severity.CRITICAL for a in alerts):
         send_alert_email_simulation(alerts)
 
-    return {
+    return json_response({
         "alerts": alerts,
         "count": len(alerts),
         "timestamp": date.today().isoformat()
-    }
+    })
+
+
+@app.get("/budgets")
+def get_budgets():
+    """Month-to-date spend, pacing and month-end projection per budget."""
+    today = date.today()
+    with read_cursor() as cur:
+        budgets = evaluate_budgets(cur, today)
+
+    return json_response({
+        "month": today.strftime("%Y-%m"),
+        "budgets": budgets,
+        "count": len(budgets)
+    })
+
+
+@app.put("/budgets")
+def put_budget(budget: BudgetIn):
+    """Create or update the budget for (scope, target)."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        budget_id = upsert_budget(cur, budget)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    return json_response({"id": budget_id, **budget.model_dump()})
+
+
+@app.delete("/budgets/{budget_id}")
+def delete_budget(budget_id: int):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE budgets SET active = FALSE WHERE id = %s AND active", (budget_id,))
+        deleted = cur.rowcount
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    return Response(status_code=204)
+
+
+@app.get("/aws/costs")
+def get_aws_costs(
+    group_by: list[str] = Query(["SERVICE"]),
+    granularity: str = Query("DAILY", pattern="^(DAILY|MONTHLY)$"),
+    start: date | None = None,
+    end: date | None = None,
+    filter: list[str] = Query([])
+):
+    """
+    Cost drill-down, e.g. ?group_by=SERVICE&group_by=REGION&filter=tag:team:growth
+    end is exclusive (Cost Explorer semantics).
+    """
+    try:
+        result = query_costs(
+            parse_group_by(group_by),
+            granularity=granularity,
+            start=start,
+            end=end,
+            ce_filter=parse_filters(filter)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"[CostQuery] Error: {str(e)}")
+        raise HTTPException(status_code=502, detail="Cost Explorer query failed")
+    return json_response(result)
+
+
+@app.get("/aws/forecast")
+def get_aws_forecast(
+    start: date | None = None,
+    end: date | None = None,
+    granularity: str = Query("DAILY", pattern="^(DAILY|MONTHLY)$"),
+    filter: list[str] = Query([])
+):
+    try:
+        forecast = get_forecast(start, end, granularity=granularity, ce_filter=parse_filters(filter))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"[AWS Forecast] Error: {str(e)}")
+        raise HTTPException(status_code=502, detail="Cost Explorer forecast failed")
+    return json_response(forecast)
+
+
+@app.post("/simulate")
+def simulate(request: SimulationRequest):
+    """
+    What-if Monte Carlo over historical daily usage/spend, e.g.
+    {"tools": {"Anthropic": {"weekly_growth": 0.2}, "Tavily": {"top_up": 5000}}}
+    """
+    today = date.today()
+    with read_cursor(timeout_ms=15000) as cur:
+        monthly_budget = account_budget(evaluate_budgets(cur)).monthly_amount
+        history = load_history(cur, request.history_days, today)
+    # The pooled connection is back before the (CPU-bound) simulation starts
+    return json_response(run_simulation(history, request, monthly_budget, today))
 
 
 @app.get("/export")
-async def export_report(
+@profiled
+def export_report(
     days: int = Query(30, ge=1, le=90),
     format: str = Query("json", pattern="^(json|csv)$")
 ):
-    data = get_dashboard(days)
+    data = cached_dashboard(days)
 
     if format == "json":
-        return data
+        return json_response(data)
 
     output = io.StringIO()
     writer = csv.writer(output)
 
     writer.writerow(["Type", "Name/Service", "Credits/Amount", "% Used", "Daily Avg", "Exhaustion Date", "Status"])
 
-    for tool in data["tools"]:
+    for tool in data.tools:
         writer.writerow([
             "Tool",
-            tool["name"],
-            tool["credits_remaining"],
-            f"{tool['percent_remaining']}%",
-            tool["daily_avg_usage"],
-            tool.get("predicted_exhaustion", ""),
-            tool["status"]
+            tool.name,
+            tool.credits_remaining,
+            f"{tool.percent_remaining}%",
+            tool.daily_avg_usage,
+            tool.predicted_exhaustion or "",
+            tool.status.value
         ])
 
-    for service in data["aws"]["services"]:
+    for service in data.aws.services:
         writer.writerow([
             "AWS Service",
-            service["service"],
-            service["amount"],
+            service.service,
+            service.amount,
             "",
             "",
             "",
@@ -235,14 +421,14 @@ async def export_report(
         ])
 
     writer.writerow([])
-    writer.writerow(["Summary", "", "", f"AWS: {data['aws']['percent_used']}%", "", "", ""])
-    writer.writerow(["Alert Count", data["alert_count"], "", "", "", "", ""])
+    writer.writerow(["Summary", "", "", f"AWS: {data.aws.percent_used}%", "", "", ""])
+    writer.writerow(["Alert Count", data.alert_count, "", "", "", "", ""])
 
     writer.writerow([])
     writer.writerow(["Alerts"])
     writer.writerow(["Severity", "Message", "Affected"])
-    for alert in data["alerts"]:
-        writer.writerow([alert["severity"], alert["message"], alert["affected"]])
+    for alert in data.alerts:
+        writer.writerow([alert.severity.value, alert.message, alert.affected])
 
     csv_content = output.getvalue()
     filename = f"billing_report_{date.today().isoformat()}.csv"
@@ -254,4 +440,28 @@ async def export_report(
     )
 
 
-handler = Mangum(app)
\ No newline at end of file
+def require_admin(token: str | None):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/profiles")
+def list_profiles(x_admin_token: str | None = Header(None)):
+    """Slow requests captured by the profiling sampler (PROFILE_SAMPLE_RATE), newest first."""
+    require_admin(x_admin_token)
+    traces = recent_traces()
+    return json_response({"traces": traces, "count": len(traces)})
+
+
+@app.get("/admin/profiles/{trace_id}")
+def get_profile(trace_id: int, x_admin_token: str | None = Header(None)):
+    require_admin(x_admin_token)
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (the ring buffer may have dropped it)")
+    return json_response(trace)
+
+
+handler = Mangum(app)
@@ -1,14 +1,51 @@
-def get_mock_tools():
+# app/mocks.py
+# The demo numbers served when a provider is not configured or unreachable.
+# Everything else (seeding, fallbacks) derives from these, so they only live here.
+from datetime import date, timedelta
+from app.model import AwsSpend, ServiceSpend
+
+ANTHROPIC_MOCK_CREDITS = 42350.0
+TAVILY_MOCK_CREDITS = 2800.0
+FULLENRICH_MOCK_CREDITS = 500.0
+BUYERCADDY_MOCK_CREDITS = 6800.0
+
+MOCK_AWS_SERVICES = {
+    "EC2": 8200.0,
+    "RDS": 4500.0,
+    "Other": 1400.0,
+}
+
+# name → (credits, percent remaining, daily usage, status)
+MOCK_TOOLS = {
+    "Anthropic": (ANTHROPIC_MOCK_CREDITS, 85.5, 15420.0, "warning"),
+    "Tavily": (TAVILY_MOCK_CREDITS, 28.0, 1200.0, "critical"),
+    "FullEnrich": (FULLENRICH_MOCK_CREDITS, 10.0, 80.0, "critical"),
+    "Buyercaddy": (BUYERCADDY_MOCK_CREDITS, 85.0, 400.0, "safe"),
+}
+
+
+def mock_aws_spend() -> AwsSpend:
+    return AwsSpend(
+        monthly_spend=sum(MOCK_AWS_SERVICES.values()),
+        services=[ServiceSpend(service=s, amount=a) for s, a in MOCK_AWS_SERVICES.items()]
+    )
+
+
+def generate_mock_tools():
+    today = date.today()
     return [
-        {"name": "Anthropic", "credits_remaining": 42350, "percent_remaining": 85.5, "daily_avg_usage": 15420, "status": "warning"},
-        {"name": "Tavily", "credits_remaining": 2800, "percent_remaining": 28, "daily_avg_usage": 1200, "status": "critical"},
-        # add FullEnrich, Buyercaddy, PostHog as in screenshot
+        {
+            "name": name,
+            "credits_remaining": credits,
+            "percent_remaining": percent,
+            "daily_avg_usage": daily,
+            "predicted_exhaustion": (today + timedelta(days=round(credits / daily))).isoformat(),
+            "status": status,
+            "last_updated": today.isoformat()
+        }
+        for name, (credits, percent, daily, status) in MOCK_TOOLS.items()
     ]
 
-def get_mock_aws():
-    return {
-        "monthly_spend": 14100,
-        "monthly_budget": 12000,
-        "percent_used": 118,
-        "services": [{"service": "EC2", "amount": 8200}, {"service": "RDS", "amount": 4500}]
-    }
\ No newline at end of file
+
+def generate_mock_aws_services():
+    return [{"service": s, "amount": a} for s, a in MOCK_AWS_SERVICES.items()]
@@ -0,0 +1,234 @@
+# app/model.py
+from enum import Enum
+from typing import Any
+
+import msgspec
+
+
+class Severity(str, Enum):
+    """Alert severity, declared most urgent first."""
+    CRITICAL = "critical"
+    ALERT = "alert"
+    WARNING = "warning"
+
+
+class Status(str, Enum):
+    """Tool risk status (see calculations.calculate_risk_status)."""
+    SAFE = "safe"
+    WARNING = "warning"
+    CRITICAL = "critical"
+
+
+# Precomputed once so sorting alerts is a plain dict hit per item
+SEVERITY_RANK = {severity: rank for rank, severity in enumerate(Severity)}
+
+
+class ToolBalance(msgspec.Struct, gc=False):
+    name: str
+    credits_remaining: float
+    percent_remaining: float
+    daily_avg_usage: float
+    predicted_exhaustion: str | None
+    status: Status
+
+
+class ServiceSpend(msgspec.Struct, gc=False):
+    service: str
+    amount: float
+
+
+class Alert(msgspec.Struct, gc=False):
+    severity: Severity
+    message: str
+    affected: str
+
+
+class AwsSpend(msgspec.Struct, gc=False):
+    """Raw Cost Explorer result: total plus per-service amounts."""
+    monthly_spend: float
+    services: list[ServiceSpend]
+
+
+class AwsSummary(msgspec.Struct, gc=False):
+    monthly_spend: float
+    monthly_budget: float
+    # Calendar month-to-date spend as a percentage of monthly_budget
+    percent_used: float
+    services: list[ServiceSpend]
+    filtered_days: int
+    # From Cost Explorer's own forecast; None when it is unavailable
+    forecast_month_spend: float | None = None
+    predicted_budget_breach: str | None = None
+    month_to_date: float | None = None
+
+
+class BudgetStatus(msgspec.Struct, gc=False):
+    id: int | None
+    name: str
+    scope: str
+    target: str
+    unit: str
+    monthly_amount: float
+    spent: float
+    percent_used: float
+    # Linear pacing: what should have been spent by today, and spent / expected
+    expected_to_date: float
+    pace: float
+    projected_month_end: float
+    status: str  # ok | warning | over_pace | exceeded
+
+
+class DateRange(msgspec.Struct, gc=False, rename={"from_": "from"}):
+    from_: str
+    to: str
+
+
+class DashboardSnapshot(msgspec.Struct, gc=False):
+    tools: list[ToolBalance]
+    aws: AwsSummary
+    alerts: list[Alert]
+    alert_count: int
+    last_updated: str
+    filtered_days: int
+    date_range: DateRange
+
+
+class SectionDiff(msgspec.Struct, gc=False):
+    """Entries keyed by name; `changed` maps name → {field: [old, new]} (or [old, new])."""
+    added: dict[str, Any]
+    removed: dict[str, Any]
+    changed: dict[str, Any]
+
+
+class DashboardDiff(msgspec.Struct, gc=False, rename={"from_": "from"}):
+    days: int
+    from_: str
+    to: str
+    tools: SectionDiff
+    services: SectionDiff
+    alerts: SectionDiff
+    aws: SectionDiff
+
+
+class ToolUsage(msgspec.Struct, gc=False):
+    name: str
+    credits_consumed: float
+    events_count: int
+    daily_avg_usage: float
+
+
+class WindowSummary(msgspec.Struct, gc=False):
+    days: int
+    date_range: DateRange
+    aws_spend: float
+    services: list[ServiceSpend]
+    tools: list[ToolUsage]
+
+
+class KeyBalance(msgspec.Struct, gc=False):
+    provider: str
+    key_id: str
+    team: str
+    credits_remaining: float | None
+    error: str | None = None
+    duration_ms: float | None = None
+    fetched_at: str | None = None
+
+
+class BalanceTotal(msgspec.Struct, gc=False):
+    name: str
+    credits_remaining: float
+    keys: int
+    failing_keys: int
+
+
+class ModelUsage(msgspec.Struct, gc=False):
+    model: str
+    input_tokens: int
+    output_tokens: int
+    cost_usd: float
+
+
+class UsageConsumer(msgspec.Struct, gc=False):
+    value: str
+    credits: float
+    events: int
+    share: float  # of the credits in the breakdown's window/tool
+
+
+class CostGroup(msgspec.Struct, gc=False):
+    keys: list[str]
+    amount: float
+
+
+class CostPeriod(msgspec.Struct, gc=False):
+    period: str
+    total: float
+    groups: list[CostGroup]
+
+
+class CostQueryResult(msgspec.Struct, gc=False):
+    start: str
+    end: str
+    granularity: str
+    group_by: list[str]
+    total: float
+    periods: list[CostPeriod]
+    ce_calls: int
+    cached_days: int
+
+
+class CostForecastPeriod(msgspec.Struct, gc=False):
+    period: str
+    mean: float
+    lower: float
+    upper: float
+
+
+class CostForecast(msgspec.Struct, gc=False):
+    start: str
+    end: str
+    granularity: str
+    total: float
+    lower: float
+    upper: float
+    periods: list[CostForecastPeriod]
+
+
+class ToolSimulation(msgspec.Struct, gc=False):
+    name: str
+    credits_remaining: float
+    mean_daily_usage: float
+    exhaustion_probability: float
+    # Percentile → exhaustion date; None when it falls beyond the horizon
+    exhaustion_dates: dict[str, str | None]
+
+
+class AwsSimulation(msgspec.Struct, gc=False):
+    monthly_budget: float
+    month_to_date: float
+    breach_probability_this_month: float
+    breach_probability: float
+    breach_dates: dict[str, str | None]
+    month_end_spend: dict[str, float]
+
+
+class SimulationResult(msgspec.Struct, gc=False):
+    scenarios: int
+    requested_scenarios: int
+    horizon_days: int
+    # True when the time budget ran out before every scenario finished
+    truncated: bool
+    elapsed_ms: float
+    tools: list[ToolSimulation]
+    aws: AwsSimulation
+
+
+def sort_alerts(alerts: list[Alert]) -> list[Alert]:
+    """Sort in place by severity (critical first) and return the list."""
+    alerts.sort(key=lambda a: SEVERITY_RANK[a.severity])
+    return alerts
+
+
+# One shared encoder: avoids rebuilding encoder state on every response
+encode_json = msgspec.json.Encoder().encode
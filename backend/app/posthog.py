@@ -1,8 +1,10 @@
 # app/posthog.py
-import requests
 import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from dotenv import load_dotenv
+from app.anomalies import observe_many
+from app.replay import http_post, stand_in
+from app.rollups import record_usage, refresh_usage_rollups
 
 load_dotenv()
 
@@ -10,6 +12,8 @@ POSTHOG_HOST = os.getenv("POSTHOG_HOST", "https://us.i.posthog.com")
 POSTHOG_API_KEY = os.getenv("POSTHOG_API_KEY")
 POSTHOG_PROJECT_ID = os.getenv("POSTHOG_PROJECT_ID")
 POSTHOG_PERSONAL_API_KEY = os.getenv("POSTHOG_PERSONAL_API_KEY")
+# Late events keep arriving, so every ingestion re-counts this many days
+POSTHOG_USAGE_LOOKBACK_DAYS = int(os.getenv("POSTHOG_USAGE_LOOKBACK_DAYS", "3"))
 
 
 # Exact mapping from your PRD
@@ -20,18 +24,26 @@ EVENT_CREDIT_MAPPING = {
     "data_fetched": ("Buyercaddy", 1),
 }
 
+def run_hogql(query: str) -> list[list]:
+    """Run a HogQL query and return its result rows. Raises on HTTP errors."""
+    project_id, personal_key = stand_in(POSTHOG_PROJECT_ID), stand_in(POSTHOG_PERSONAL_API_KEY)
+    url = f"{POSTHOG_HOST}/api/projects/{project_id}/query/"
+    headers = {
+        "Authorization": f"Bearer {personal_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {"query": {"kind": "HogQLQuery", "query": query}}
+    resp = http_post("posthog", url, secrets=(project_id, personal_key), headers=headers, json=payload, timeout=12)
+    resp.raise_for_status()
+    return resp.json().get("results", [])
+
+
 def fetch_posthog_event_count(event_name: str, days: int = 7) -> int:
     """Count occurrences of an event in last N days using HogQL."""
-    if not POSTHOG_API_KEY or not POSTHOG_PROJECT_ID:
+    if not stand_in(POSTHOG_API_KEY) or not stand_in(POSTHOG_PROJECT_ID):
         print(f"[PostHog] Missing config for '{event_name}'")
         return 0
 
-    url = f"{POSTHOG_HOST}/api/projects/{POSTHOG_PROJECT_ID}/query/"
-    headers = {
-        "Authorization": f"Bearer {POSTHOG_PERSONAL_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
     query = f"""
     SELECT count() as cnt
     FROM events
@@ -39,13 +51,9 @@ def fetch_posthog_event_count(event_name: str, days: int = 7) -> int:
       AND timestamp >= now() - INTERVAL '{days} DAY'
     """
 
-    payload = {"query": {"kind": "HogQLQuery", "query": query}}
-
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=12)
-        resp.raise_for_status()
-        result = resp.json()
-        count = result.get("results", [[0]])[0][0]
+        results = run_hogql(query)
+        count = results[0][0] if results else 0
         print(f"[PostHog] {event_name} count (last {days}d): {count}")
         return int(count)
     except Exception as e:
@@ -63,4 +71,66 @@ def get_real_daily_credit_usage(days: int = 7) -> dict[str, float]:
         daily_usage[tool] = daily_usage.get(tool, 0.0) + daily_credits
 
     print(f"[PostHog] Real daily credit usage (last {days}d): {daily_usage}")
-    return daily_usage
\ No newline at end of file
+    return daily_usage
+
+
+def fetch_daily_event_counts(days: int) -> dict[tuple[str, date], int] | None:
+    """Per-day counts of every mapped event over the last `days` UTC days, in one query."""
+    if not stand_in(POSTHOG_API_KEY) or not stand_in(POSTHOG_PROJECT_ID):
+        print("[PostHog] Missing config → daily usage not ingested")
+        return None
+
+    events = ", ".join(f"'{event}'" for event in EVENT_CREDIT_MAPPING)
+    query = f"""
+    SELECT event, toDate(timestamp, 'UTC') AS day, count() AS cnt
+    FROM events
+    WHERE event IN ({events})
+      AND timestamp >= toStartOfDay(now('UTC')) - INTERVAL {days - 1} DAY
+    GROUP BY event, day
+    """
+    return {
+        (event, date.fromisoformat(str(day)[:10])): int(cnt)
+        for event, day, cnt in run_hogql(query)
+    }
+
+
+def ingest_posthog_usage(cur, days: int = POSTHOG_USAGE_LOOKBACK_DAYS) -> list[date]:
+    """
+    Write per-day credits/events per tool into usage_history and feed the
+    anomaly detector. Returns the days that changed. The caller commits.
+    """
+    counts = fetch_daily_event_counts(days)
+    if counts is None:
+        return []
+
+    today = datetime.now(timezone.utc).date()
+    window = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+    totals: dict[tuple[str, date], list[float]] = {}
+    for day in window:
+        # Days without events are written as zero so downward revisions land too
+        for tool, _ in EVENT_CREDIT_MAPPING.values():
+            totals[(tool, day)] = [0.0, 0]
+    for (event, day), count in counts.items():
+        tool, credits_per = EVENT_CREDIT_MAPPING[event]
+        if (tool, day) in totals:
+            totals[(tool, day)][0] += count * credits_per
+            totals[(tool, day)][1] += count
+
+    changed = set()
+    for (tool, day), (credits, events) in totals.items():
+        if record_usage(cur, tool, day, credits, events):
+            changed.add(day)
+    observe_many(cur, [(f"usage:{tool}", day, credits) for (tool, day), (credits, _) in totals.items()])
+
+    print(f"[PostHog] Usage ingested for {days} days ({len(changed)} changed)")
+    return sorted(changed)
+
+
+def refresh_posthog_usage(cur) -> list[date]:
+    """
+    ingest_posthog_usage plus the usage_rollup buckets of the days that changed,
+    for callers outside the hourly job (which batches rollups in its own stage).
+    """
+    changed = ingest_posthog_usage(cur)
+    refresh_usage_rollups(cur, changed)
+    return changed
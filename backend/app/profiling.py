@@ -0,0 +1,169 @@
+# app/profiling.py
+import cProfile
+import functools
+import io
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fraction of requests run under cProfile; traces are kept only when slow
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "2000"))
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "20"))
+# Functions listed per stored trace (by cumulative time)
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "40"))
+# Unset → the /admin endpoints answer 404
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+PROFILE_HEADER = b"x-profile"
+
+
+class RequestProfile:
+    """Per-request state, shared with the endpoint's worker thread through a context variable."""
+
+    def __init__(self, sample: bool):
+        self.timings: dict[str, float] = {}
+        self.sample = sample
+        self.stats: str | None = None
+
+
+_current: ContextVar[RequestProfile | None] = ContextVar("request_profile", default=None)
+_traces: deque = deque(maxlen=PROFILE_RING_SIZE)
+_traces_lock = threading.Lock()
+_ids = itertools.count(1)
+# Only one profiler may be active per process (Python 3.12+ raises on a second one)
+_profiler_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into the request's Server-Timing breakdown; a no-op unless profiling."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        profile.timings[name] = profile.timings.get(name, 0.0) + elapsed
+
+
+def profiled(fn):
+    """
+    Run a sync endpoint under cProfile when its request was sampled. cProfile only
+    sees the calling thread, so this wraps the endpoint inside FastAPI's threadpool.
+    A sampled request that overlaps one already being profiled runs unprofiled.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None or not profile.sample or not _profiler_lock.acquire(blocking=False):
+            return fn(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+                profile.stats = out.getvalue()
+        finally:
+            _profiler_lock.release()
+    return wrapper
+
+
+def profiling_requested(scope) -> bool:
+    """`X-Profile: 1` header or `?profile=1`."""
+    if b"profile=1" in scope.get("query_string", b"").split(b"&"):
+        return True
+    return any(name == PROFILE_HEADER and value == b"1" for name, value in scope.get("headers", []))
+
+
+def server_timing(timings: dict[str, float], total_ms: float) -> str:
+    metrics = [f"{name};dur={ms:.1f}" for name, ms in timings.items()]
+    metrics.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(metrics)
+
+
+def recent_traces() -> list[dict]:
+    """Stored slow-request traces, newest first, without the profile text."""
+    with _traces_lock:
+        return [{k: v for k, v in t.items() if k != "profile"} for t in reversed(_traces)]
+
+
+def get_trace(trace_id: int) -> dict | None:
+    with _traces_lock:
+        return next((t for t in _traces if t["id"] == trace_id), None)
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-stage timing (Server-Timing response header) and sampled cProfile
+    capture of slow requests into a bounded ring buffer. Requests that are neither
+    flagged nor sampled pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        requested = profiling_requested(scope)
+        sample = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+        if not requested and not sample:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(sample)
+        token = _current.set(profile)
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if requested:
+                    total = (time.perf_counter() - started) * 1000
+                    header = server_timing(profile.timings, total).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _current.reset(token)
+            duration_ms = (time.perf_counter() - started) * 1000
+            if profile.stats is not None and duration_ms >= PROFILE_SLOW_MS:
+                self._store(scope, status["code"], duration_ms, profile)
+
+    @staticmethod
+    def _store(scope, status: int, duration_ms: float, profile: RequestProfile):
+        trace = {
+            "id": next(_ids),
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "status": status,
+            "captured_at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(duration_ms, 1),
+            "stages": {name: round(ms, 1) for name, ms in profile.timings.items()},
+            "profile": profile.stats,
+        }
+        with _traces_lock:
+            _traces.append(trace)
+        print(f"[Profiling] Captured slow {scope['path']} ({duration_ms:.0f}ms) as trace #{trace['id']}")
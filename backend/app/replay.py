@@ -0,0 +1,218 @@
+# app/replay.py
+import gzip
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+import boto3
+import requests
+from dotenv import load_dotenv
+from requests.structures import CaseInsensitiveDict
+
+load_dotenv()
+
+# live: call vendors; record: call vendors and append every exchange to a cassette;
+# replay: serve recorded exchanges only (no network, keys not needed)
+PROVIDER_HTTP_MODE = os.getenv("PROVIDER_HTTP_MODE", "live")
+PROVIDER_CASSETTE_DIR = os.getenv(
+    "PROVIDER_CASSETTE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cassettes"),
+)
+PROVIDER_LATENCY_PROFILE = os.getenv("PROVIDER_LATENCY_PROFILE", "none")
+
+# Replay delay = recorded latency × scale + extra ms
+LATENCY_PROFILES = {
+    "none": (0.0, 0.0),      # full speed
+    "recorded": (1.0, 0.0),  # as observed while recording
+    "slow": (3.0, 250.0),    # degraded vendor
+}
+
+REDACTED = "<redacted>"
+
+if PROVIDER_HTTP_MODE not in ("live", "record", "replay"):
+    raise ValueError(f"PROVIDER_HTTP_MODE must be live, record or replay, not {PROVIDER_HTTP_MODE!r}")
+if PROVIDER_LATENCY_PROFILE not in LATENCY_PROFILES:
+    raise ValueError(f"PROVIDER_LATENCY_PROFILE must be one of {sorted(LATENCY_PROFILES)}")
+
+_lock = threading.Lock()
+_cassettes: dict[str, "Cassette"] = {}
+
+
+class ReplayMiss(requests.ConnectionError):
+    """No recorded exchange for a request; providers treat it like a network failure."""
+
+
+def stand_in(secret: str | None) -> str | None:
+    """A configured secret, or in replay mode a placeholder so the real request path still runs."""
+    if secret:
+        return secret
+    return REDACTED if PROVIDER_HTTP_MODE == "replay" else None
+
+
+def _redact(text: str, secrets) -> str:
+    for secret in secrets:
+        if secret and secret != REDACTED:
+            text = text.replace(secret, REDACTED)
+    return text
+
+
+def _request_key(method: str, url: str, params, body) -> tuple[str, str]:
+    """(exact key, path key); the path key lets replay survive date-dependent query strings."""
+    pairs = params.items() if isinstance(params, dict) else params or []
+    query = urlencode(sorted((str(k), str(v)) for k, v in pairs))
+    payload = json.dumps(body, sort_keys=True, separators=(",", ":")) if body is not None else ""
+    path = f"{method.upper()} {url.split('?')[0]}"
+    return f"{path}?{query} {payload}", path
+
+
+class Cassette:
+    """Recorded exchanges of one provider, replayed in recorded order per request."""
+
+    def __init__(self, provider: str):
+        self.path = os.path.join(PROVIDER_CASSETTE_DIR, f"{provider}.jsonl.gz")
+        self.exact: dict[str, list[dict]] = {}
+        self.by_path: dict[str, list[dict]] = {}
+        self.positions: dict[str, int] = {}
+        if PROVIDER_HTTP_MODE == "replay" and os.path.exists(self.path):
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.exact.setdefault(entry["key"], []).append(entry)
+                    self.by_path.setdefault(entry["path"], []).append(entry)
+
+    def next(self, key: str, path: str) -> dict | None:
+        for index, k in ((self.exact, key), (self.by_path, path)):
+            entries = index.get(k)
+            if entries:
+                position = self.positions.get(k, 0)
+                self.positions[k] = position + 1
+                return entries[position % len(entries)]
+        return None
+
+    def append(self, entry: dict):
+        os.makedirs(PROVIDER_CASSETTE_DIR, exist_ok=True)
+        # Each append is its own gzip member; readers see one concatenated stream
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def _cassette(provider: str) -> Cassette:
+    if provider not in _cassettes:
+        _cassettes[provider] = Cassette(provider)
+    return _cassettes[provider]
+
+
+def reset():
+    """Forget loaded cassettes and replay positions (reloads from disk on next use)."""
+    with _lock:
+        _cassettes.clear()
+
+
+def _simulate_latency(elapsed_ms: float):
+    scale, extra_ms = LATENCY_PROFILES[PROVIDER_LATENCY_PROFILE]
+    delay = (elapsed_ms * scale + extra_ms) / 1000
+    if delay > 0:
+        time.sleep(delay)
+
+
+def _replayed_response(entry: dict, url: str) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = entry["status"]
+    resp.reason = entry.get("reason", "")
+    resp._content = entry["text"].encode("utf-8")
+    resp.encoding = "utf-8"
+    resp.headers = CaseInsensitiveDict({"Content-Type": entry.get("content_type", "application/json")})
+    resp.url = url
+    return resp
+
+
+def http_request(provider: str, method: str, url: str, secrets=(), **kwargs) -> requests.Response:
+    """
+    requests.request() at the provider boundary. `secrets` (API keys, org ids) are
+    replaced by REDACTED before anything is written, and request headers are never stored.
+    """
+    params, body = kwargs.get("params"), kwargs.get("json")
+    key, path = _request_key(
+        method,
+        _redact(url, secrets),
+        json.loads(_redact(json.dumps(params), secrets)) if params else None,
+        json.loads(_redact(json.dumps(body), secrets)) if body is not None else None,
+    )
+
+    if PROVIDER_HTTP_MODE == "replay":
+        with _lock:
+            entry = _cassette(provider).next(key, path)
+        if entry is None:
+            raise ReplayMiss(f"No recorded {provider} exchange for {path}")
+        _simulate_latency(entry["elapsed_ms"])
+        return _replayed_response(entry, url)
+
+    started = time.perf_counter()
+    resp = requests.request(method, url, **kwargs)
+    if PROVIDER_HTTP_MODE == "record":
+        entry = {
+            "key": key,
+            "path": path,
+            "status": resp.status_code,
+            "reason": resp.reason,
+            "content_type": resp.headers.get("Content-Type", "application/json"),
+            "text": _redact(resp.text, secrets),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        with _lock:
+            _cassette(provider).append(entry)
+    return resp
+
+
+def http_get(provider: str, url: str, secrets=(), **kwargs) -> requests.Response:
+    return http_request(provider, "GET", url, secrets, **kwargs)
+
+
+def http_post(provider: str, url: str, secrets=(), **kwargs) -> requests.Response:
+    return http_request(provider, "POST", url, secrets, **kwargs)
+
+
+class CostExplorerProxy:
+    """
+    Stands in for a boto3 Cost Explorer client: every operation (get_cost_and_usage,
+    get_cost_forecast, ...) is recorded or replayed like an HTTP exchange.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+
+    def __getattr__(self, operation: str):
+        def call(**params):
+            key, path = _request_key("CALL", operation, None, params)
+            if PROVIDER_HTTP_MODE == "replay":
+                with _lock:
+                    entry = _cassette("ce").next(key, path)
+                if entry is None:
+                    raise ReplayMiss(f"No recorded Cost Explorer {operation} call")
+                _simulate_latency(entry["elapsed_ms"])
+                return json.loads(entry["text"])
+
+            started = time.perf_counter()
+            response = getattr(self._client, operation)(**params)
+            recorded = {k: v for k, v in response.items() if k != "ResponseMetadata"}
+            entry = {
+                "key": key,
+                "path": path,
+                "status": 200,
+                "text": json.dumps(recorded, default=str),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+            with _lock:
+                _cassette("ce").append(entry)
+            return response
+        return call
+
+
+def ce_client(region_name: str):
+    """boto3 Cost Explorer client, wrapped for record/replay when enabled."""
+    if PROVIDER_HTTP_MODE == "live":
+        return boto3.client("ce", region_name=region_name)
+    if PROVIDER_HTTP_MODE == "replay":
+        return CostExplorerProxy()
+    return CostExplorerProxy(boto3.client("ce", region_name=region_name))
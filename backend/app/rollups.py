@@ -0,0 +1,158 @@
+# app/rollups.py
+from datetime import date, timedelta
+from typing import Iterable
+
+# Pre-aggregated buckets kept for usage_history and aws_spend.
+# Any N-day window is answered from at most a few dozen of these rows.
+PERIODS = ("day", "week", "month")
+
+
+def _bucket_start(day: date, period: str) -> date:
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())  # ISO weeks start on Monday
+    return day.replace(day=1)
+
+
+def _bucket_end(start: date, period: str) -> date:
+    """Exclusive end of the bucket starting at `start`."""
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _touched_buckets(days: Iterable[date]) -> set[tuple[str, date]]:
+    return {(period, _bucket_start(d, period)) for d in set(days) for period in PERIODS}
+
+
+def refresh_aws_rollups(cur, days: Iterable[date]) -> int:
+    """
+    Recompute only the day/week/month buckets that contain `days`.
+    Call after writing aws_spend rows, in the same transaction.
+    """
+    buckets = _touched_buckets(days)
+    for period, start in buckets:
+        cur.execute(
+            "DELETE FROM aws_spend_rollup WHERE period = %s AND period_start = %s",
+            (period, start),
+        )
+        cur.execute(
+            """
+            INSERT INTO aws_spend_rollup (period, period_start, service, amount)
+            SELECT %s, %s, service, SUM(amount)
+            FROM aws_spend
+            WHERE date >= %s AND date < %s
+            GROUP BY service
+            """,
+            (period, start, start, _bucket_end(start, period)),
+        )
+    return len(buckets)
+
+
+def refresh_usage_rollups(cur, days: Iterable[date]) -> int:
+    """Same as refresh_aws_rollups, for usage_history."""
+    buckets = _touched_buckets(days)
+    for period, start in buckets:
+        cur.execute(
+            "DELETE FROM usage_rollup WHERE period = %s AND period_start = %s",
+            (period, start),
+        )
+        cur.execute(
+            """
+            INSERT INTO usage_rollup (period, period_start, tool_name, credits_consumed, events_count)
+            SELECT %s, %s, tool_name, SUM(credits_consumed), SUM(events_count)
+            FROM usage_history
+            WHERE date >= %s AND date < %s
+            GROUP BY tool_name
+            """,
+            (period, start, start, _bucket_end(start, period)),
+        )
+    return len(buckets)
+
+
+def record_usage(cur, tool_name: str, day: date, credits_consumed: float, events_count: int) -> bool:
+    """
+    Upsert one usage_history row. Returns True when the row actually changed,
+    so callers only refresh rollups for days that moved.
+    """
+    cur.execute(
+        """
+        INSERT INTO usage_history (tool_name, date, credits_consumed, events_count)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (tool_name, date) DO UPDATE SET
+            credits_consumed = EXCLUDED.credits_consumed,
+            events_count = EXCLUDED.events_count
+        WHERE usage_history.credits_consumed IS DISTINCT FROM EXCLUDED.credits_consumed
+           OR usage_history.events_count IS DISTINCT FROM EXCLUDED.events_count
+        RETURNING date
+        """,
+        (tool_name, day, credits_consumed, events_count),
+    )
+    return cur.fetchone() is not None
+
+
+def window_buckets(start: date, end: date) -> list[tuple[str, date]]:
+    """
+    Cover [start, end] (inclusive) with the fewest buckets: whole months first,
+    then whole weeks, then single days at the edges.
+    """
+    buckets = []
+    day = start
+    while day <= end:
+        for period in ("month", "week", "day"):
+            bucket_end = _bucket_end(day, period)
+            if _bucket_start(day, period) == day and bucket_end - timedelta(days=1) <= end:
+                buckets.append((period, day))
+                day = bucket_end
+                break
+    return buckets
+
+
+def _window_rows(windows: list[int], today: date) -> tuple[list[int], list[str], list[date]]:
+    """Flatten every window's buckets into parallel arrays for unnest()."""
+    days_col, period_col, start_col = [], [], []
+    for days in windows:
+        for period, start in window_buckets(today - timedelta(days=days - 1), today):
+            days_col.append(days)
+            period_col.append(period)
+            start_col.append(start)
+    return days_col, period_col, start_col
+
+
+def aws_spend_by_window(cur, windows: list[int], today: date | None = None) -> dict[int, dict[str, float]]:
+    """{window_days: {service: amount}} for all windows in one query."""
+    today = today or date.today()
+    cur.execute(
+        """
+        SELECT w.days, r.service, SUM(r.amount)
+        FROM unnest(%s::int[], %s::text[], %s::date[]) AS w(days, period, period_start)
+        JOIN aws_spend_rollup r USING (period, period_start)
+        GROUP BY w.days, r.service
+        """,
+        _window_rows(windows, today),
+    )
+    result: dict[int, dict[str, float]] = {days: {} for days in windows}
+    for days, service, amount in cur.fetchall():
+        result[days][service] = float(amount or 0)
+    return result
+
+
+def usage_by_window(cur, windows: list[int], today: date | None = None) -> dict[int, dict[str, tuple[float, int]]]:
+    """{window_days: {tool_name: (credits_consumed, events_count)}} for all windows in one query."""
+    today = today or date.today()
+    cur.execute(
+        """
+        SELECT w.days, r.tool_name, SUM(r.credits_consumed), SUM(r.events_count)
+        FROM unnest(%s::int[], %s::text[], %s::date[]) AS w(days, period, period_start)
+        JOIN usage_rollup r USING (period, period_start)
+        GROUP BY w.days, r.tool_name
+        """,
+        _window_rows(windows, today),
+    )
+    result: dict[int, dict[str, tuple[float, int]]] = {days: {} for days in windows}
+    for days, tool_name, credits, events in cur.fetchall():
+        result[days][tool_name] = (float(credits or 0), int(events or 0))
+    return result
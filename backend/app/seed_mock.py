@@ -3,7 +3,7 @@
 # seed_mock.py (run from backend/ folder)
 
 from app.database import get_db_connection
-from app.mock_data import generate_mock_tools, generate_mock_aws_services
+from app.mocks import generate_mock_tools, generate_mock_aws_services
 from datetime import date
 conn = get_db_connection()
 cur = conn.cursor()
@@ -0,0 +1,128 @@
+# app/shared_cache.py
+import os
+import threading
+import time
+import psycopg
+from dotenv import load_dotenv
+from app.database import conninfo, write_cursor
+
+load_dotenv()
+
+# NOTIFY payloads on this channel: "set:<key>" or "del:<key prefix>"
+CACHE_CHANNEL = "shared_cache"
+# Reconnect delay for the LISTEN connection
+CACHE_LISTEN_RETRY_SECONDS = float(os.getenv("CACHE_LISTEN_RETRY_SECONDS", "5"))
+
+# key → (value, fresh_until); only trusted while the listener is connected
+_local: dict[str, tuple[bytes, float]] = {}
+# Bumped on every notification, so a read racing an update never caches the old value
+_generation = 0
+_local_lock = threading.Lock()
+_changed = threading.Condition(_local_lock)
+_listener: threading.Thread | None = None
+_listening = threading.Event()
+
+
+def _on_notify(payload: str):
+    global _generation
+    action, _, key = payload.partition(":")
+    with _changed:
+        _generation += 1
+        if action == "del":
+            for k in [k for k in _local if k.startswith(key)]:
+                del _local[k]
+        else:
+            _local.pop(key, None)
+        _changed.notify_all()
+
+
+def _listen():
+    while True:
+        try:
+            with psycopg.connect(conninfo(), autocommit=True) as conn:
+                conn.execute(f"LISTEN {CACHE_CHANNEL}")
+                _listening.set()
+                print("[Cache] Listening for invalidations")
+                for notify in conn.notifies():
+                    _on_notify(notify.payload)
+        except Exception as e:
+            print(f"[Cache] Listener lost: {e} → retrying in {CACHE_LISTEN_RETRY_SECONDS:.0f}s")
+        # Invalidations may have been missed: stop trusting local copies
+        _listening.clear()
+        _on_notify("del:")
+        time.sleep(CACHE_LISTEN_RETRY_SECONDS)
+
+
+def start_listener():
+    """Start the background LISTEN thread once per process (API replicas and workers)."""
+    global _listener
+    with _local_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, name="shared-cache-listener", daemon=True)
+            _listener.start()
+
+
+def cache_get(key: str) -> tuple[bytes, bool] | None:
+    """
+    (value, fresh) for a key, or None if nothing was ever stored. Served from this
+    process's copy while the listener guarantees it is current, else from the table.
+    """
+    start_listener()
+    with _local_lock:
+        entry = _local.get(key) if _listening.is_set() else None
+        generation = _generation
+    if entry is not None:
+        return entry[0], time.time() < entry[1]
+
+    with write_cursor() as cur:
+        cur.execute("""
+            SELECT value, EXTRACT(EPOCH FROM expires_at)
+            FROM shared_cache
+            WHERE key = %s
+        """, (key,))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    value, expires_at = bytes(row[0]), float(row[1])
+    if _listening.is_set():
+        with _local_lock:
+            if generation == _generation:
+                _local[key] = (value, expires_at)
+    return value, time.time() < expires_at
+
+
+def cache_put(cur, key: str, value: bytes, ttl_seconds: float):
+    """Store a computed value for every replica. The caller commits; replicas are notified on commit."""
+    cur.execute("""
+        INSERT INTO shared_cache (key, value, version, computed_at, expires_at)
+        VALUES (%s, %s, 1, now(), now() + make_interval(secs => %s))
+        ON CONFLICT (key) DO UPDATE SET
+            value = EXCLUDED.value,
+            version = shared_cache.version + 1,
+            computed_at = EXCLUDED.computed_at,
+            expires_at = EXCLUDED.expires_at
+    """, (key, value, ttl_seconds))
+    cur.execute("SELECT pg_notify(%s, %s)", (CACHE_CHANNEL, f"set:{key}"))
+
+
+def cache_invalidate(cur, prefix: str):
+    """Mark every entry under `prefix` stale (still served until recomputed). The caller commits."""
+    cur.execute(
+        "UPDATE shared_cache SET expires_at = LEAST(expires_at, now()) WHERE key LIKE %s",
+        (prefix.replace("%", r"\%").replace("_", r"\_") + "%",),
+    )
+    cur.execute("SELECT pg_notify(%s, %s)", (CACHE_CHANNEL, f"del:{prefix}"))
+
+
+def wait_for(key: str, timeout: float) -> bytes | None:
+    """Block until a value for `key` exists (woken by NOTIFY, polling as a fallback)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        found = cache_get(key)
+        if found is not None:
+            return found[0]
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        with _changed:
+            _changed.wait(min(remaining, 0.5))
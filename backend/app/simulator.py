@@ -0,0 +1,272 @@
+# app/simulator.py
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from typing import Annotated
+import numpy as np
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+from app.model import AwsSimulation, SimulationResult, ToolSimulation
+
+load_dotenv()
+
+# Scenarios per shard: bounds memory to ~shard × horizon floats per array
+SIMULATOR_SHARD_SIZE = int(os.getenv("SIMULATOR_SHARD_SIZE", "5000"))
+# Below this many scenarios the pool's overhead outweighs the parallelism
+SIMULATOR_POOL_MIN_SCENARIOS = int(os.getenv("SIMULATOR_POOL_MIN_SCENARIOS", "20000"))
+SIMULATOR_WORKERS = int(os.getenv("SIMULATOR_WORKERS", str(os.cpu_count() or 1)))
+SIMULATOR_TIME_BUDGET_SECONDS = float(os.getenv("SIMULATOR_TIME_BUDGET_SECONDS", "5"))
+# Lambda has no /dev/shm, so multiprocessing cannot run there
+SIMULATOR_USE_POOL = os.getenv("SIMULATOR_USE_POOL", "0" if os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "1") == "1"
+
+_executor: ProcessPoolExecutor | None = None
+
+
+class ToolScenario(BaseModel):
+    weekly_growth: float = Field(0.0, ge=-0.99, description="0.2 = usage grows 20% per week")
+    top_up: float = Field(0.0, ge=0, description="Credits added on top_up_day")
+    top_up_day: int = Field(0, ge=0, description="Days from today")
+
+
+class SimulationRequest(BaseModel):
+    scenarios: int = Field(10000, ge=100, le=500000)
+    horizon_days: int = Field(90, ge=1, le=365)
+    history_days: int = Field(90, ge=7, le=400)
+    tools: dict[str, ToolScenario] = {}
+    # Weekly growth for all AWS services, overridable per service name
+    aws_weekly_growth: float = Field(0.0, ge=-0.99)
+    aws_service_growth: dict[str, float] = {}
+    monthly_budget: float | None = Field(None, gt=0)
+    percentiles: list[Annotated[float, Field(ge=0, le=100)]] = Field([10, 50, 90], min_length=1, max_length=9)
+    time_budget_seconds: float | None = Field(None, gt=0, le=30)
+    seed: int | None = None
+
+
+def load_history(cur, history_days: int, today: date) -> dict:
+    """Daily usage per tool, daily spend per AWS service, current balances and month-to-date spend."""
+    since = today - timedelta(days=history_days)
+
+    cur.execute("""
+        SELECT COALESCE(t.name, p.tool_name),
+               COALESCE(p.last_credits, t.credits_remaining, 0),
+               COALESCE(p.burn_rate_per_day, t.daily_avg_usage, 0)
+        FROM tools t
+        FULL OUTER JOIN balance_poll_state p ON p.tool_name = t.name
+    """)
+    balances = {name: (float(credits), float(burn)) for name, credits, burn in cur.fetchall()}
+
+    cur.execute("""
+        SELECT tool_name, date, SUM(credits_consumed)
+        FROM usage_history
+        WHERE date >= %s AND date < %s
+        GROUP BY tool_name, date
+    """, (since, today))
+    usage: dict[str, dict[date, float]] = {}
+    for tool, day, credits in cur.fetchall():
+        usage.setdefault(tool, {})[day] = float(credits or 0)
+
+    cur.execute("""
+        SELECT service, date, SUM(amount)
+        FROM aws_spend
+        WHERE date >= %s AND date < %s
+        GROUP BY service, date
+    """, (since, today))
+    spend: dict[str, dict[date, float]] = {}
+    for service, day, amount in cur.fetchall():
+        spend.setdefault(service, {})[day] = float(amount or 0)
+
+    cur.execute(
+        "SELECT COALESCE(SUM(amount), 0) FROM aws_spend WHERE date >= %s AND date < %s",
+        (today.replace(day=1), today),
+    )
+    month_to_date = float(cur.fetchone()[0])
+    return {"balances": balances, "usage": usage, "spend": spend, "month_to_date": month_to_date}
+
+
+def _daily_series(by_day: dict[date, float], end: date) -> np.ndarray:
+    """Dense daily values from the first observed day up to yesterday; gaps are zero usage."""
+    start = min(by_day)
+    return np.array([by_day.get(start + timedelta(days=i), 0.0) for i in range((end - start).days)])
+
+
+def build_inputs(history: dict, request: SimulationRequest, monthly_budget: float, today: date) -> dict:
+    """Arrays shipped to every shard (small: one row per historical day)."""
+    horizon = request.horizon_days
+    weeks = np.arange(horizon) / 7
+
+    tools = {}
+    for name, (credits, burn) in sorted(history["balances"].items()):
+        by_day = history["usage"].get(name)
+        # No usage history yet: fall back to the observed burn rate as a constant
+        samples = _daily_series(by_day, today) if by_day else np.array([burn])
+        scenario = request.tools.get(name, ToolScenario())
+        tools[name] = {
+            "credits": credits,
+            "samples": samples,
+            "growth": (1 + scenario.weekly_growth) ** weeks,
+            "top_up": scenario.top_up,
+            "top_up_day": min(scenario.top_up_day, horizon),
+        }
+
+    services = sorted(history["spend"])
+    if services:
+        start = min(min(by_day) for by_day in history["spend"].values())
+        n_days = (today - start).days
+        spend = np.zeros((n_days, len(services)))
+        for j, service in enumerate(services):
+            for day, amount in history["spend"][service].items():
+                spend[(day - start).days, j] = amount
+    else:
+        spend = np.zeros((1, 0))
+    growth = np.stack([
+        (1 + request.aws_service_growth.get(s, request.aws_weekly_growth)) ** weeks for s in services
+    ], axis=1) if services else np.ones((horizon, 0))
+
+    # Per simulated day: index (in a zero-padded cumsum) of its month's first day
+    days = [today + timedelta(days=i) for i in range(horizon)]
+    month_start = np.zeros(horizon, dtype=np.int64)
+    for i in range(1, horizon):
+        month_start[i] = i if days[i].month != days[i - 1].month else month_start[i - 1]
+    carried = np.where(month_start == 0, history["month_to_date"], 0.0)
+    month_end = next((i for i in range(horizon) if month_start[i] != 0), horizon) - 1
+
+    return {
+        "horizon": horizon,
+        "tools": tools,
+        "spend": spend,
+        "spend_growth": growth,
+        "month_start": month_start,
+        "carried": carried,
+        "month_end": month_end,
+        "budget": monthly_budget,
+    }
+
+
+def simulate_shard(inputs: dict, n: int, seed) -> dict[str, np.ndarray]:
+    """
+    Run `n` bootstrap scenarios: each simulated day draws a historical day
+    (whole days for AWS, keeping services correlated), scaled by growth.
+    Returns exhaustion/breach day per scenario (horizon = never).
+    """
+    rng = np.random.default_rng(seed)
+    horizon = inputs["horizon"]
+    out = {}
+
+    for name, tool in inputs["tools"].items():
+        draws = rng.choice(tool["samples"], size=(n, horizon)) * tool["growth"]
+        balance = tool["credits"] - np.cumsum(draws, axis=1)
+        if tool["top_up"]:
+            balance[:, tool["top_up_day"]:] += tool["top_up"]
+        hit = balance <= 0
+        out[f"tool:{name}"] = np.where(hit.any(axis=1), hit.argmax(axis=1), horizon)
+
+    spend, growth = inputs["spend"], inputs["spend_growth"]
+    idx = rng.integers(0, spend.shape[0], size=(n, horizon))
+    daily = np.zeros((n, horizon))
+    for j in range(spend.shape[1]):
+        daily += spend[idx, j] * growth[:, j]
+    cum = np.concatenate([np.zeros((n, 1)), np.cumsum(daily, axis=1)], axis=1)
+    month_spend = cum[:, 1:] - cum[:, inputs["month_start"]] + inputs["carried"]
+    breach = month_spend > inputs["budget"]
+    out["aws:breach"] = np.where(breach.any(axis=1), breach.argmax(axis=1), horizon)
+    out["aws:month_end"] = month_spend[:, inputs["month_end"]]
+    return out
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Forking the API process would copy its DB pools, locks and threads into the
+        # workers; a fork server starts them from a clean interpreter instead
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _executor = ProcessPoolExecutor(max_workers=SIMULATOR_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _executor
+
+
+def _run_shards(inputs: dict, shards: list[tuple[int, np.random.SeedSequence]], deadline: float) -> tuple[list[dict], bool]:
+    """Results of the shards finished before `deadline`, and whether a process pool was used."""
+    global _executor
+    if SIMULATOR_USE_POOL and SIMULATOR_WORKERS > 1 and sum(n for n, _ in shards) >= SIMULATOR_POOL_MIN_SCENARIOS:
+        try:
+            futures = [_pool().submit(simulate_shard, inputs, n, seed) for n, seed in shards]
+            done, pending = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+            if not done:
+                # Over budget already: still answer with the first shard to finish
+                done, pending = wait(futures, return_when=FIRST_COMPLETED)
+            for f in pending:
+                f.cancel()
+            return [f.result() for f in done], True
+        except (BrokenProcessPool, OSError, NotImplementedError) as e:
+            print(f"[Simulator] Process pool unavailable: {e} → running in-process")
+            _executor = None
+
+    results = []
+    for n, seed in shards:
+        if results and time.monotonic() >= deadline:
+            break
+        results.append(simulate_shard(inputs, n, seed))
+    return results, False
+
+
+def run_simulation(history: dict, request: SimulationRequest, monthly_budget: float, today: date) -> SimulationResult:
+    """Simulate from load_history() output; needs no database connection, so callers release theirs first."""
+    started = time.monotonic()
+    budget_seconds = request.time_budget_seconds or SIMULATOR_TIME_BUDGET_SECONDS
+    budget = request.monthly_budget or monthly_budget
+
+    inputs = build_inputs(history, request, budget, today)
+
+    sizes = [SIMULATOR_SHARD_SIZE] * (request.scenarios // SIMULATOR_SHARD_SIZE)
+    if request.scenarios % SIMULATOR_SHARD_SIZE:
+        sizes.append(request.scenarios % SIMULATOR_SHARD_SIZE)
+    seeds = np.random.SeedSequence(request.seed).spawn(len(sizes))
+    results, pooled = _run_shards(inputs, list(zip(sizes, seeds)), started + budget_seconds)
+
+    merged = {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+    completed = len(next(iter(merged.values())))
+    horizon = inputs["horizon"]
+    qs = request.percentiles
+
+    def dates(days: np.ndarray) -> dict[str, str | None]:
+        values = np.percentile(days, qs, method="inverted_cdf")
+        return {
+            f"p{q:g}": (today + timedelta(days=int(d))).isoformat() if d < horizon else None
+            for q, d in zip(qs, values)
+        }
+
+    tools = [
+        ToolSimulation(
+            name=name,
+            credits_remaining=tool["credits"],
+            mean_daily_usage=round(float(tool["samples"].mean()), 2),
+            exhaustion_probability=round(float((merged[f"tool:{name}"] < horizon).mean()), 4),
+            exhaustion_dates=dates(merged[f"tool:{name}"])
+        )
+        for name, tool in inputs["tools"].items()
+    ]
+
+    breach = merged["aws:breach"]
+    month_end = merged["aws:month_end"]
+    aws = AwsSimulation(
+        monthly_budget=budget,
+        month_to_date=round(float(inputs["carried"][0]), 2),
+        breach_probability_this_month=round(float((breach <= inputs["month_end"]).mean()), 4),
+        breach_probability=round(float((breach < horizon).mean()), 4),
+        breach_dates=dates(breach),
+        month_end_spend={f"p{q:g}": round(float(v), 2) for q, v in zip(qs, np.percentile(month_end, qs))}
+    )
+
+    elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+    print(f"[Simulator] {completed}/{request.scenarios} scenarios in {elapsed_ms}ms ({'pool' if pooled else 'in-process'})")
+    return SimulationResult(
+        scenarios=completed,
+        requested_scenarios=request.scenarios,
+        horizon_days=horizon,
+        truncated=completed < request.scenarios,
+        elapsed_ms=elapsed_ms,
+        tools=tools,
+        aws=aws
+    )
@@ -0,0 +1,231 @@
+# app/snapshots.py
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any
+import msgspec
+from dotenv import load_dotenv
+from app.model import (
+    Alert,
+    AwsSummary,
+    DashboardDiff,
+    DashboardSnapshot,
+    DateRange,
+    SectionDiff,
+    ServiceSpend,
+    ToolBalance,
+    encode_json,
+    sort_alerts
+)
+
+load_dotenv()
+
+# Only this dashboard window is recorded (the one alerts are computed on)
+SNAPSHOT_DAYS = int(os.getenv("SNAPSHOT_DAYS", "30"))
+# A full keyframe every N snapshots bounds how many deltas a lookup replays
+SNAPSHOT_KEYFRAME_EVERY = int(os.getenv("SNAPSHOT_KEYFRAME_EVERY", "24"))
+# Changes within this many minutes of the last snapshot are not recorded
+SNAPSHOT_MIN_INTERVAL_MINUTES = float(os.getenv("SNAPSHOT_MIN_INTERVAL_MINUTES", "10"))
+
+# Diffed sections; "meta" only carries what is needed to rebuild the payload
+DIFF_SECTIONS = ("tools", "services", "alerts", "aws")
+
+# Keyframes and deltas are both {section: {...}}
+_decode = msgspec.json.Decoder(dict[str, dict[str, Any]]).decode
+
+# days → (snapshot id, state) of the last snapshot this process wrote or read
+_latest: dict[int, tuple[int, dict]] = {}
+
+
+def _alert_key(alert: Alert) -> str:
+    return f"{alert.severity.value}|{alert.affected}|{alert.message}"
+
+
+def snapshot_state(snapshot: DashboardSnapshot) -> dict[str, dict[str, Any]]:
+    """Keyed form of a dashboard payload, so consecutive states diff per entry."""
+    aws = msgspec.to_builtins(snapshot.aws)
+    del aws["services"]
+    return {
+        "meta": {
+            "last_updated": snapshot.last_updated,
+            "filtered_days": snapshot.filtered_days,
+            "from": snapshot.date_range.from_,
+            "to": snapshot.date_range.to,
+        },
+        "aws": aws,
+        "tools": {t.name: msgspec.to_builtins(t) for t in snapshot.tools},
+        "services": {s.service: s.amount for s in snapshot.aws.services},
+        "alerts": {_alert_key(a): msgspec.to_builtins(a) for a in snapshot.alerts},
+    }
+
+
+def state_snapshot(state: dict[str, dict[str, Any]]) -> DashboardSnapshot:
+    """Rebuild the dashboard payload from its keyed form."""
+    meta = state["meta"]
+    services = sorted(
+        (ServiceSpend(service=name, amount=amount) for name, amount in state.get("services", {}).items()),
+        key=lambda s: -s.amount
+    )
+    alerts = sort_alerts([msgspec.convert(a, Alert) for a in state.get("alerts", {}).values()])
+    return DashboardSnapshot(
+        tools=[msgspec.convert(t, ToolBalance) for _, t in sorted(state.get("tools", {}).items())],
+        aws=msgspec.convert({**state["aws"], "services": msgspec.to_builtins(services)}, AwsSummary),
+        alerts=alerts,
+        alert_count=len(alerts),
+        last_updated=meta["last_updated"],
+        filtered_days=meta["filtered_days"],
+        date_range=DateRange(from_=meta["from"], to=meta["to"])
+    )
+
+
+def compute_delta(old: dict, new: dict) -> dict[str, dict[str, Any]]:
+    """Per section: entries set (added or changed) and keys deleted. Empty when nothing changed."""
+    delta = {}
+    for section, entries in new.items():
+        before = old.get(section, {})
+        changed = {k: v for k, v in entries.items() if before.get(k, msgspec.UNSET) != v}
+        removed = [k for k in before if k not in entries]
+        if changed or removed:
+            delta[section] = {"set": changed, "del": removed}
+    return delta
+
+
+def apply_delta(state: dict, delta: dict) -> dict:
+    """Return the state after `delta`; `state` itself is not modified."""
+    result = dict(state)
+    for section, change in delta.items():
+        entries = dict(result.get(section, {}))
+        for k in change["del"]:
+            entries.pop(k, None)
+        entries.update(change["set"])
+        result[section] = entries
+    return result
+
+
+def _pack(obj) -> bytes:
+    return zlib.compress(encode_json(obj))
+
+
+def _load_chain(cur, days: int, at: datetime | None) -> tuple[int, datetime, dict] | None:
+    """
+    Latest snapshot at or before `at` (None → newest): replays its keyframe and
+    the deltas after it in one query. Returns (id, captured_at, state).
+    """
+    cur.execute("""
+        WITH target AS (
+            SELECT id, keyframe_id
+            FROM dashboard_snapshots
+            WHERE days = %s AND (%s::timestamptz IS NULL OR captured_at <= %s)
+            ORDER BY captured_at DESC, id DESC
+            LIMIT 1
+        )
+        SELECT s.id, s.captured_at, s.is_keyframe, s.payload
+        FROM dashboard_snapshots s, target t
+        WHERE s.days = %s AND s.id BETWEEN t.keyframe_id AND t.id
+        ORDER BY s.id
+    """, (days, at, at, days))
+    rows = cur.fetchall()
+    if not rows:
+        return None
+
+    state = None
+    for snapshot_id, captured_at, is_keyframe, payload in rows:
+        data = zlib.decompress(bytes(payload))
+        state = _decode(data) if is_keyframe else apply_delta(state, _decode(data))
+    return snapshot_id, captured_at, state
+
+
+def record_snapshot(cur, snapshot: DashboardSnapshot, now: datetime | None = None) -> bool:
+    """
+    Store a dashboard state as a delta against the previous one (or a keyframe).
+    Skips unchanged states and states within the minimum interval.
+    Returns True when a row was written. The caller commits.
+    """
+    now = now or datetime.now(timezone.utc)
+    days = snapshot.filtered_days
+    state = snapshot_state(snapshot)
+
+    # Serialize writers per window so every delta applies to its predecessor
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('dashboard_snapshots'), %s)", (days,))
+    cur.execute("""
+        SELECT s.id, s.captured_at, s.keyframe_id,
+               (SELECT COUNT(*) FROM dashboard_snapshots c WHERE c.days = s.days AND c.id > s.keyframe_id)
+        FROM dashboard_snapshots s
+        WHERE s.days = %s
+        ORDER BY s.id DESC
+        LIMIT 1
+    """, (days,))
+    last = cur.fetchone()
+
+    keyframe_id = None
+    if last is not None:
+        last_id, last_at, keyframe_id, deltas = last
+        if now - last_at < timedelta(minutes=SNAPSHOT_MIN_INTERVAL_MINUTES):
+            return False
+        cached = _latest.get(days)
+        if cached is not None and cached[0] == last_id:
+            previous = cached[1]
+        else:
+            previous = _load_chain(cur, days, None)[2]
+        delta = compute_delta(previous, state)
+        if not delta.keys() - {"meta"}:
+            return False
+        if deltas + 1 >= SNAPSHOT_KEYFRAME_EVERY:
+            keyframe_id = None
+
+    cur.execute("SELECT nextval(pg_get_serial_sequence('dashboard_snapshots', 'id'))")
+    snapshot_id = cur.fetchone()[0]
+    is_keyframe = keyframe_id is None
+    cur.execute("""
+        INSERT INTO dashboard_snapshots (id, days, captured_at, is_keyframe, keyframe_id, payload)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, (
+        snapshot_id, days, now, is_keyframe,
+        snapshot_id if is_keyframe else keyframe_id,
+        _pack(state if is_keyframe else delta)
+    ))
+    _latest[days] = (snapshot_id, state)
+    print(f"[Snapshots] {days}d: stored {'keyframe' if is_keyframe else 'delta'} #{snapshot_id}")
+    return True
+
+
+def snapshot_at(cur, at: datetime | None, days: int = SNAPSHOT_DAYS) -> tuple[datetime, DashboardSnapshot] | None:
+    """The dashboard as recorded at `at` (latest snapshot not after it)."""
+    found = _load_chain(cur, days, at)
+    if found is None:
+        return None
+    _, captured_at, state = found
+    return captured_at, state_snapshot(state)
+
+
+def _section_diff(before: dict, after: dict) -> SectionDiff:
+    changed = {}
+    for k in before.keys() & after.keys():
+        old, new = before[k], after[k]
+        if old == new:
+            continue
+        if isinstance(old, dict) and isinstance(new, dict):
+            changed[k] = {f: [old.get(f), new.get(f)] for f in old.keys() | new.keys() if old.get(f) != new.get(f)}
+        else:
+            changed[k] = [old, new]
+    return SectionDiff(
+        added={k: after[k] for k in after.keys() - before.keys()},
+        removed={k: before[k] for k in before.keys() - after.keys()},
+        changed=changed
+    )
+
+
+def diff_snapshots(cur, start: datetime, end: datetime | None, days: int = SNAPSHOT_DAYS) -> DashboardDiff | None:
+    """What changed between the dashboard as recorded at `start` and at `end` (None → latest)."""
+    before = _load_chain(cur, days, start)
+    after = _load_chain(cur, days, end)
+    if before is None or after is None:
+        return None
+    (_, from_at, old), (_, to_at, new) = before, after
+    return DashboardDiff(
+        days=days,
+        from_=from_at.isoformat(),
+        to=to_at.isoformat(),
+        # A keyframe written before a section existed simply has nothing in it
+        **{section: _section_diff(old.get(section, {}), new.get(section, {})) for section in DIFF_SECTIONS}
+    )
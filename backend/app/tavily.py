@@ -1,21 +1,24 @@
-import requests
 import os
 from dotenv import load_dotenv
+from app.mocks import TAVILY_MOCK_CREDITS
+from app.replay import http_get, stand_in
 
 load_dotenv()
 
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 
-def get_tavily_remaining_credits() -> float:
-    if not TAVILY_API_KEY:
-        print("[Tavily] No API key in .env → fallback to mock 2800")
-        return 2800.0
+def fetch_tavily_balance(api_key: str | None = None) -> float | None:
+    """Real remaining credits, or None when the key is missing or the call fails."""
+    api_key = api_key or stand_in(TAVILY_API_KEY)
+    if not api_key:
+        print("[Tavily] No API key in .env")
+        return None
 
     url = "https://api.tavily.com/usage"
-    headers = {"Authorization": f"Bearer {TAVILY_API_KEY}"}
+    headers = {"Authorization": f"Bearer {api_key}"}
 
     try:
-        resp = requests.get(url, headers=headers, timeout=8)
+        resp = http_get("tavily", url, secrets=(api_key,), headers=headers, timeout=8)
         print(f"[Tavily] Status code: {resp.status_code}")
         print(f"[Tavily] Response preview: {resp.text[:300]}...")
 
@@ -31,5 +34,13 @@ def get_tavily_remaining_credits() -> float:
         return float(remaining)
 
     except Exception as e:
-        print(f"[Tavily] Error: {str(e)} → fallback to mock 2800")
-        return 2800.0
\ No newline at end of file
+        print(f"[Tavily] Error: {str(e)}")
+        return None
+
+
+def get_tavily_remaining_credits() -> float:
+    remaining = fetch_tavily_balance()
+    if remaining is None:
+        print(f"[Tavily] → fallback to mock {TAVILY_MOCK_CREDITS:.0f}")
+        return TAVILY_MOCK_CREDITS
+    return remaining
\ No newline at end of file
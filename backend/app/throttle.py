@@ -0,0 +1,218 @@
+# app/throttle.py
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from app.database import write_cursor
+from app.profiling import profiling_requested
+from app.ratelimit import TokenBucket
+
+load_dotenv()
+
+# memory | postgres | off. The Postgres backend shares limits across Lambda instances.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Proxies in front of the app that append to X-Forwarded-For (1 behind an ALB).
+# 0 → the header is ignored and the socket peer is the client.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+# How often one instance sweeps rate_limit_buckets for idle clients
+RATE_LIMIT_CLEANUP_SECONDS = float(os.getenv("RATE_LIMIT_CLEANUP_SECONDS", "300"))
+
+# Endpoints that can hit Cost Explorer, vendor APIs or heavy aggregates
+EXPENSIVE_PATHS = frozenset({
+    "/dashboard",
+    "/dashboard/windows",
+    "/export",
+    "/alerts",
+    "/balances",
+    "/anthropic/usage",
+    "/aws/costs",
+    "/aws/forecast",
+    "/simulate",
+})
+
+
+class MemoryRateLimiter:
+    """Per-client token buckets in this process; least recently seen clients are evicted."""
+
+    def __init__(self, per_minute: float, burst: float, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, client: str) -> float:
+        """0.0 if the request may proceed, else seconds until it would be allowed."""
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+        return bucket.try_acquire()
+
+
+class PostgresRateLimiter:
+    """
+    Token buckets in rate_limit_buckets, shared by every instance. The row is
+    locked for the refill-and-take, so concurrent requests cannot overspend.
+    Fails open when the database is unavailable.
+    """
+
+    def __init__(self, per_minute: float, burst: float):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self._cleaned_at = time.monotonic()
+
+    def _cleanup(self, cur):
+        """A bucket idle long enough to be full again is the same as no row, so drop it."""
+        if time.monotonic() - self._cleaned_at < RATE_LIMIT_CLEANUP_SECONDS:
+            return
+        self._cleaned_at = time.monotonic()
+        cur.execute(
+            "DELETE FROM rate_limit_buckets WHERE updated_at < now() - make_interval(secs => %s)",
+            (self.burst / self.rate,),
+        )
+        if cur.rowcount:
+            print(f"[RateLimit] Dropped {cur.rowcount} idle client buckets")
+
+    def _take(self, client: str) -> float:
+        with write_cursor() as cur:
+            self._cleanup(cur)
+            cur.execute("""
+                INSERT INTO rate_limit_buckets (client_key, tokens, updated_at)
+                VALUES (%s, %s, now())
+                ON CONFLICT (client_key) DO NOTHING
+            """, (client, self.burst))
+            cur.execute("""
+                SELECT LEAST(%s, tokens + EXTRACT(EPOCH FROM now() - updated_at) * %s)
+                FROM rate_limit_buckets
+                WHERE client_key = %s
+                FOR UPDATE
+            """, (self.burst, self.rate, client))
+            tokens = float(cur.fetchone()[0])
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            cur.execute("""
+                UPDATE rate_limit_buckets SET tokens = %s, updated_at = now()
+                WHERE client_key = %s
+            """, (tokens - 1 if wait == 0.0 else tokens, client))
+        return wait
+
+    async def take(self, client: str) -> float:
+        try:
+            return await run_in_threadpool(self._take, client)
+        except Exception as e:
+            print(f"[RateLimit] Postgres backend error: {e} → allowing request")
+            return 0.0
+
+
+def build_rate_limiter():
+    if RATE_LIMIT_BACKEND == "off":
+        return None
+    if RATE_LIMIT_BACKEND == "postgres":
+        return PostgresRateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+    return MemoryRateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+
+
+def client_key(scope) -> str:
+    """
+    The address the outermost trusted proxy saw: TRUSTED_PROXY_HOPS entries from the
+    right of X-Forwarded-For. Hops further left are client-supplied and never used.
+    Falls back to the socket peer.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        hops = [
+            hop.strip()
+            for name, value in scope.get("headers", [])
+            if name == b"x-forwarded-for"
+            for hop in value.decode("latin-1").split(",")
+        ]
+        if len(hops) >= TRUSTED_PROXY_HOPS and hops[-TRUSTED_PROXY_HOPS]:
+            return hops[-TRUSTED_PROXY_HOPS]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class ThrottleMiddleware:
+    """
+    ASGI middleware for EXPENSIVE_PATHS:
+    - per-client rate limit, 429 with Retry-After when exceeded
+    - identical in-flight GETs (same path and query) share one computation;
+      followers receive a copy of the leader's response
+    """
+
+    def __init__(self, app, limiter=None, paths=EXPENSIVE_PATHS):
+        self.app = app
+        self.limiter = limiter
+        self.paths = paths
+        self._inflight: dict[tuple, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        if self.limiter is not None:
+            wait = await self.limiter.take(client_key(scope))
+            if wait > 0:
+                await self._too_many_requests(send, wait)
+                return
+
+        # A profiled request must run itself: a shared response would carry another request's timings
+        if scope["method"] != "GET" or profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        query = scope.get("query_string", b"").decode("latin-1")
+        key = (scope["path"], "&".join(sorted(query.split("&"))) if query else "")
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            status, headers, body = await asyncio.shield(inflight)
+            await self._replay(send, status, headers, body)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure is not logged twice
+            future.exception()
+            raise
+        else:
+            future.set_result((response["status"], response["headers"], b"".join(response["body"])))
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    async def _replay(send, status, headers, body):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _too_many_requests(send, wait: float):
+        await ThrottleMiddleware._replay(send, 429, [
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(math.ceil(wait)).encode()),
+        ], b'{"detail":"Rate limit exceeded"}')
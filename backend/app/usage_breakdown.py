@@ -0,0 +1,164 @@
+# app/usage_breakdown.py
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+from app.model import UsageConsumer
+from app.posthog import EVENT_CREDIT_MAPPING, POSTHOG_API_KEY, POSTHOG_PROJECT_ID, run_hogql
+from app.replay import stand_in
+
+load_dotenv()
+
+# HogQL expressions usage is attributed to, e.g. "distinct_id,properties.workflow,properties.$host"
+USAGE_BREAKDOWN_DIMENSIONS = [
+    d.strip() for d in os.getenv("USAGE_BREAKDOWN_DIMENSIONS", "distinct_id,properties.workflow").split(",") if d.strip()
+]
+# Per-event credit cost read from a property, e.g. "ai_workflow_run:credits_used";
+# events without the property (or without an entry) use the flat EVENT_CREDIT_MAPPING weight
+USAGE_CREDIT_PROPERTIES = dict(
+    pair.strip().split(":", 1) for pair in os.getenv("USAGE_CREDIT_PROPERTIES", "").split(",") if ":" in pair
+)
+# First run per dimension backfills this many days, later runs re-read the last few
+USAGE_BREAKDOWN_BACKFILL_DAYS = int(os.getenv("USAGE_BREAKDOWN_BACKFILL_DAYS", "30"))
+USAGE_BREAKDOWN_LOOKBACK_DAYS = int(os.getenv("USAGE_BREAKDOWN_LOOKBACK_DAYS", "3"))
+# Rows kept per dimension and run (heaviest first); the rest is stored as OTHER
+USAGE_BREAKDOWN_MAX_ROWS = int(os.getenv("USAGE_BREAKDOWN_MAX_ROWS", "10000"))
+
+OTHER = "(other)"
+NONE = "(none)"
+# Interpolated into HogQL, so only plain fields and property paths are allowed
+_DIMENSION = re.compile(r"^(distinct_id|person_id|event|properties\.\$?[A-Za-z0-9_]+)$")
+_PROPERTY = re.compile(r"^\$?[A-Za-z0-9_]+$")
+
+for _d in USAGE_BREAKDOWN_DIMENSIONS:
+    if not _DIMENSION.match(_d):
+        raise ValueError(f"Unsupported USAGE_BREAKDOWN_DIMENSIONS entry {_d!r}")
+for _event, _prop in USAGE_CREDIT_PROPERTIES.items():
+    if _event not in EVENT_CREDIT_MAPPING or not _PROPERTY.match(_prop):
+        raise ValueError(f"Unsupported USAGE_CREDIT_PROPERTIES entry {_event}:{_prop}")
+
+
+def _credit_expression() -> str:
+    """Credits of one event: its cost property when set and numeric, else the flat weight."""
+    branches = []
+    for event, (_, weight) in EVENT_CREDIT_MAPPING.items():
+        prop = USAGE_CREDIT_PROPERTIES.get(event)
+        cost = f"coalesce(toFloat(properties.{prop}), {weight})" if prop else str(weight)
+        branches.append(f"event = '{event}', {cost}")
+    return f"multiIf({', '.join(branches)}, 0)"
+
+
+def _fetch(dimension: str | None, days: int) -> list[list]:
+    """
+    (event, day, value, events, credits) rows, heaviest first; without a dimension,
+    per-day totals. Days are UTC days, like the `since`/`today` they are compared with.
+    """
+    events = ", ".join(f"'{event}'" for event in EVENT_CREDIT_MAPPING)
+    value = f"toString({dimension})" if dimension else "''"
+    return run_hogql(f"""
+    SELECT event, toDate(timestamp, 'UTC') AS day, {value} AS value, count() AS cnt,
+           sum({_credit_expression()}) AS credits
+    FROM events
+    WHERE event IN ({events})
+      AND timestamp >= toStartOfDay(now('UTC')) - INTERVAL {days - 1} DAY
+    GROUP BY event, day, value
+    ORDER BY credits DESC
+    LIMIT {USAGE_BREAKDOWN_MAX_ROWS}
+    """)
+
+
+def _days_to_fetch(cur, dimension: str, today: date) -> int:
+    cur.execute("SELECT MAX(date) FROM usage_breakdown_daily WHERE dimension = %s", (dimension,))
+    last = cur.fetchone()[0]
+    if last is None:
+        return USAGE_BREAKDOWN_BACKFILL_DAYS
+    # Catch up after missed runs, and always re-read the days that are still filling in
+    return min(max((today - last).days + 1, USAGE_BREAKDOWN_LOOKBACK_DAYS), USAGE_BREAKDOWN_BACKFILL_DAYS)
+
+
+def ingest_usage_breakdown(cur) -> dict[str, int]:
+    """
+    Refresh usage_breakdown_daily for every configured dimension: one HogQL query
+    per dimension over the days not settled yet, plus one for the per-day totals
+    that the OTHER rows are derived from. Returns rows written per dimension.
+    The caller commits.
+    """
+    if not USAGE_BREAKDOWN_DIMENSIONS:
+        return {}
+    if not stand_in(POSTHOG_API_KEY) or not stand_in(POSTHOG_PROJECT_ID):
+        print("[PostHog] Missing config → usage breakdown not ingested")
+        return {}
+
+    today = datetime.now(timezone.utc).date()
+    plan = {d: _days_to_fetch(cur, d, today) for d in USAGE_BREAKDOWN_DIMENSIONS}
+
+    totals: dict[tuple[str, date], list[float]] = {}
+    for event, day, _, count, credits in _fetch(None, max(plan.values())):
+        tool = EVENT_CREDIT_MAPPING[event][0]
+        total = totals.setdefault((tool, date.fromisoformat(str(day)[:10])), [0.0, 0])
+        total[0] += float(credits or 0)
+        total[1] += int(count)
+
+    written = {}
+    for dimension, days in plan.items():
+        since = today - timedelta(days=days - 1)
+        rows: dict[tuple[date, str, str], list[float]] = {}
+        for event, day, value, count, credits in _fetch(dimension, days):
+            key = (date.fromisoformat(str(day)[:10]), EVENT_CREDIT_MAPPING[event][0], (value or NONE)[:255])
+            row = rows.setdefault(key, [0.0, 0])
+            row[0] += float(credits or 0)
+            row[1] += int(count)
+
+        # Whatever the row limit cut off still counts, as OTHER
+        kept: dict[tuple[str, date], list[float]] = {}
+        for (day, tool, _), (credits, count) in rows.items():
+            k = kept.setdefault((tool, day), [0.0, 0])
+            k[0] += credits
+            k[1] += count
+        for (tool, day), (credits, count) in totals.items():
+            if day < since:
+                continue
+            k = kept.get((tool, day), [0.0, 0])
+            if count > k[1]:
+                rows[(day, tool, OTHER)] = [max(credits - k[0], 0.0), count - k[1]]
+
+        # Replace the re-read days wholesale so values that disappeared go too
+        cur.execute(
+            "DELETE FROM usage_breakdown_daily WHERE dimension = %s AND date >= %s",
+            (dimension, since),
+        )
+        cur.executemany("""
+            INSERT INTO usage_breakdown_daily (date, dimension, tool_name, value, credits, events)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, [
+            (day, dimension, tool, value, round(credits, 4), count)
+            for (day, tool, value), (credits, count) in rows.items()
+        ])
+        written[dimension] = len(rows)
+
+    print(f"[PostHog] Usage breakdown ingested: {written}")
+    return written
+
+
+def top_consumers(cur, dimension: str, days: int, limit: int, tool: str | None = None) -> tuple[float, list[UsageConsumer]]:
+    """Total credits and the `limit` heaviest values of `dimension` over the last `days` days."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    cur.execute("""
+        SELECT value, SUM(credits)::float8, SUM(events)::bigint, SUM(SUM(credits)) OVER ()::float8
+        FROM usage_breakdown_daily
+        WHERE dimension = %s AND date >= %s AND (%s::text IS NULL OR tool_name = %s)
+        GROUP BY value
+        ORDER BY 2 DESC
+        LIMIT %s
+    """, (dimension, since, tool, tool, limit))
+    rows = cur.fetchall()
+    total = rows[0][3] if rows else 0.0
+    return total, [
+        UsageConsumer(
+            value=value,
+            credits=round(credits, 2),
+            events=events,
+            share=round(credits / total, 4) if total else 0.0
+        )
+        for value, credits, events, _ in rows
+    ]
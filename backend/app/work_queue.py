@@ -0,0 +1,117 @@
+# app/work_queue.py
+import os
+import socket
+from dotenv import load_dotenv
+from psycopg.errors import UniqueViolation
+from app.model import encode_json
+
+load_dotenv()
+
+# Replicas read shared results and leave upstream fetching to `python -m app.worker`
+DISTRIBUTED_MODE = os.getenv("DISTRIBUTED_MODE", "0") == "1"
+WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "5"))
+# Retry delay = base × 2^(attempts - 1)
+WORK_QUEUE_RETRY_BASE_SECONDS = float(os.getenv("WORK_QUEUE_RETRY_BASE_SECONDS", "10"))
+# A running job whose worker has been silent this long is handed to another worker
+WORK_QUEUE_LEASE_SECONDS = float(os.getenv("WORK_QUEUE_LEASE_SECONDS", "300"))
+WORK_QUEUE_RETENTION_HOURS = float(os.getenv("WORK_QUEUE_RETENTION_HOURS", "24"))
+
+# NOTIFY channel that wakes idle workers
+QUEUE_CHANNEL = "work_queue"
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(cur, kind: str, payload: dict | None = None, dedupe_key: str | None = None,
+            priority: int = 100, delay_seconds: float = 0) -> int | None:
+    """
+    Queue a job. While a job with the same dedupe_key is still queued, further
+    enqueues are dropped (returns None), so N replicas asking for the same refresh
+    cost one upstream fetch. The caller commits; workers are woken on commit.
+    """
+    cur.execute("""
+        INSERT INTO work_queue (kind, payload, dedupe_key, priority, run_after)
+        VALUES (%s, %s::jsonb, %s, %s, now() + make_interval(secs => %s))
+        ON CONFLICT (dedupe_key) WHERE status = 'queued' DO NOTHING
+        RETURNING id
+    """, (kind, encode_json(payload or {}).decode(), dedupe_key, priority, delay_seconds))
+    row = cur.fetchone()
+    if row is not None:
+        cur.execute("SELECT pg_notify(%s, %s)", (QUEUE_CHANNEL, kind))
+    return row[0] if row else None
+
+
+def claim(cur, worker: str, kinds: list[str] | None = None) -> tuple[int, str, dict, int] | None:
+    """
+    Take the next ready job, skipping rows other workers hold, and mark it running.
+    Returns (id, kind, payload, attempts) or None. The caller commits right away,
+    so the claim is visible (and the row lock released) while the job runs.
+    """
+    cur.execute("""
+        UPDATE work_queue w
+        SET status = 'running', locked_by = %s, locked_at = now(), attempts = w.attempts + 1
+        WHERE w.id = (
+            SELECT id FROM work_queue
+            WHERE status = 'queued' AND run_after <= now()
+              AND (%s::text[] IS NULL OR kind = ANY(%s::text[]))
+            ORDER BY priority, id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING w.id, w.kind, w.payload, w.attempts
+    """, (worker, kinds, kinds))
+    return cur.fetchone()
+
+
+def complete(cur, job_id: int):
+    cur.execute(
+        "UPDATE work_queue SET status = 'done', finished_at = now(), error = NULL WHERE id = %s",
+        (job_id,),
+    )
+
+
+def fail(cur, job_id: int, error: str):
+    """Back off and requeue, unless attempts are used up or the same job is queued again already."""
+    # A replica may enqueue the same dedupe key between the NOT EXISTS check and the
+    # update; the partial unique index then rejects the requeue, which is fine
+    cur.execute("SAVEPOINT requeue")
+    try:
+        cur.execute("""
+            UPDATE work_queue w
+            SET status = 'queued', error = %s, locked_by = NULL, locked_at = NULL,
+                run_after = now() + make_interval(secs => %s * power(2, w.attempts - 1))
+            WHERE w.id = %s AND w.attempts < %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM work_queue q
+                  WHERE q.dedupe_key = w.dedupe_key AND q.status = 'queued'
+              )
+        """, (error, WORK_QUEUE_RETRY_BASE_SECONDS, job_id, WORK_QUEUE_MAX_ATTEMPTS))
+        requeued = cur.rowcount > 0
+        cur.execute("RELEASE SAVEPOINT requeue")
+    except UniqueViolation:
+        cur.execute("ROLLBACK TO SAVEPOINT requeue")
+        requeued = False
+    if not requeued:
+        cur.execute(
+            "UPDATE work_queue SET status = 'failed', error = %s, finished_at = now() WHERE id = %s",
+            (error, job_id),
+        )
+
+
+def reap(cur) -> int:
+    """Requeue jobs whose worker died mid-run and drop old finished jobs. Returns jobs requeued."""
+    cur.execute("""
+        SELECT id FROM work_queue
+        WHERE status = 'running' AND locked_at < now() - make_interval(secs => %s)
+        FOR UPDATE SKIP LOCKED
+    """, (WORK_QUEUE_LEASE_SECONDS,))
+    stale = [row[0] for row in cur.fetchall()]
+    for job_id in stale:
+        fail(cur, job_id, "lease expired")
+    cur.execute("""
+        DELETE FROM work_queue
+        WHERE status IN ('done', 'failed') AND finished_at < now() - make_interval(secs => %s)
+    """, (WORK_QUEUE_RETENTION_HOURS * 3600,))
+    return len(stale)
@@ -0,0 +1,122 @@
+# app/worker.py - queue consumer for distributed mode: python -m app.worker [--kinds dashboard,balances]
+import argparse
+import os
+import time
+import psycopg
+from dotenv import load_dotenv
+from app.anthropic_usage import ingest_anthropic_reports
+from app.balances import refresh_all_balances
+from app.dashboard import refresh_dashboard_cache
+from app.database import conninfo, get_db_connection, write_cursor
+from app.posthog import refresh_posthog_usage
+from app.shared_cache import cache_invalidate
+from app.usage_breakdown import ingest_usage_breakdown
+from app.work_queue import QUEUE_CHANNEL, claim, complete, fail, reap, worker_id
+
+load_dotenv()
+
+# Idle workers wake on NOTIFY, and at least this often to pick up delayed retries
+WORKER_IDLE_SECONDS = float(os.getenv("WORKER_IDLE_SECONDS", "5"))
+WORKER_REAP_SECONDS = float(os.getenv("WORKER_REAP_SECONDS", "60"))
+
+
+def _ingest(fn) -> dict:
+    """Run an ingestion with its own transaction, then mark every dashboard stale."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        result = fn(cur)
+        cache_invalidate(cur, "dashboard:")
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    return result
+
+
+def handle_dashboard(payload: dict) -> dict:
+    return {"refreshed": refresh_dashboard_cache(int(payload["days"]))}
+
+
+def handle_balances(payload: dict) -> dict:
+    return {"tools": _ingest(refresh_all_balances)}
+
+
+def handle_anthropic_reports(payload: dict) -> dict:
+    return {"rows": _ingest(ingest_anthropic_reports)}
+
+
+def handle_posthog_usage(payload: dict) -> dict:
+    return {"changed_days": len(_ingest(refresh_posthog_usage))}
+
+
+def handle_usage_breakdown(payload: dict) -> dict:
+    return {"rows": _ingest(ingest_usage_breakdown)}
+
+
+HANDLERS = {
+    "dashboard": handle_dashboard,
+    "balances": handle_balances,
+    "anthropic_reports": handle_anthropic_reports,
+    "posthog_usage": handle_posthog_usage,
+    "usage_breakdown": handle_usage_breakdown,
+}
+
+
+def run_next(worker: str, kinds: list[str] | None = None) -> bool:
+    """Claim and run one job. Returns False when nothing was ready."""
+    with write_cursor() as cur:
+        job = claim(cur, worker, kinds)
+    if job is None:
+        return False
+
+    job_id, kind, payload, attempts = job
+    started = time.perf_counter()
+    try:
+        result = HANDLERS[kind](payload)
+    except Exception as e:
+        print(f"[Worker] {kind} #{job_id} failed (attempt {attempts}): {e}")
+        with write_cursor() as cur:
+            fail(cur, job_id, f"{type(e).__name__}: {e}")
+        return True
+
+    with write_cursor() as cur:
+        complete(cur, job_id)
+    print(f"[Worker] {kind} #{job_id} done in {(time.perf_counter() - started) * 1000:.0f}ms: {result}")
+    return True
+
+
+def run_worker(kinds: list[str] | None = None, once: bool = False):
+    """Drain the queue, then sleep on LISTEN until the next job is queued."""
+    unknown = set(kinds or []) - HANDLERS.keys()
+    if unknown:
+        raise ValueError(f"Unknown job kinds {sorted(unknown)}")
+    worker = worker_id()
+    print(f"[Worker] {worker} consuming {', '.join(kinds or HANDLERS)}")
+
+    with psycopg.connect(conninfo(), autocommit=True) as listen:
+        listen.execute(f"LISTEN {QUEUE_CHANNEL}")
+        reaped_at = 0.0
+        while True:
+            if time.monotonic() - reaped_at >= WORKER_REAP_SECONDS:
+                with write_cursor() as cur:
+                    requeued = reap(cur)
+                if requeued:
+                    print(f"[Worker] Requeued {requeued} jobs with expired leases")
+                reaped_at = time.monotonic()
+
+            while run_next(worker, kinds):
+                pass
+            if once:
+                return
+            # Any notification means "look again"; the payload is only informative
+            for _ in listen.notifies(timeout=WORKER_IDLE_SECONDS, stop_after=1):
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Billing work queue consumer")
+    parser.add_argument("--kinds", help="Comma-separated job kinds (default: all)")
+    parser.add_argument("--once", action="store_true", help="Drain the queue and exit")
+    args = parser.parse_args()
+    run_worker(args.kinds.split(",") if args.kinds else None, args.once)
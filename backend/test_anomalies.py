@@ -0,0 +1,125 @@
+# test_anomalies.py - pending-day handling and spike scoring of the EWMA detector
+from datetime import date, timedelta
+
+from app import anomalies
+from app.anomalies import ANOMALY_WARMUP_DAYS, _step, observe_many
+
+START = date(2026, 3, 1)
+
+
+def new_state():
+    return {"mean": 0.0, "var": 0.0, "n": 0, "last_day": None, "pending_day": None, "pending_value": None}
+
+
+def warmed_up(value=100.0, days=ANOMALY_WARMUP_DAYS + 3):
+    """State after `days` days of a steady series; the last day is still pending."""
+    state = new_state()
+    for i in range(days):
+        _step(state, START + timedelta(days=i), value)
+    return state
+
+
+def test_latest_day_stays_pending_until_a_later_day_arrives():
+    state = new_state()
+    _step(state, START, 10.0)
+    assert state["n"] == 0
+    assert (state["pending_day"], state["pending_value"]) == (START, 10.0)
+
+    _step(state, START + timedelta(days=1), 20.0)
+    assert state["n"] == 1
+    assert state["mean"] == 10.0
+    assert state["last_day"] == START
+    assert (state["pending_day"], state["pending_value"]) == (START + timedelta(days=1), 20.0)
+
+
+def test_revised_pending_day_is_rescored_not_folded_twice():
+    state = warmed_up()
+    day = state["pending_day"]
+    folded = (state["mean"], state["var"], state["n"])
+
+    # The day's partial total is revised upwards into a spike, then back down
+    _step(state, day, 1000.0)
+    assert (state["mean"], state["var"], state["n"]) == folded
+    assert state["is_anomaly"]
+
+    _step(state, day, 101.0)
+    assert (state["mean"], state["var"], state["n"]) == folded
+    assert not state["is_anomaly"]
+
+    # Only the final revision is folded once the next day arrives
+    _step(state, day + timedelta(days=1), 100.0)
+    assert state["n"] == folded[2] + 1
+    assert state["mean"] == folded[0] + anomalies.ANOMALY_ALPHA * (101.0 - folded[0])
+
+
+def test_older_days_are_ignored():
+    state = warmed_up()
+    before = dict(state)
+    _step(state, state["last_day"] - timedelta(days=3), 5000.0)
+    assert state == before
+
+
+def test_only_upward_spikes_alert():
+    up = warmed_up()
+    _step(up, up["pending_day"] + timedelta(days=1), 1000.0)
+    assert up["score"] > 0 and up["is_anomaly"]
+
+    down = warmed_up()
+    _step(down, down["pending_day"] + timedelta(days=1), 0.0)
+    assert down["score"] < 0 and not down["is_anomaly"]
+
+
+def test_no_alert_during_warmup():
+    state = warmed_up(days=ANOMALY_WARMUP_DAYS)
+    _step(state, state["pending_day"] + timedelta(days=1), 1000.0)
+    assert state["n"] == ANOMALY_WARMUP_DAYS
+    assert state["score"] is not None
+
+    early = warmed_up(days=ANOMALY_WARMUP_DAYS - 1)
+    _step(early, early["pending_day"] + timedelta(days=1), 1000.0)
+    assert early["score"] is None and not early["is_anomaly"]
+
+
+def test_small_absolute_spike_does_not_alert():
+    # A z-score far past the threshold, but below ANOMALY_MIN_DELTA in absolute terms
+    state = warmed_up(value=0.5)
+    _step(state, state["pending_day"] + timedelta(days=1), 0.5 + anomalies.ANOMALY_MIN_DELTA / 2)
+    assert state["score"] >= anomalies.ANOMALY_Z_THRESHOLD
+    assert not state["is_anomaly"]
+
+
+class FakeCursor:
+    """Holds anomaly_state rows in memory for observe_many's read and upsert."""
+
+    def __init__(self):
+        self.rows = {}
+        self._result = []
+
+    def execute(self, sql, params):
+        series = params[0]
+        self._result = [(s, *self.rows[s][:6]) for s in series if s in self.rows]
+
+    def fetchall(self):
+        return self._result
+
+    def executemany(self, sql, rows):
+        for series, *values in rows:
+            self.rows[series] = values
+
+
+def test_observe_many_persists_state_between_batches():
+    cur = FakeCursor()
+    for i in range(ANOMALY_WARMUP_DAYS + 3):
+        assert observe_many(cur, [("aws:EC2", START + timedelta(days=i), 100.0)]) == []
+    spike_day = START + timedelta(days=ANOMALY_WARMUP_DAYS + 3)
+
+    # Out-of-order points in one batch are applied in day order
+    flagged = observe_many(cur, [
+        ("aws:EC2", spike_day, 900.0),
+        ("aws:EC2", spike_day - timedelta(days=1), 100.0),
+        ("aws:S3", spike_day, 3.0),
+    ])
+    assert flagged == ["aws:EC2"]
+    mean, var, n, last_day, pending_day, pending_value, score, is_anomaly = cur.rows["aws:EC2"]
+    assert (n, last_day, pending_day, pending_value) == (ANOMALY_WARMUP_DAYS + 3, spike_day - timedelta(days=1), spike_day, 900.0)
+    assert is_anomaly and mean == 100.0
@@ -0,0 +1,144 @@
+# test_anthropic_usage.py - Anthropic report ingestion against a local stand-in server
+import json
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app import anthropic_usage
+
+ADMIN_KEY = "sk-ant-admin-test"
+
+# Two daily buckets, served one per page so pagination is exercised
+USAGE_PAGES = [
+    {
+        "data": [{
+            "starting_at": "2026-03-01T00:00:00Z",
+            "ending_at": "2026-03-02T00:00:00Z",
+            "results": [
+                {
+                    "model": "claude-sonnet-4", "workspace_id": None,
+                    "uncached_input_tokens": 1000,
+                    "cache_creation": {"ephemeral_5m_input_tokens": 200, "ephemeral_1h_input_tokens": 50},
+                    "cache_read_input_tokens": 300, "output_tokens": 400,
+                },
+                {
+                    "model": "claude-haiku-4", "workspace_id": "wrkspc_1",
+                    "uncached_input_tokens": 10, "cache_creation": None,
+                    "cache_read_input_tokens": 0, "output_tokens": 5,
+                },
+            ],
+        }],
+        "has_more": True,
+        "next_page": "page_2",
+    },
+    {
+        "data": [{
+            "starting_at": "2026-03-02T00:00:00Z",
+            "ending_at": "2026-03-03T00:00:00Z",
+            "results": [{
+                "model": "claude-sonnet-4", "workspace_id": None,
+                "uncached_input_tokens": 7, "cache_creation": {},
+                "cache_read_input_tokens": 0, "output_tokens": 3,
+            }],
+        }],
+        "has_more": False,
+        "next_page": None,
+    },
+]
+
+COST_PAGE = {
+    "data": [{
+        "starting_at": "2026-03-01T00:00:00Z",
+        "ending_at": "2026-03-02T00:00:00Z",
+        "results": [
+            {"currency": "USD", "amount": "1234.5", "workspace_id": None,
+             "description": "Claude Sonnet 4 Usage - Input Tokens", "model": "claude-sonnet-4"},
+            {"currency": "USD", "amount": "100", "workspace_id": None,
+             "description": "Claude Sonnet 4 Usage - Output Tokens", "model": "claude-sonnet-4"},
+        ],
+    }],
+    "has_more": False,
+    "next_page": None,
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        StandInHandler.requests_seen.append((url.path, query, dict(self.headers)))
+
+        if self.headers.get("x-api-key") != ADMIN_KEY:
+            self.send_response(401)
+            self.end_headers()
+            return
+
+        if url.path == "/v1/organizations/usage_report/messages":
+            body = USAGE_PAGES[1] if query.get("page") == ["page_2"] else USAGE_PAGES[0]
+        elif url.path == "/v1/organizations/cost_report":
+            body = COST_PAGE
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def standin():
+    server = HTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    original = anthropic_usage.ANTHROPIC_API_BASE
+    anthropic_usage.ANTHROPIC_API_BASE = f"http://127.0.0.1:{server.server_port}"
+    yield StandInHandler
+    anthropic_usage.ANTHROPIC_API_BASE = original
+    server.shutdown()
+
+
+def test_usage_report_follows_pages_and_sums_tokens(standin):
+    standin.requests_seen.clear()
+    rows = anthropic_usage.fetch_usage_report(ADMIN_KEY, date(2026, 3, 1), date(2026, 3, 3))
+
+    assert len(standin.requests_seen) == 2
+    path, query, headers = standin.requests_seen[0]
+    assert query["group_by[]"] == ["model", "workspace_id"]
+    assert query["bucket_width"] == ["1d"]
+    assert query["starting_at"] == ["2026-03-01T00:00:00Z"]
+    assert headers["anthropic-version"] == "2023-06-01"
+
+    by_key = {(r["date"], r["model"], r["workspace_id"]): r for r in rows}
+    sonnet = by_key[(date(2026, 3, 1), "claude-sonnet-4", "")]
+    assert sonnet["uncached_input_tokens"] == 1000
+    assert sonnet["cache_creation_input_tokens"] == 250
+    assert sonnet["cache_read_input_tokens"] == 300
+    assert sonnet["output_tokens"] == 400
+    assert by_key[(date(2026, 3, 1), "claude-haiku-4", "wrkspc_1")]["cache_creation_input_tokens"] == 0
+    assert by_key[(date(2026, 3, 2), "claude-sonnet-4", "")]["output_tokens"] == 3
+
+
+def test_cost_report_converts_cents_to_usd(standin):
+    rows = anthropic_usage.fetch_cost_report(ADMIN_KEY, date(2026, 3, 1), date(2026, 3, 2))
+
+    assert len(rows) == 2
+    assert sum(r["cost_usd"] for r in rows) == pytest.approx(13.345)
+    assert {r["model"] for r in rows} == {"claude-sonnet-4"}
+
+
+def test_bad_admin_key_raises(standin):
+    with pytest.raises(Exception):
+        anthropic_usage.fetch_cost_report("sk-ant-admin-wrong", date(2026, 3, 1), date(2026, 3, 2))
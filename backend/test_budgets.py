@@ -0,0 +1,111 @@
+# test_budgets.py - status, pacing and projection of evaluate_budgets
+from datetime import date
+
+import pytest
+
+from app.budgets import BUDGET_PACE_MIN_DAYS, DEFAULT_WARN_PERCENT, evaluate_budgets
+
+# 30-day month: day 15 is exactly half of it
+MID_MONTH = date(2026, 6, 15)
+EARLY = date(2026, 6, BUDGET_PACE_MIN_DAYS - 1)
+
+
+class FakeCursor:
+    """Answers evaluate_budgets' aggregate query with prepared rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    def execute(self, sql, params):
+        self.params = params
+
+    def fetchall(self):
+        return self.rows
+
+
+def budget(spent, amount=1000.0, scope="account", target="", warn_percent=DEFAULT_WARN_PERCENT, budget_id=1):
+    """One row as the query returns it: id, name, scope, target, amount, warn_percent, spent."""
+    return (budget_id, f"{scope} budget", scope, target, amount, warn_percent, spent)
+
+
+def status_of(row, today=MID_MONTH):
+    [status] = evaluate_budgets(FakeCursor([row]), today)
+    return status
+
+
+@pytest.mark.parametrize("spent, expected", [
+    (400.0, "ok"),          # on track to 800
+    (1000.0, "exceeded"),
+    (1500.0, "exceeded"),
+    (510.0, "over_pace"),   # projects to 1020
+])
+def test_status_mid_month(spent, expected):
+    assert status_of(budget(spent)).status == expected
+
+
+def test_warning_only_when_not_over_pace():
+    # Past the warn percent but projecting under the budget: only possible late in the month
+    late = date(2026, 6, 30)
+    status = status_of(budget(950.0), today=late)
+    assert status.status == "warning"
+    assert status.percent_used == 95.0
+
+    # Early in the month the projection is not trusted, so the warn percent decides
+    assert status_of(budget(950.0), today=EARLY).status == "warning"
+
+
+def test_over_pace_takes_precedence_over_warning():
+    assert status_of(budget(910.0), today=date(2026, 6, 20)).status == "over_pace"
+
+
+def test_no_pace_status_before_min_days():
+    # 200 in the first days projects to 1500, but that is too little to go on
+    status = status_of(budget(200.0), today=EARLY)
+    assert status.projected_month_end > 1000.0
+    assert status.status == "ok"
+
+    # Crossing the budget itself is reported from day one
+    assert status_of(budget(1000.0), today=EARLY).status == "exceeded"
+
+
+def test_zero_amount_reports_spend_only():
+    status = status_of(budget(250.0, amount=0.0))
+    assert status.status == "ok"
+    assert status.percent_used == 0.0
+    assert status.pace == 0.0
+    assert status.spent == 250.0
+    assert status.projected_month_end == 500.0
+
+
+def test_pacing_fields():
+    status = status_of(budget(600.0))
+    assert status.expected_to_date == 500.0
+    assert status.pace == 1.2
+    assert status.projected_month_end == 1200.0
+    assert status.percent_used == 60.0
+
+
+def test_custom_warn_percent():
+    assert status_of(budget(300.0, warn_percent=25.0), today=date(2026, 6, 30)).status == "warning"
+
+
+def test_tag_and_tool_scopes():
+    rows = [
+        budget(1200.0, scope="account", budget_id=None),
+        budget(90.0, amount=500.0, scope="tag", target="team=growth", budget_id=2),
+        budget(4000.0, amount=3000.0, scope="tool", target="Tavily", budget_id=3),
+    ]
+    account, tag, tool = evaluate_budgets(FakeCursor(rows), MID_MONTH)
+
+    assert (account.id, account.status, account.unit) == (None, "exceeded", "USD")
+    assert (tag.target, tag.status, tag.unit) == ("team=growth", "ok", "USD")
+    # Tool budgets are in credits
+    assert (tool.target, tool.status, tool.unit) == ("Tavily", "exceeded", "credits")
+
+
+def test_query_covers_the_calendar_month():
+    cur = FakeCursor([])
+    assert evaluate_budgets(cur, MID_MONTH) == []
+    assert cur.params["month"] == date(2026, 6, 1)
+    assert cur.params["next"] == date(2026, 7, 1)
@@ -0,0 +1,111 @@
+# test_snapshots.py - dashboard snapshot deltas replay to the state they were computed for
+import copy
+
+import msgspec
+
+from app.model import Alert, AwsSummary, DashboardSnapshot, DateRange, ServiceSpend, Severity, Status, ToolBalance
+from app.snapshots import _alert_key, apply_delta, compute_delta, snapshot_state, state_snapshot
+
+
+def tool(name, credits, status=Status.SAFE):
+    return ToolBalance(
+        name=name, credits_remaining=credits, percent_remaining=50.0,
+        daily_avg_usage=10.0, predicted_exhaustion=None, status=status,
+    )
+
+
+CRITICAL = Alert(severity=Severity.CRITICAL, message="Tavily credits below 10%", affected="Tavily")
+WARNING = Alert(severity=Severity.WARNING, message="AWS spend is over pace", affected="AWS")
+
+BASE = snapshot_state(DashboardSnapshot(
+    tools=[tool("FullEnrich", 5000.0), tool("Tavily", 900.0)],
+    aws=AwsSummary(
+        monthly_spend=1200.0, monthly_budget=12000.0, percent_used=0.3,
+        services=[ServiceSpend(service="Amazon EC2", amount=800.0), ServiceSpend(service="Amazon RDS", amount=400.0)],
+        filtered_days=30, month_to_date=40.0,
+    ),
+    alerts=[CRITICAL, WARNING],
+    alert_count=2,
+    last_updated="2026-03-01T10:00:00",
+    filtered_days=30,
+    date_range=DateRange(from_="2026-01-31", to="2026-03-01"),
+))
+
+
+def round_trip(old, new):
+    before = copy.deepcopy(old)
+    delta = compute_delta(old, new)
+    assert apply_delta(old, delta) == new
+    # apply_delta returns a new state and leaves its input alone
+    assert old == before
+    return delta
+
+
+def test_unchanged_state_has_empty_delta():
+    assert round_trip(BASE, copy.deepcopy(BASE)) == {}
+
+
+def test_changed_and_added_entries():
+    new = copy.deepcopy(BASE)
+    new["tools"]["Tavily"]["credits_remaining"] = 850.0
+    new["tools"]["Anthropic"] = msgspec.to_builtins(tool("Anthropic", 42350.0))
+    new["services"]["AWS Lambda"] = 12.5
+    new["aws"]["month_to_date"] = 55.0
+
+    delta = round_trip(BASE, new)
+    assert set(delta["tools"]["set"]) == {"Tavily", "Anthropic"}
+    assert delta["aws"] == {"set": {"month_to_date": 55.0}, "del": []}
+    assert "alerts" not in delta
+
+
+def test_removed_tools_services_and_alerts():
+    new = copy.deepcopy(BASE)
+    del new["tools"]["FullEnrich"]
+    del new["services"]["Amazon RDS"]
+    del new["alerts"][_alert_key(CRITICAL)]
+
+    delta = round_trip(BASE, new)
+    assert delta["tools"]["del"] == ["FullEnrich"]
+    assert delta["services"]["del"] == ["Amazon RDS"]
+    assert delta["alerts"]["del"] == [_alert_key(CRITICAL)]
+
+
+def test_section_emptied():
+    new = copy.deepcopy(BASE)
+    new["alerts"] = {}
+    new["services"] = {}
+    round_trip(BASE, new)
+
+
+def test_keyframe_missing_a_section():
+    # Keyframes written before a section existed do not have it
+    keyframe = copy.deepcopy(BASE)
+    del keyframe["services"]
+    del keyframe["alerts"]
+
+    delta = round_trip(keyframe, BASE)
+    assert delta["services"] == {"set": BASE["services"], "del": []}
+
+    # The old keyframe alone still rebuilds, with the section empty
+    snapshot = state_snapshot(keyframe)
+    assert snapshot.aws.services == []
+    assert snapshot.alerts == [] and snapshot.alert_count == 0
+
+
+def test_state_round_trips_through_the_payload():
+    assert snapshot_state(state_snapshot(BASE)) == BASE
+
+
+def test_chain_of_deltas_replays_to_the_last_state():
+    states = [copy.deepcopy(BASE)]
+    for credits in (800.0, 700.0, 600.0):
+        state = copy.deepcopy(states[-1])
+        state["tools"]["Tavily"]["credits_remaining"] = credits
+        state["services"].pop("Amazon RDS", None)
+        state["services"][f"S3 {credits:.0f}"] = credits / 100
+        states.append(state)
+
+    replayed = states[0]
+    for old, new in zip(states, states[1:]):
+        replayed = apply_delta(replayed, compute_delta(old, new))
+    assert replayed == states[-1]
@@ -0,0 +1,142 @@
+# test_throttle.py - rate limiting and request coalescing in ThrottleMiddleware
+import asyncio
+
+from app import throttle
+from app.throttle import MemoryRateLimiter, ThrottleMiddleware
+
+
+class CountingApp:
+    """Stand-in ASGI app that answers after a short pause and counts its calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": f"call {self.calls}".encode()})
+
+
+def http_scope(path="/dashboard", query=b"", headers=(), client=("10.0.0.1", 1234), method="GET"):
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": list(headers),
+        "client": client,
+    }
+
+
+async def request(app, scope) -> dict:
+    """Run one request through `app`; returns status, headers and body."""
+    response = {"headers": {}, "body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message.get("headers", []))
+        else:
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response
+
+
+def test_concurrent_identical_gets_share_one_call():
+    inner = CountingApp()
+    app = ThrottleMiddleware(inner)
+
+    async def run():
+        # Same query in a different parameter order is the same request
+        return await asyncio.gather(
+            request(app, http_scope(query=b"days=30&refresh=0")),
+            request(app, http_scope(query=b"refresh=0&days=30")),
+            request(app, http_scope(query=b"days=30&refresh=0")),
+        )
+
+    responses = asyncio.run(run())
+    assert inner.calls == 1
+    assert [r["status"] for r in responses] == [200, 200, 200]
+    assert {r["body"] for r in responses} == {b"call 1"}
+
+
+def test_different_queries_are_not_coalesced():
+    inner = CountingApp()
+    app = ThrottleMiddleware(inner)
+
+    async def run():
+        return await asyncio.gather(
+            request(app, http_scope(query=b"days=30")),
+            request(app, http_scope(query=b"days=7")),
+        )
+
+    asyncio.run(run())
+    assert inner.calls == 2
+
+
+def test_profiled_request_skips_coalescing():
+    inner = CountingApp()
+    app = ThrottleMiddleware(inner)
+
+    async def run():
+        return await asyncio.gather(
+            request(app, http_scope()),
+            request(app, http_scope(query=b"profile=1")),
+            request(app, http_scope(headers=[(b"x-profile", b"1")])),
+        )
+
+    asyncio.run(run())
+    assert inner.calls == 3
+
+
+def test_trusted_proxy_hops_picks_the_proxy_seen_address(monkeypatch):
+    # Client-supplied entries come first; each trusted proxy appends its peer
+    headers = [(b"x-forwarded-for", b"6.6.6.6, 203.0.113.7"), (b"x-forwarded-for", b"10.0.0.2")]
+    scope = http_scope(headers=headers, client=("10.0.0.3", 1234))
+
+    monkeypatch.setattr(throttle, "TRUSTED_PROXY_HOPS", 0)
+    assert throttle.client_key(scope) == "10.0.0.3"
+
+    monkeypatch.setattr(throttle, "TRUSTED_PROXY_HOPS", 1)
+    assert throttle.client_key(scope) == "10.0.0.2"
+
+    monkeypatch.setattr(throttle, "TRUSTED_PROXY_HOPS", 2)
+    assert throttle.client_key(scope) == "203.0.113.7"
+
+    # Fewer hops than trusted proxies: the header cannot be trusted at all
+    monkeypatch.setattr(throttle, "TRUSTED_PROXY_HOPS", 4)
+    assert throttle.client_key(scope) == "10.0.0.3"
+
+
+def test_empty_bucket_returns_429_with_retry_after():
+    inner = CountingApp()
+    # 6/minute = one token every 10 seconds, two in the bucket
+    app = ThrottleMiddleware(inner, limiter=MemoryRateLimiter(per_minute=6, burst=2))
+
+    async def run():
+        return [await request(app, http_scope(query=f"n={i}".encode())) for i in range(3)]
+
+    first, second, third = asyncio.run(run())
+    assert (first["status"], second["status"]) == (200, 200)
+    assert third["status"] == 429
+    assert third["headers"][b"retry-after"] == b"10"
+    assert inner.calls == 2
+
+    # Another client has its own bucket
+    other = asyncio.run(request(app, http_scope(client=("10.0.0.9", 1234))))
+    assert other["status"] == 200
+
+
+def test_unlisted_paths_are_not_throttled():
+    inner = CountingApp()
+    app = ThrottleMiddleware(inner, limiter=MemoryRateLimiter(per_minute=6, burst=1))
+
+    async def run():
+        return [await request(app, http_scope(path="/health")) for _ in range(3)]
+
+    assert [r["status"] for r in asyncio.run(run())] == [200, 200, 200]
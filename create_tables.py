@@ -43,6 +43,287 @@ CREATE TABLE IF NOT EXISTS aws_spend (
     service VARCHAR(50),
     amount NUMERIC
 );
+
+-- Day/week/month rollups, refreshed per touched bucket by the ingestion jobs (app/rollups.py)
+CREATE TABLE IF NOT EXISTS aws_spend_rollup (
+    period VARCHAR(5) NOT NULL,
+    period_start DATE NOT NULL,
+    service VARCHAR(50) NOT NULL,
+    amount NUMERIC NOT NULL,
+    PRIMARY KEY (period, period_start, service)
+);
+
+CREATE TABLE IF NOT EXISTS usage_rollup (
+    period VARCHAR(5) NOT NULL,
+    period_start DATE NOT NULL,
+    tool_name VARCHAR(50) NOT NULL,
+    credits_consumed NUMERIC NOT NULL,
+    events_count BIGINT NOT NULL,
+    PRIMARY KEY (period, period_start, tool_name)
+);
+
+-- Vendor balance time series and adaptive poll schedule (app/balances.py)
+CREATE TABLE IF NOT EXISTS balance_observations (
+    tool_name VARCHAR(50) NOT NULL,
+    observed_at TIMESTAMPTZ NOT NULL,
+    credits_remaining NUMERIC NOT NULL,
+    -- Set when the key set changed: the step from the previous row is not consumption
+    rebaseline BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (tool_name, observed_at)
+);
+ALTER TABLE balance_observations ADD COLUMN IF NOT EXISTS rebaseline BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE IF NOT EXISTS balance_poll_state (
+    tool_name VARCHAR(50) PRIMARY KEY,
+    last_credits NUMERIC NOT NULL,
+    burn_rate_per_day NUMERIC,
+    last_polled_at TIMESTAMPTZ NOT NULL,
+    next_poll_at TIMESTAMPTZ NOT NULL
+);
+
+-- Latest balance of every configured vendor key (app/collector.py)
+CREATE TABLE IF NOT EXISTS provider_key_balances (
+    provider VARCHAR(20) NOT NULL,
+    key_id VARCHAR(100) NOT NULL,
+    team VARCHAR(100) NOT NULL,
+    credits_remaining NUMERIC,
+    error TEXT,
+    fetched_at TIMESTAMPTZ,
+    duration_ms FLOAT,
+    PRIMARY KEY (provider, key_id)
+);
+
+-- Anthropic Admin API usage / cost reports, one row per day (app/anthropic_usage.py)
+CREATE TABLE IF NOT EXISTS anthropic_usage_daily (
+    key_id VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    workspace_id VARCHAR(100) NOT NULL,
+    uncached_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_creation_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_read_input_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (key_id, date, model, workspace_id)
+);
+
+CREATE TABLE IF NOT EXISTS anthropic_cost_daily (
+    key_id VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    workspace_id VARCHAR(100) NOT NULL,
+    description TEXT NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    cost_usd NUMERIC NOT NULL,
+    PRIMARY KEY (key_id, date, workspace_id, description)
+);
+CREATE INDEX IF NOT EXISTS anthropic_cost_daily_date_idx ON anthropic_cost_daily (date);
+
+-- Per-client request token buckets (app/throttle.py, RATE_LIMIT_BACKEND=postgres)
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    client_key VARCHAR(255) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rate_limit_buckets_updated_idx ON rate_limit_buckets (updated_at);
+
+-- Dashboard history: periodic keyframes plus deltas, zlib-compressed JSON (app/snapshots.py)
+CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+    id BIGSERIAL PRIMARY KEY,
+    days INTEGER NOT NULL,
+    captured_at TIMESTAMPTZ NOT NULL,
+    is_keyframe BOOLEAN NOT NULL,
+    keyframe_id BIGINT NOT NULL,
+    payload BYTEA NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dashboard_snapshots_time_idx ON dashboard_snapshots (days, captured_at);
+
+-- Streaming anomaly detector: EWMA mean/variance per series, latest day pending (app/anomalies.py)
+CREATE TABLE IF NOT EXISTS anomaly_state (
+    series VARCHAR(255) PRIMARY KEY,
+    mean DOUBLE PRECISION NOT NULL,
+    var DOUBLE PRECISION NOT NULL,
+    n INTEGER NOT NULL,
+    last_day DATE,
+    pending_day DATE,
+    pending_value DOUBLE PRECISION,
+    score DOUBLE PRECISION,
+    is_anomaly BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS anomaly_state_flagged_idx ON anomaly_state (pending_day) WHERE is_anomaly;
+
+-- Hourly job runs and per-stage outcomes/checkpoints (app/jobs.py)
+CREATE TABLE IF NOT EXISTS job_runs (
+    id BIGSERIAL PRIMARY KEY,
+    job VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    started_at TIMESTAMPTZ NOT NULL,
+    finished_at TIMESTAMPTZ,
+    duration_ms DOUBLE PRECISION,
+    attempts INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS job_runs_job_idx ON job_runs (job, id);
+
+CREATE TABLE IF NOT EXISTS job_stage_runs (
+    run_id BIGINT NOT NULL REFERENCES job_runs (id) ON DELETE CASCADE,
+    stage VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    duration_ms DOUBLE PRECISION,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result JSONB,
+    checkpoint JSONB,
+    PRIMARY KEY (run_id, stage)
+);
+
+-- Monthly budgets per account, AWS service, cost allocation tag or tool (app/budgets.py)
+CREATE TABLE IF NOT EXISTS budgets (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    scope VARCHAR(10) NOT NULL CHECK (scope IN ('account', 'service', 'tag', 'tool')),
+    target VARCHAR(255) NOT NULL DEFAULT '',
+    monthly_amount NUMERIC(12, 2) NOT NULL,
+    warn_percent DOUBLE PRECISION NOT NULL DEFAULT 90,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    UNIQUE (scope, target)
+);
+
+-- Daily AWS spend per tag value, for the tag keys that have budgets
+CREATE TABLE IF NOT EXISTS aws_tag_spend (
+    date DATE NOT NULL,
+    tag_key VARCHAR(128) NOT NULL,
+    tag_value VARCHAR(256) NOT NULL,
+    amount NUMERIC(12, 4) NOT NULL,
+    PRIMARY KEY (tag_key, tag_value, date)
+);
+
+-- Distributed mode: refresh jobs consumed by `python -m app.worker` (app/work_queue.py)
+CREATE TABLE IF NOT EXISTS work_queue (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    dedupe_key VARCHAR(255),
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',  -- queued | running | done | failed
+    priority SMALLINT NOT NULL DEFAULT 100,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    locked_by VARCHAR(100),
+    locked_at TIMESTAMPTZ,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ
+);
+-- At most one queued job per dedupe key (a running one may have started before new data)
+CREATE UNIQUE INDEX IF NOT EXISTS work_queue_dedupe ON work_queue (dedupe_key) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS work_queue_ready ON work_queue (priority, id) WHERE status = 'queued';
+
+-- Results computed by workers, read by every API replica (app/shared_cache.py)
+CREATE TABLE IF NOT EXISTS shared_cache (
+    key VARCHAR(255) PRIMARY KEY,
+    value BYTEA NOT NULL,
+    version BIGINT NOT NULL DEFAULT 1,
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+-- Daily PostHog credits per tool and breakdown value, e.g. per distinct_id (app/usage_breakdown.py)
+CREATE TABLE IF NOT EXISTS usage_breakdown_daily (
+    date DATE NOT NULL,
+    dimension VARCHAR(100) NOT NULL,
+    tool_name VARCHAR(50) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    credits NUMERIC NOT NULL,
+    events BIGINT NOT NULL,
+    PRIMARY KEY (dimension, date, tool_name, value)
+);
+
+-- Cost Explorer query planner cache (app/cost_query.py)
+CREATE TABLE IF NOT EXISTS aws_cost_queries (
+    query_key VARCHAR(40) PRIMARY KEY,
+    filter_key VARCHAR(40) NOT NULL,
+    group_by JSONB NOT NULL,
+    filter JSONB
+);
+CREATE INDEX IF NOT EXISTS aws_cost_queries_filter_idx ON aws_cost_queries (filter_key);
+
+CREATE TABLE IF NOT EXISTS aws_cost_cache (
+    query_key VARCHAR(40) NOT NULL,
+    day DATE NOT NULL,
+    group_keys TEXT[] NOT NULL,
+    amount NUMERIC NOT NULL,
+    PRIMARY KEY (query_key, day, group_keys)
+);
+
+CREATE TABLE IF NOT EXISTS aws_cost_coverage (
+    query_key VARCHAR(40) NOT NULL,
+    day DATE NOT NULL,
+    fetched_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (query_key, day)
+);
+
+CREATE TABLE IF NOT EXISTS aws_cost_forecast_cache (
+    forecast_key VARCHAR(40) PRIMARY KEY,
+    fetched_at TIMESTAMPTZ NOT NULL,
+    payload JSONB NOT NULL
+);
+""")
+
+# One-off data migrations, each applied once and recorded in schema_migrations
+cur.execute("""
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    name VARCHAR(100) PRIMARY KEY,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+""")
+
+
+def migrate(name: str, sql: str):
+    cur.execute("INSERT INTO schema_migrations (name) VALUES (%s) ON CONFLICT DO NOTHING", (name,))
+    if cur.rowcount:
+        cur.execute(sql)
+        print(f"Applied migration {name}")
+
+
+# aws_spend used to hold a 30-day MONTHLY total per service, filed under the run date.
+# Rollups, budgets and the simulator sum it as DAILY spend, so the old rows are dropped
+# together with everything derived from them; the next hourly run refetches
+# AWS_SPEND_LOOKBACK_DAYS of daily spend (run it once with a larger value for more history).
+migrate("aws_spend_daily", """
+DELETE FROM aws_spend;
+DELETE FROM aws_spend_rollup;
+DELETE FROM anomaly_state WHERE series LIKE 'aws:%';
+""")
+
+# The old Lambda also added a usage_history row per run; keep the latest one per (tool, day)
+migrate("usage_history_dedupe", """
+DELETE FROM usage_history h
+USING usage_history newer
+WHERE newer.tool_name = h.tool_name
+  AND newer.date = h.date
+  AND newer.id > h.id;
+""")
+
+# Only possible once the migrations above removed the duplicates; the upserts rely on them
+cur.execute("""
+CREATE UNIQUE INDEX IF NOT EXISTS aws_spend_date_service_idx ON aws_spend (date, service);
+CREATE UNIQUE INDEX IF NOT EXISTS usage_history_tool_date_idx ON usage_history (tool_name, date);
+""")
+
+# Rollups are only refreshed for days ingestion touches; build them once for existing history
+migrate("usage_rollup_backfill", """
+INSERT INTO usage_rollup (period, period_start, tool_name, credits_consumed, events_count)
+SELECT p.period,
+       CASE p.period WHEN 'day' THEN h.date ELSE date_trunc(p.period, h.date)::date END,
+       h.tool_name, SUM(COALESCE(h.credits_consumed, 0)), SUM(COALESCE(h.events_count, 0))
+FROM usage_history h
+CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS p (period)
+WHERE h.date IS NOT NULL AND h.tool_name IS NOT NULL
+GROUP BY 1, 2, 3
+ON CONFLICT (period, period_start, tool_name) DO UPDATE SET
+    credits_consumed = EXCLUDED.credits_consumed,
+    events_count = EXCLUDED.events_count;
 """)
 
 # Save changes to database